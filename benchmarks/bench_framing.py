@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Decode throughput of the RPC framings by payload size.
+
+    python benchmarks/bench_framing.py [--json]
+
+``legacy`` replays the old ``recv(1024)`` + ``buffer += data`` loop,
+``delimiter`` and ``length`` use ``backend_server.framing.FrameReader``
+receiving into its own buffer the way the asyncio server does.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lua" / "aider-ui"))
+
+from backend_server.framing import (  # noqa: E402
+    END_OF_MESSAGE,
+    FRAMING_DELIMITER,
+    FRAMING_LENGTH,
+    RECV_BUFFER_SIZE,
+    FrameReader,
+    encode_frame,
+)
+
+PAYLOAD_SIZES = [1 << 10, 16 << 10, 256 << 10, 1 << 20, 4 << 20]
+LEGACY_RECV_SIZE = 1024
+MIN_BENCH_BYTES = 32 << 20
+
+
+def make_payload(size: int) -> bytes:
+    line = json.dumps({"fname": "a.py", "message": "x" * 60}) + ","
+    data = ("[" + line * (size // len(line) + 1))[: size - 1] + "]"
+    return data.encode()
+
+
+def legacy_decode(stream: bytes) -> int:
+    frames = 0
+    buffer = b""
+    for pos in range(0, len(stream), LEGACY_RECV_SIZE):
+        buffer += stream[pos : pos + LEGACY_RECV_SIZE]
+        if END_OF_MESSAGE in buffer:
+            _, buffer = buffer.split(END_OF_MESSAGE, 1)
+            frames += 1
+    return frames
+
+
+def reader_decode(stream: bytes, framing: str) -> int:
+    frames = 0
+    reader = FrameReader(framing)
+    view = memoryview(stream)
+    pos = 0
+    while pos < len(stream):
+        buf = reader.get_buffer(-1)
+        n = min(len(buf), RECV_BUFFER_SIZE, len(stream) - pos)
+        buf[:n] = view[pos : pos + n]
+        buf.release()
+        reader.buffer_updated(n)
+        pos += n
+        frames += len(reader.frames())
+    return frames
+
+
+def bench(size: int, mode: str, max_legacy_size: int):
+    if mode == "legacy" and size > max_legacy_size:
+        return None
+    payload = make_payload(size)
+    count = max(MIN_BENCH_BYTES // size, 2)
+    if mode == "legacy":
+        count = max(min(count, (8 << 20) // size), 1)
+    framing = FRAMING_LENGTH if mode == "length" else FRAMING_DELIMITER
+    stream = b"".join(b"".join(encode_frame(payload, framing)) for _ in range(count))
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        frames = legacy_decode(stream)
+    else:
+        frames = reader_decode(stream, framing)
+    elapsed = time.perf_counter() - start
+    assert frames == count, (mode, frames, count)
+    return {
+        "bench": "framing_decode",
+        "mode": mode,
+        "payload_bytes": size,
+        "messages": count,
+        "seconds": round(elapsed, 6),
+        "mb_per_s": round(len(stream) / elapsed / (1 << 20), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    parser.add_argument(
+        "--max-legacy-size",
+        type=int,
+        default=1 << 20,
+        help="skip the quadratic legacy decoder above this payload size",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for size in PAYLOAD_SIZES:
+        for mode in ("legacy", FRAMING_DELIMITER, FRAMING_LENGTH):
+            res = bench(size, mode, args.max_legacy_size)
+            if res is not None:
+                results.append(res)
+                if args.json:
+                    print(json.dumps(res), flush=True)
+                else:
+                    print(
+                        f"{res['payload_bytes']:>10} B  {res['mode']:<10}"
+                        f"{res['mb_per_s']:>10.2f} MB/s",
+                        flush=True,
+                    )
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+# -*- coding: utf-8 -*-
+"""
+Backend benchmarks with a fake Coder, offline and without an LLM.
+
+    python benchmarks/bench_server.py [--json] [--quick] [--only NAME ...]
+
+The real SocketServer and CoderServerHandler run in this process, requests
+go over TCP through benchmarks/rpc_client.py. aider has to be importable
+(the handler imports it), nothing calls a model. With --json every result
+is a JSON line, the first one describes the environment, so runs can be
+diffed across versions.
+
+Benchmarks:
+    rpc_latency     round trip of small requests, sequential and pipelined
+    notify          notifications per second through the notify long poll
+    output_push     output lines per second pushed to a subscriber
+    command         fake /code command, edits -> cmd_complete notification
+    snapshot        SnapshotStore.put_file vs copying into a temp dir
+    diff            diff_engine vs difflib change summary, by file size
+    history         output/chat/input history endpoints by history size
+"""
+import argparse
+import difflib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "lua" / "aider-ui"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# keep the benchmark snapshots out of the user cache
+WORK_DIR = tempfile.mkdtemp(prefix="aider-ui-bench-")
+os.environ.setdefault("AIDER_UI_SNAPSHOT_DIR", os.path.join(WORK_DIR, "snapshots"))
+
+from backend_server.checkpoint import load_checkpoint  # noqa: E402
+from backend_server.coder_server_handler import CoderServerHandler  # noqa: E402
+from backend_server.consts import NotifyType  # noqa: E402
+from backend_server.diff_engine import diff_files  # noqa: E402
+from backend_server.encoding import msgpack  # noqa: E402
+from backend_server.listener import setup_listeners  # noqa: E402
+from backend_server.metrics import metrics  # noqa: E402
+from backend_server.server import SocketServer  # noqa: E402
+from backend_server.snapshot_store import SnapshotStore  # noqa: E402
+from backend_server.store import store  # noqa: E402
+from fake_coder import FakeCoder, FakeIO, make_source  # noqa: E402
+from prompt_toolkit.history import FileHistory  # noqa: E402
+from rpc_client import RpcClient  # noqa: E402
+
+ALL_BENCHES = (
+    "rpc_latency",
+    "transport",
+    "notify",
+    "output_push",
+    "command",
+    "snapshot",
+    "diff",
+    "history",
+    "output_search",
+    "encoding",
+    "checkpoint",
+)
+
+
+def percentiles(samples, scale=1e6):
+    samples = sorted(samples)
+    n = len(samples)
+
+    def at(q):
+        return round(samples[min(int(q * n), n - 1)] * scale, 1)
+
+    return {
+        "p50_us": at(0.5),
+        "p90_us": at(0.9),
+        "p99_us": at(0.99),
+        "mean_us": round(statistics.fmean(samples) * scale, 1),
+    }
+
+
+def wait_for(predicate, timeout=60.0, interval=0.0005):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark condition not reached")
+        time.sleep(interval)
+
+
+class Bench:
+    def __init__(self, quick: bool):
+        self.quick = quick
+        self.project = Path(WORK_DIR) / "project"
+        self.project.mkdir()
+        self.io = FakeIO(input_history_file=str(Path(WORK_DIR) / "input.history"))
+        store.coder = FakeCoder(str(self.project), self.io)  # type: ignore[assignment]
+        self.server = SocketServer("127.0.0.1", unix_socket=True)
+        threading.Thread(target=self.server.start, daemon=True).start()
+        self.client = RpcClient("127.0.0.1", self.server.port)
+
+    def close(self):
+        self.client.close()
+
+    def n(self, full: int, quick: int) -> int:
+        return quick if self.quick else full
+
+    def bench_rpc_latency(self):
+        count = self.n(5000, 500)
+        for method in ("list_files", "get_coder_info", "get_announcements"):
+            for _ in range(50):
+                self.client.call(method)
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                self.client.call(method)
+                samples.append(time.perf_counter() - start)
+            yield {"bench": "rpc_latency", "method": method, "calls": count} | (
+                percentiles(samples)
+            )
+
+        for depth in (8, 64):
+            rounds = max(count // depth, 1)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                self.client.call_many([("list_files", None)] * depth)
+            elapsed = time.perf_counter() - start
+            yield {
+                "bench": "rpc_pipelined",
+                "method": "list_files",
+                "in_flight": depth,
+                "calls": rounds * depth,
+                "calls_per_s": round(rounds * depth / elapsed, 1),
+            }
+
+    def bench_transport(self):
+        """
+        tcp against the unix domain socket: connect + first call, round trips
+        """
+        if self.server.unix_path is None:
+            return
+        count = self.n(5000, 500)
+        transports = (
+            ("tcp", {"port": self.server.port}),
+            ("unix", {"port": 0, "path": self.server.unix_path}),
+        )
+        for transport, kwargs in transports:
+            connect = []
+            for _ in range(self.n(50, 10)):
+                start = time.perf_counter()
+                client = RpcClient("127.0.0.1", **kwargs)
+                client.call("get_coder_info")
+                connect.append(time.perf_counter() - start)
+                client.close()
+            client = RpcClient("127.0.0.1", **kwargs)
+            for _ in range(50):
+                client.call("list_files")
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                client.call("list_files")
+                samples.append(time.perf_counter() - start)
+            client.close()
+            yield {
+                "bench": "transport",
+                "transport": transport,
+                "calls": count,
+                "connect_call_p50_us": percentiles(connect)["p50_us"],
+            } | percentiles(samples)
+
+    def _drain_notifications(self):
+        while not store.notification_queue.empty():
+            store.notification_queue.get_nowait()
+
+    def bench_notify(self):
+        count = self.n(20000, 2000)
+        for batch in (False, True):
+            self._drain_notifications()
+            received = 0
+            done = threading.Event()
+
+            def poll(batch=batch, done=done):
+                nonlocal received
+                while received < count:
+                    res = self.client.call("notify", {"batch": batch})
+                    received += len(res) if batch else 1
+                done.set()
+
+            poller = threading.Thread(target=poll, daemon=True)
+            poller.start()
+            start = time.perf_counter()
+            for i in range(count):
+                store.add_notify_message({"type": NotifyType.NOTIFY, "message": str(i)})
+            done.wait(120)
+            elapsed = time.perf_counter() - start
+            yield {
+                "bench": "notify",
+                "batch": batch,
+                "notifications": count,
+                "per_s": round(count / elapsed, 1),
+            }
+
+    def bench_output_push(self):
+        count = self.n(50000, 5000)
+        received = 0
+
+        def on_output(params):
+            nonlocal received
+            received += 1
+
+        self.client.on_notification("output", on_output)
+        self.client.call("subscribe_output", {"since": len(store.output_history)})
+        start = time.perf_counter()
+        for i in range(count):
+            self.io.tool_output(f"output line {i} " + "x" * 60)
+        wait_for(lambda: received >= count)
+        elapsed = time.perf_counter() - start
+        self.client.call("unsubscribe_output")
+        yield {
+            "bench": "output_push",
+            "lines": count,
+            "lines_per_s": round(count / elapsed, 1),
+        }
+
+    def bench_command(self):
+        coder: FakeCoder = store.coder  # type: ignore[assignment]
+        for files, lines in ((1, 200), (5, 2000), (20, 5000)):
+            if self.quick and files > 5:
+                continue
+            coder.abs_fnames.clear()
+            for i in range(files):
+                path = self.project / f"cmd_{files}_{i}.py"
+                path.write_text(make_source(lines, seed=i))
+                coder.abs_fnames.add(str(path))
+            self._drain_notifications()
+            start = time.perf_counter()
+            output_idx = CoderServerHandler.handle_cmd_start("/code bench")
+            coder.run_one("/code bench")
+            CoderServerHandler.handle_cmd_complete("/code bench", output_idx)
+            complete = None
+            while complete is None:
+                for item in self.client.call("notify", {"batch": True}):
+                    if item["type"] == NotifyType.CMD_COMPLETE:
+                        complete = item
+            elapsed = time.perf_counter() - start
+            yield {
+                "bench": "command",
+                "files": files,
+                "lines_per_file": lines,
+                "modified": len(complete["modified_info"]),
+                "seconds": round(elapsed, 4),
+            }
+
+    def bench_snapshot(self):
+        snapshots = SnapshotStore(os.path.join(WORK_DIR, "bench-snapshots"))
+        for size in (1 << 10, 64 << 10, 1 << 20, 8 << 20):
+            if self.quick and size > 1 << 20:
+                continue
+            path = self.project / f"snapshot_{size}.bin"
+            rounds = max(min((64 << 20) // size, 200), 5)
+            base = os.urandom(size - 8)
+
+            def put_changed(i, path=path, base=base):
+                path.write_bytes(base + i.to_bytes(8, "little"))
+                start = time.perf_counter()
+                snapshots.put_file(str(path))
+                return time.perf_counter() - start
+
+            def put_same(i, path=path):
+                start = time.perf_counter()
+                snapshots.put_file(str(path))
+                return time.perf_counter() - start
+
+            def legacy_copy(i, path=path):
+                # the copy_files_to_dir approach: a fresh temp dir per command
+                start = time.perf_counter()
+                tmp_dir = tempfile.mkdtemp(dir=WORK_DIR)
+                shutil.copy2(path, tmp_dir)
+                elapsed = time.perf_counter() - start
+                shutil.rmtree(tmp_dir)
+                return elapsed
+
+            for mode, func in (
+                ("put_new", put_changed),
+                ("put_duplicate", put_same),
+                ("legacy_copy", legacy_copy),
+            ):
+                samples = [func(i) for i in range(rounds)]
+                yield {"bench": "snapshot", "mode": mode, "bytes": size} | (
+                    percentiles(samples)
+                )
+
+    def bench_diff(self):
+        for lines in (100, 1000, 10000, 50000):
+            if self.quick and lines > 10000:
+                continue
+            before = self.project / f"diff_{lines}_a.py"
+            after = self.project / f"diff_{lines}_b.py"
+            before.write_text(make_source(lines))
+            after.write_text(
+                FakeCoder(str(self.project), self.io, change_ratio=0.01).edit(
+                    before.read_text()
+                )
+            )
+            rounds = max(min(200_000 // lines, 50), 3)
+
+            def engine(before=before, after=after):
+                start = time.perf_counter()
+                diff_files(str(before), str(after))
+                return time.perf_counter() - start
+
+            def legacy(before=before, after=after):
+                # the difflib change summary computed before diff_engine
+                start = time.perf_counter()
+                a = before.read_text().splitlines()
+                b = after.read_text().splitlines()
+                added = removed = 0
+                for line in difflib.unified_diff(a, b, lineterm=""):
+                    if line.startswith("+") and not line.startswith("+++"):
+                        added += 1
+                    elif line.startswith("-") and not line.startswith("---"):
+                        removed += 1
+                return time.perf_counter() - start
+
+            for mode, func in (("diff_engine", engine), ("difflib", legacy)):
+                samples = [func() for _ in range(rounds)]
+                yield {"bench": "diff", "mode": mode, "lines": lines} | (
+                    percentiles(samples)
+                )
+
+    def bench_history(self):
+        sizes = (1000, 10000, 100000) if self.quick else (1000, 10000, 100000, 1000000)
+        history_file = FileHistory(self.io.input_history_file)
+        input_entries = 0
+        for size in sizes:
+            while len(store.output_history) < size:
+                store.output_history.extend(
+                    [f"output {i} " + "y" * 60 for i in range(10000)][
+                        : size - len(store.output_history)
+                    ]
+                )
+            while len(store.chat_history) < min(size, 100000):
+                store.add_chat_line(f"chat {len(store.chat_history)}")
+            while input_entries < min(size, 100000):
+                for row in ("{", f"/code entry {input_entries}", "more", "}"):
+                    history_file.store_string(row)
+                input_entries += 1
+
+            rounds = 50
+            chat_lines = len(store.chat_history)
+            cases = (
+                (
+                    "output_tail_100",
+                    "get_output_history",
+                    {"start_index": size - 100, "end_index": size},
+                ),
+                (
+                    "output_head_100",
+                    "get_output_history",
+                    {"start_index": 0, "end_index": 100},
+                ),
+                ("chat_full", "chat_history", {}),
+                ("chat_since_tail_100", "chat_history", {"since": chat_lines - 100}),
+                ("chat_search_one", "search_chat_history", {"query": "chat 500"}),
+                ("chat_search_all_50", "search_chat_history", {"query": "chat"}),
+                ("input_history_page", "get_history", {"limit": 50}),
+            )
+            for name, method, params in cases:
+                start = time.perf_counter()
+                self.client.call(method, params)
+                first = time.perf_counter() - start
+                samples = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    self.client.call(method, params)
+                    samples.append(time.perf_counter() - start)
+                yield {
+                    "bench": "history",
+                    "case": name,
+                    "output_lines": size,
+                    "chat_lines": len(store.chat_history),
+                    "input_entries": input_entries,
+                    "first_call_us": round(first * 1e6, 1),
+                } | percentiles(samples)
+
+    def bench_output_search(self):
+        """
+        search_output over the whole history and one command's output,
+        first batch and total time
+        """
+        lines = self.n(1000000, 100000)
+        while len(store.output_history) < lines:
+            store.output_history.append(
+                f"output {len(store.output_history)} " + "y" * 60
+            )
+        command_start = len(store.output_history)
+        store.command_ranges.start("/bench", command_start)
+        for i in range(1000):
+            store.output_history.append(f"lint error E{i % 10} in file_{i}.py")
+        store.command_ranges.complete(len(store.output_history))
+        command_id = store.command_ranges.list()[-1].id
+        first_batch = None
+        start = 0.0
+
+        def on_batch(params):
+            nonlocal first_batch
+            if first_batch is None:
+                first_batch = time.perf_counter() - start
+
+        self.client.on_notification("output_search", on_batch)
+        cases = (
+            ("literal_rare", {"query": "output 4242 "}),
+            ("literal_limit_100", {"query": "output", "limit": 100}),
+            ("regex_whole", {"query": r"E[0-4] in file_\d+", "regex": True}),
+            (
+                "regex_command",
+                {"query": r"E[0-4] in file_\d+", "regex": True, "command": command_id},
+            ),
+        )
+        for name, params in cases:
+            samples, firsts = [], []
+            for _ in range(self.n(10, 3)):
+                first_batch = None
+                start = time.perf_counter()
+                res = self.client.call("search_output", params)
+                samples.append(time.perf_counter() - start)
+                firsts.append(first_batch or samples[-1])
+            yield {
+                "bench": "output_search",
+                "case": name,
+                "output_lines": len(store.output_history),
+                "matched": res["matched"],
+                "first_batch_p50_us": percentiles(firsts)["p50_us"],
+            } | percentiles(samples)
+
+    def bench_encoding(self):
+        """
+        Large responses per negotiated encoding and compression: latency and
+        bytes on the wire
+        """
+        lines = self.n(100000, 20000)
+        while len(store.output_history) < lines:
+            store.output_history.append(
+                f"output {len(store.output_history)} " + "y" * 60
+            )
+        while len(store.chat_history) < lines:
+            store.add_chat_line(f"#### chat {len(store.chat_history)} " + "z" * 40)
+        encodings = ("json", "msgpack") if msgpack is not None else ("json",)
+        cases = (
+            (
+                "output_full",
+                "get_output_history",
+                {"start_index": 0, "end_index": lines},
+            ),
+            ("chat_full", "chat_history", {}),
+        )
+        for encoding in encodings:
+            for compression in ("none", "zlib"):
+                client = RpcClient(
+                    "127.0.0.1",
+                    self.server.port,
+                    encoding=encoding,
+                    compression=compression,
+                )
+                for name, method, params in cases:
+                    before = metrics.bytes_out
+                    client.call(method, params)
+                    wire_bytes = metrics.bytes_out - before
+                    samples = []
+                    for _ in range(self.n(30, 10)):
+                        start = time.perf_counter()
+                        client.call(method, params)
+                        samples.append(time.perf_counter() - start)
+                    yield {
+                        "bench": "encoding",
+                        "case": name,
+                        "encoding": encoding,
+                        "compression": compression,
+                        "lines": lines,
+                        "wire_bytes": wire_bytes,
+                    } | percentiles(samples)
+                client.close()
+
+    def bench_checkpoint(self):
+        """
+        Write a checkpoint over rpc and load it from the mmap, by history
+        size
+        """
+        path = str(Path(WORK_DIR) / "session.ckpt")
+        for lines in (10000, 100000) if self.quick else (10000, 100000, 1000000):
+            while len(store.output_history) < lines:
+                store.output_history.append(
+                    f"output {len(store.output_history)} " + "y" * 60
+                )
+            while len(store.chat_history) < lines // 10:
+                store.add_chat_line(f"#### chat {len(store.chat_history)} " + "z" * 40)
+            write_samples, load_samples = [], []
+            for _ in range(self.n(10, 3)):
+                start = time.perf_counter()
+                res = self.client.call("checkpoint", {"path": path})
+                write_samples.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                loaded = load_checkpoint(path, store.history_dir)
+                load_samples.append(time.perf_counter() - start)
+                loaded.output_history.close()
+                loaded.chat_history.close()
+            yield {
+                "bench": "checkpoint",
+                "output_lines": len(store.output_history),
+                "chat_lines": len(store.chat_history),
+                "bytes": res["bytes"],
+                "write_p50_us": percentiles(write_samples)["p50_us"],
+                "load_p50_us": percentiles(load_samples)["p50_us"],
+            }
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.run(
+            ["git", "-C", str(ROOT), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "bench": "environment",
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def format_result(res: dict) -> str:
+    return "  ".join(f"{key}={value}" for key, value in res.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument(
+        "--only", nargs="+", choices=ALL_BENCHES, help="benchmarks to run"
+    )
+    args = parser.parse_args()
+
+    def emit(res: dict):
+        results.append(res)
+        print(json.dumps(res) if args.json else format_result(res), flush=True)
+
+    setup_listeners(io_cls=FakeIO)
+    results = []
+    emit(environment())
+    bench = Bench(args.quick)
+    try:
+        for name in args.only or ALL_BENCHES:
+            for res in getattr(bench, f"bench_{name}")():
+                emit(res)
+    finally:
+        bench.close()
+        store.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
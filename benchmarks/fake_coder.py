@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Offline stand-ins for aider's Coder and InputOutput.
+
+FakeIO has the InputOutput methods aider-ui listens to and is patched with
+``setup_listeners(io_cls=FakeIO)``. FakeCoder.run_one produces synthetic
+output lines, chat history, confirm prompts and file writes instead of
+calling an LLM.
+"""
+import os
+import random
+from pathlib import Path
+from typing import List, Optional
+
+
+class FakeIO:
+    def __init__(self, input_history_file: Optional[str] = None):
+        self.yes = False
+        self.encoding = "utf-8"
+        self.input_history_file = input_history_file
+
+    def tool_output(self, *messages, log_only=False, bold=False):
+        pass
+
+    def tool_error(self, message="", strip=True):
+        pass
+
+    def tool_warning(self, message="", strip=True):
+        pass
+
+    def user_input(self, inp, log_only=True):
+        pass
+
+    def confirm_ask(
+        self,
+        question,
+        default="y",
+        subject=None,
+        explicit_yes_required=False,
+        group=None,
+        allow_never=False,
+    ):
+        return True
+
+    def write_text(self, filename, content, max_retries=5, initial_delay=0.1):
+        with open(filename, "w", encoding=self.encoding) as f:
+            f.write(content)
+
+    def read_text(self, filename, silent=False):
+        try:
+            with open(filename, encoding=self.encoding) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def append_chat_history(self, text, linebreak=False, blockquote=False, strip=True):
+        pass
+
+
+class FakeModel:
+    name = "fake/model"
+
+    def __str__(self):
+        return self.name
+
+    def token_count(self, text: str) -> int:
+        return len(text) // 4
+
+
+class FakeCommands:
+    def __init__(self, coder: "FakeCoder"):
+        self.coder = coder
+
+    def _paths(self, args: str) -> List[str]:
+        return [self.coder.abs_root_path(path) for path in args.split()]
+
+    def cmd_add(self, args: str):
+        self.coder.abs_fnames.update(self._paths(args))
+
+    def cmd_read_only(self, args: str):
+        self.coder.abs_read_only_fnames.update(self._paths(args))
+
+    def cmd_drop(self, args: str):
+        for path in self._paths(args):
+            self.coder.abs_fnames.discard(path)
+            self.coder.abs_read_only_fnames.discard(path)
+
+    def cmd_clear(self, args):
+        pass
+
+    def cmd_reset(self, args):
+        self.coder.abs_fnames.clear()
+        self.coder.abs_read_only_fnames.clear()
+
+
+class FakeCoder:
+    """
+    run_one writes ``output_lines`` output lines and edits ``change_ratio``
+    of the lines of every file in chat
+    """
+
+    def __init__(
+        self,
+        root: str,
+        io: FakeIO,
+        output_lines: int = 200,
+        change_ratio: float = 0.02,
+        confirms: int = 1,
+        seed: int = 0,
+    ):
+        self.root = root
+        self.io = io
+        self.main_model = FakeModel()
+        self.edit_format = "diff"
+        self.abs_fnames = set()
+        self.abs_read_only_fnames = set()
+        self.done_messages = []
+        self.cur_messages = []
+        self.commands = FakeCommands(self)
+        self.output_lines = output_lines
+        self.change_ratio = change_ratio
+        self.confirms = confirms
+        self.random = random.Random(seed)
+
+    def abs_root_path(self, path: str) -> str:
+        return str((Path(self.root) / path).resolve())
+
+    def get_rel_fname(self, fname: str) -> str:
+        return os.path.relpath(fname, self.root)
+
+    def get_inchat_relative_files(self) -> List[str]:
+        return sorted(self.get_rel_fname(fname) for fname in self.abs_fnames)
+
+    def get_announcements(self) -> List[str]:
+        return [f"Model: {self.main_model}", f"Git repo: {self.root}"]
+
+    def run_one(self, user_message: str, preproc: bool = True):
+        for i in range(self.output_lines):
+            self.io.tool_output(f"{user_message[:20]} output line {i} " + "x" * 40)
+        self.io.append_chat_history(f"#### {user_message}", linebreak=True)
+        for _ in range(self.confirms):
+            self.io.confirm_ask("Apply edits?", subject="bench")
+        for fname in sorted(self.abs_fnames):
+            self.io.write_text(fname, self.edit(self.io.read_text(fname) or ""))
+        self.io.append_chat_history("done", blockquote=True)
+
+    def edit(self, content: str) -> str:
+        lines = content.splitlines()
+        for _ in range(max(int(len(lines) * self.change_ratio), 1)):
+            i = self.random.randrange(len(lines) + 1)
+            lines.insert(i, f"edited_{self.random.randrange(1 << 30)} = {i}")
+        return "\n".join(lines) + "\n"
+
+
+def make_source(lines: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(lines):
+        if i % 20 == 0:
+            out.append(f"def func_{i}(a, b):")
+        else:
+            out.append(f"    value_{i} = a * {rnd.randrange(1000)} + b  # line {i}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Blocking JSON-RPC client for the benchmarks, speaks the same protocol as
+lua/aider-ui/rpc.lua: negotiate the framing, then multiplex requests by id
+and collect pushed notifications.
+"""
+import json
+import socket
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from backend_server.encoding import COMPRESSION_NONE, ENCODING_JSON, decode
+from backend_server.framing import (
+    FRAMING_DELIMITER,
+    FRAMING_LENGTH,
+    FrameReader,
+    encode_frame,
+)
+
+RECV_SIZE = 256 * 1024
+
+
+class RpcError(Exception):
+    pass
+
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.response: Optional[dict] = None
+
+
+class RpcClient:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        framing: str = FRAMING_LENGTH,
+        path: Optional[str] = None,
+        encoding: str = ENCODING_JSON,
+        compression: str = COMPRESSION_NONE,
+    ):
+        # path: the server's unix domain socket, used instead of host/port
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.framing = FRAMING_DELIMITER
+        self.reader = FrameReader(FRAMING_DELIMITER)
+        self._next_id = 0
+        self._pending: Dict[int, _Pending] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.notification_handlers: Dict[str, Callable[[Any], None]] = {}
+        self._negotiate_id: Optional[int] = None
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+        self.negotiated: dict = {}
+        if framing != FRAMING_DELIMITER:
+            params = {
+                "framing": framing,
+                "encoding": encoding,
+                "compression": compression,
+            }
+            self.negotiated = self.call("negotiate", params, negotiate=True)
+            self.framing = self.negotiated["framing"]
+
+    def on_notification(self, method: str, handler: Callable[[Any], None]):
+        self.notification_handlers[method] = handler
+
+    def send(self, method: str, params: Any = None, negotiate=False) -> _Pending:
+        with self._lock:
+            self._next_id += 1
+            msg_id = self._next_id
+            pending = self._pending[msg_id] = _Pending()
+            if negotiate:
+                self._negotiate_id = msg_id
+        payload = json.dumps(
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": msg_id}
+        ).encode()
+        with self._send_lock:
+            self.sock.sendall(b"".join(encode_frame(payload, self.framing)))
+        return pending
+
+    @staticmethod
+    def wait(pending: _Pending, timeout: Optional[float] = 60) -> Any:
+        if not pending.event.wait(timeout):
+            raise RpcError("timeout")
+        response = pending.response or {}
+        if response.get("error"):
+            raise RpcError(response["error"])
+        return response.get("result")
+
+    def call(self, method: str, params: Any = None, negotiate=False, timeout=60) -> Any:
+        return self.wait(self.send(method, params, negotiate), timeout)
+
+    def call_many(self, requests: List[tuple], timeout=60) -> List[Any]:
+        """
+        Send all (method, params) before waiting for the first response
+        """
+        pendings = [self.send(method, params) for method, params in requests]
+        return [self.wait(pending, timeout) for pending in pendings]
+
+    def _read_loop(self):
+        while True:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                self._fail_all()
+                return
+            self.reader.feed(data)
+            while (frame := self.reader.next_frame()) is not None:
+                self._dispatch(decode(*frame))
+
+    def _dispatch(self, message: dict):
+        msg_id = message.get("id")
+        if msg_id is None:
+            handler = self.notification_handlers.get(message.get("method"))
+            if handler:
+                handler(message.get("params"))
+            return
+        if msg_id == self._negotiate_id:
+            # everything after the negotiate reply uses the new framing
+            self.reader.set_framing(message["result"]["framing"])
+        with self._lock:
+            pending = self._pending.pop(msg_id, None)
+        if pending:
+            pending.response = message
+            pending.event.set()
+
+    def _fail_all(self):
+        with self._lock:
+            pendings, self._pending = list(self._pending.values()), {}
+        for pending in pendings:
+            pending.response = {"error": {"code": -32000, "message": "disconnected"}}
+            pending.event.set()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
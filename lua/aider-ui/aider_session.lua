@@ -2,6 +2,8 @@ local rpc = require("aider-ui.rpc")
 local utils = require("aider-ui.utils")
 local configs = require("aider-ui.config").options
 local events = require("aider-ui.events")
+local standby = require("aider-ui.standby")
+local host = require("aider-ui.host")
 
 ---@alias handle_res fun(res: table)
 ---@class ConfirmInfo
@@ -15,16 +17,28 @@ local events = require("aider-ui.events")
 ---@field name string
 ---@field job_id number
 ---@field port number
+---@field socket_path string|nil unix domain socket of the server, see rpc.transport
+---@field host_session integer|nil host mode: the session id in the shared host process
+---@field client Client|nil
 ---@field dir string|nil
 ---@field watch_files boolean
 ---@field on_started function|nil
----@field modify_history {path: string, abs_path: string, before_path: string, after_path: string, diff_summary: {added: integer, removed: integer}}[]
+---@field modify_history {path: string, abs_path: string, before_blob: string?, before_path: string?, after_blob: string?, after_path: string?, diff_summary: {added: integer, removed: integer}}[]
 ---@field bufnr number
 ---@field confirm_info ConfirmInfo|nil
 ---@field processing boolean
 ---@field need_confirm boolean
 ---@field last_file_content_bufnr number|nil
 ---@field last_info_content_bufnr number|nil
+---@field output_lines table<integer, string> pushed output lines by sequence number
+---@field output_first_seq integer oldest cached output sequence number
+---@field output_seq integer last received output sequence number
+---@field output_subscribed boolean
+---@field response_cache table<string, table> last versioned result by rpc method
+---@field chat_lines string[] chat history received so far, only newer lines are fetched
+---@field output_searches table<integer, fun(matches: table[])> running search_output by search_id
+---@field last_search_id integer
+---@field startup_timing {total: number|nil, phases: table<string, {start: number, duration: number, count: integer}>}|nil
 local Session = {}
 
 local function common_on_response(res, method, params)
@@ -48,10 +62,10 @@ local function create(session_name, bufnr, opts)
 
   local python_path = configs.python_path
   local server_path = utils.dir_path .. "aider_server.py"
-  local cmd_args = {
+  local cmd_args = vim.list_extend({
     python_path,
     server_path,
-  }
+  }, rpc.server_args())
   local aider_cmd_args
   if type(configs.aider_cmd_args) == "function" then
     aider_cmd_args = configs.aider_cmd_args(watch_files)
@@ -67,6 +81,7 @@ local function create(session_name, bufnr, opts)
   local cmd = table.concat(cmd_args, " ")
   local s = {
     port = nil,
+    socket_path = nil,
     bufnr = bufnr,
     name = session_name,
     confirm_info = nil,
@@ -79,53 +94,137 @@ local function create(session_name, bufnr, opts)
     dir = cwd or ".",
     watch_files = watch_files,
     exited = false,
+    client = nil,
+    output_lines = {},
+    output_first_seq = 0,
+    output_seq = -1,
+    output_subscribed = false,
+    response_cache = {},
+    chat_lines = {},
+    output_searches = {},
+    last_search_id = 0,
   }
   local linsten_process = function()
     local client = s:get_client()
-    client:connect(function(res)
-      if res.result ~= nil then
-        pcall(function(result)
-          s:handle_notify(result)
-        end, res.result)
-      end
-      if s.exited then
-        return
-      end
-      client:send("notify", {})
+    client:on_notification("output", function(params)
+      s:handle_output(params)
     end)
-    client:send("notify", {})
-  end
-  s.job_id = vim.api.nvim_buf_call(bufnr, function()
-    local term_opts = {
-      bufnr = bufnr,
-      on_stdout = function(job_id, data, event)
-        if s.port ~= nil or data == nil then
-          if s.processing then
-            events.GetOutput:emit({ job_id = job_id })
-          end
+    -- (re)subscribe on every connection, resuming after the last line received
+    client:on_ready(function()
+      client:request("subscribe_output", { since = s.output_seq + 1 }, function(res)
+        s.output_subscribed = res.error == nil or res.error == vim.NIL
+      end)
+    end)
+    local notify_params = vim.tbl_extend("force", { batch = true }, configs.notify_batch or {})
+    local function poll_notify()
+      client:request("notify", notify_params, function(res)
+        if client:is_connection_error(res) then
+          s.output_subscribed = false
           return
         end
-        for _, line in pairs(data) do
-          local port_match = line:match("Aider server port: (%d+)")
-          if port_match then
-            s.port = tonumber(port_match)
-            linsten_process()
+        if type(res.result) == "table" then
+          for _, item in ipairs(res.result) do
+            pcall(function(result)
+              s:handle_notify(result)
+            end, item)
           end
         end
-      end,
-      cwd = cwd,
-      on_exit = on_exit,
-      term = true,
-    }
-    return vim.fn.jobstart(cmd, term_opts)
-  end)
+        if s.exited then
+          return
+        end
+        poll_notify()
+      end)
+    end
+    poll_notify()
+  end
+  local on_stdout = function(job_id, data, event)
+    if s.port ~= nil or data == nil then
+      if s.processing then
+        events.GetOutput:emit({ job_id = job_id })
+      end
+      return
+    end
+    for _, line in pairs(data) do
+      s.socket_path = rpc.match_socket_path(line) or s.socket_path
+      local port_match = line:match("Aider server port: (%d+)")
+      if port_match then
+        s.port = tonumber(port_match)
+        linsten_process()
+      end
+    end
+  end
+
+  local server = not configs.host_mode and standby.take() or nil
+  if configs.host_mode then
+    -- the host imported aider once, the terminal only relays to the session's pty.
+    -- The terminal starts now, the sessions manager keys sessions by job id, and
+    -- learns the terminal port from port_file once the host opened the session
+    local host_cwd = vim.fn.fnamemodify(cwd or vim.fn.getcwd(), ":p")
+    local port_file = vim.fn.tempname()
+    s.job_id = vim.api.nvim_buf_call(bufnr, function()
+      return vim.fn.jobstart({
+        python_path,
+        utils.dir_path .. "attach_client.py",
+        "--port-file",
+        port_file,
+      }, { term = true, on_stdout = on_stdout, on_exit = on_exit })
+    end)
+    host.open_session(host_cwd, aider_cmd_args, function(h, info)
+      -- renamed into place, attach_client never reads a partial port
+      local port = info and tostring(info.terminal_port) or ""
+      vim.fn.writefile({ port }, port_file .. ".tmp")
+      vim.loop.fs_rename(port_file .. ".tmp", port_file)
+      if h == nil or info == nil then
+        return
+      end
+      s.port = h.port
+      s.socket_path = h.socket_path
+      s.host_session = info.session
+      linsten_process()
+    end)
+  elseif server ~= nil then
+    -- the standby server already imported aider, hand it the session cwd and args
+    vim.api.nvim_buf_delete(bufnr, { force = true })
+    s.bufnr = server.bufnr
+    s.job_id = server.job_id
+    s.port = server.port
+    s.socket_path = server.socket_path
+    server.handlers.on_stdout = on_stdout
+    server.handlers.on_exit = on_exit
+    s:get_client():request("activate", {
+      cwd = vim.fn.fnamemodify(cwd or vim.fn.getcwd(), ":p"),
+      args = aider_cmd_args,
+    }, function(res)
+      if res.error and res.error ~= vim.NIL then
+        utils.err("Aider activate failed: " .. vim.inspect(res.error))
+      end
+    end)
+    linsten_process()
+  else
+    s.job_id = vim.api.nvim_buf_call(bufnr, function()
+      local term_opts = {
+        bufnr = bufnr,
+        on_stdout = on_stdout,
+        cwd = cwd,
+        on_exit = on_exit,
+        term = true,
+      }
+      return vim.fn.jobstart(cmd, term_opts)
+    end)
+  end
   setmetatable(s, { __index = Session })
   return s
 end
 
 ---@return Client
 function Session:get_client()
-  return rpc.create_client("127.0.0.1", self.port)
+  if self.client == nil then
+    self.client = rpc.create_client("127.0.0.1", self.port, {
+      session = self.host_session,
+      path = self.socket_path,
+    })
+  end
+  return self.client
 end
 
 ---@param cmd string
@@ -142,24 +241,29 @@ end
 ---@param on_response? handle_res
 function Session:exit(on_response)
   local client = self:get_client()
-  client:connect(function(res)
-    if res.error and res.error ~= nil then
+  client:request("exit", {}, function(res)
+    -- the server exits before replying, a dropped connection means success
+    if res.error and res.error ~= nil and not client:is_connection_error(res) then
       utils.err(vim.inspect(res.error))
     else
       utils.info("Aider Exit")
     end
+    client:close()
     if on_response then
       on_response(res.result)
     end
   end)
-  client:send("exit", {})
 end
 
 ---@param res table
 function Session:handle_notify(res)
   if res.type == "aider_start" then
     self.processing = false
+    self.startup_timing = res.startup
     utils.info(res.message)
+    if (configs.checkpoint or {}).enabled then
+      self:resume_checkpoint()
+    end
     if self.on_started ~= nil then
       self.on_started()
     end
@@ -195,6 +299,8 @@ function Session:handle_notify(res)
       end
       utils.reload_buffers(files)
     end
+  elseif res.type == "fix_progress" then
+    utils.info(res.message, "Aider Fix Diagnostics")
   elseif res.type == "aider_exit" then
     self.processing = false
     self.need_confirm = false
@@ -204,6 +310,27 @@ function Session:handle_notify(res)
   end
 end
 
+---@param params {seq: integer, line: string}
+function Session:handle_output(params)
+  local seq = params.seq
+  if seq <= self.output_seq then
+    return
+  end
+  if seq ~= self.output_seq + 1 then
+    -- missed lines, restart the cache from here
+    self.output_lines = {}
+    self.output_first_seq = seq
+  end
+  self.output_lines[seq] = params.line
+  self.output_seq = seq
+  local max_lines = configs.output_cache_lines or 10000
+  while self.output_seq - self.output_first_seq + 1 > max_lines do
+    self.output_lines[self.output_first_seq] = nil
+    self.output_first_seq = self.output_first_seq + 1
+  end
+  events.Output:emit({ session = self, seq = seq, line = params.line })
+end
+
 ---@param content string
 function Session:ask(content)
   self:send_cmd("{\n" .. "/ask " .. content .. "\n}")
@@ -226,26 +353,22 @@ end
 
 ---@param on_response? handle_res
 function Session:clear(on_response)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("clear", {}, function(res, method, params)
     common_on_response(res, method, params)
     if on_response ~= nil then
       on_response(res.result)
     end
   end)
-  client:send("clear", {})
 end
 
 ---@param on_response? handle_res
 function Session:reset(on_response)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("reset", {}, function(res, method, params)
     common_on_response(res, method, params)
     if on_response ~= nil then
       on_response(res.result)
     end
   end)
-  client:send("reset", {})
 end
 
 local get_all_buffers = function()
@@ -289,77 +412,84 @@ function Session:sync_open_buffers()
   end
 end
 
+--- request a result carrying a version, the server replies not_modified
+--- while the cached version is current and the cached result is reused
+---@param method string
 ---@param callback? handle_res
-function Session:list_files(callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+function Session:versioned_request(method, callback)
+  local cached = self.response_cache[method]
+  local params = cached and { if_none_match = cached.version } or {}
+  self:get_client():request(method, params, function(res)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), method .. " error (Aider)")
-    else
-      if callback ~= nil then
-        callback(res.result)
+      return
+    end
+    local result = res.result
+    if type(result) == "table" then
+      if result.not_modified and cached then
+        result = cached
+      elseif result.version ~= nil then
+        self.response_cache[method] = result
       end
     end
+    if callback ~= nil then
+      callback(result)
+    end
   end)
-  client:send("list_files", {})
+end
+
+---@param callback? handle_res
+function Session:list_files(callback)
+  self:versioned_request("list_files", callback)
 end
 
 ---@param file_paths string[]
 ---@param on_res? handle_res
 function Session:add_files(file_paths, on_res)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("add_files", file_paths, function(res, method, params)
     common_on_response(res, method, params)
     if on_res ~= nil then
       on_res(res.result)
     end
   end)
-  client:send("add_files", file_paths)
 end
 
 ---@param file_paths string[]
 ---@param on_res? handle_res
 function Session:read_files(file_paths, on_res)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("read_files", file_paths, function(res, method, params)
     common_on_response(res, method, params)
     if on_res ~= nil then
       on_res(res.result)
     end
   end)
-  client:send("read_files", file_paths)
 end
 
 ---@param file_paths string[]
 ---@param on_res? handle_res
 function Session:drop_files(file_paths, on_res)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("drop", file_paths, function(res, method, params)
     common_on_response(res, method, params)
     if on_res ~= nil then
       on_res(res.result)
     end
   end)
-  client:send("drop", file_paths)
 end
 
 ---@param file_paths string[]
 ---@param on_res? handle_res
 function Session:exchange_files(file_paths, on_res)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("exchange_files", file_paths, function(res, method, params)
     common_on_response(res, method, params)
     if on_res ~= nil then
       on_res(res.result)
     end
   end)
-  client:send("exchange_files", file_paths)
 end
 
 ---@param callback? handle_res
 function Session:get_announcements(callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("get_announcements", {}, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), method .. " error (Aider)")
     else
@@ -368,7 +498,6 @@ function Session:get_announcements(callback)
       end
     end
   end)
-  client:send("get_announcements", {})
 end
 
 ---@return table?
@@ -381,9 +510,9 @@ function Session:get_last_change()
 end
 
 ---@param callback? handle_res
-function Session:get_input_history(callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+---@param params? {cursor: integer?, limit: integer?} page params, the result is then {entries, cursor}
+function Session:get_input_history(callback, params)
+  self:get_client():request("get_history", params or {}, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), "get_input_history error (Aider)")
     else
@@ -392,29 +521,191 @@ function Session:get_input_history(callback)
       end
     end
   end)
-  client:send("get_history", {})
 end
 
+--- The whole chat history, only the lines after the cached ones are fetched
 ---@param callback? handle_res
 function Session:chat_history(callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  local since = #self.chat_lines
+  self:get_client():request("chat_history", { since = since }, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), "chat_history error (Aider)")
+      return
+    end
+    if since == #self.chat_lines then
+      -- a concurrent request may have appended them already
+      vim.list_extend(self.chat_lines, res.result.lines)
+    end
+    if callback ~= nil then
+      callback(self.chat_lines)
+    end
+  end)
+end
+
+--- Search the output history, on_matches gets the matches in batches as the
+--- server finds them, callback the summary once the search is done
+---@param params {query: string, regex: boolean|nil, ignore_case: boolean|nil, command: integer|nil, start_index: integer|nil, end_index: integer|nil, limit: integer|nil}
+---@param on_matches fun(matches: {line: integer, text: string, col: integer, end_col: integer}[])
+---@param callback? fun(result: {matched: integer, scanned: integer, next_index: integer|nil})
+function Session:search_output(params, on_matches, callback)
+  local client = self:get_client()
+  client:on_notification("output_search", function(notification)
+    local handler = self.output_searches[notification.search_id]
+    if handler ~= nil then
+      handler(notification.matches)
+    end
+  end)
+  self.last_search_id = self.last_search_id + 1
+  local search_id = self.last_search_id
+  self.output_searches[search_id] = on_matches
+  params = vim.tbl_extend("force", params, { search_id = search_id })
+  client:request("search_output", params, function(res, method, params)
+    self.output_searches[search_id] = nil
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "search_output error (Aider)")
     else
       if callback ~= nil then
         callback(res.result)
       end
     end
   end)
-  client:send("chat_history", {})
+end
+
+---@return string
+function Session:checkpoint_path()
+  local dir = configs.checkpoint.dir or (vim.fn.stdpath("state") .. "/aider-ui/checkpoints")
+  local cwd = vim.fn.fnamemodify(self.dir, ":p")
+  return dir .. "/" .. vim.fn.sha256(cwd .. "\0" .. self.name) .. ".ckpt"
+end
+
+--- Restore the last checkpoint of this session's name and cwd if there is
+--- one, then let the server checkpoint after every command
+function Session:resume_checkpoint()
+  local path = self:checkpoint_path()
+  local enable_auto = function()
+    self:checkpoint({ path = path, auto = true })
+  end
+  if vim.fn.filereadable(path) == 0 then
+    enable_auto()
+    return
+  end
+  self:get_client():request("restore_checkpoint", { path = path }, function(res)
+    if res.error and res.error ~= vim.NIL then
+      utils.warn("Restore checkpoint failed: " .. vim.inspect(res.error), "Aider")
+      enable_auto()
+      return
+    end
+    -- output sequence numbers changed, receive the cached tail again
+    local since = math.max(res.result.output_lines - (configs.output_cache_lines or 10000), 0)
+    self.output_lines = {}
+    self.output_first_seq = since
+    self.output_seq = since - 1
+    self.chat_lines = {}
+    self.response_cache = {}
+    self:get_client():request("subscribe_output", { since = since })
+    self:get_modify_history(function(history)
+      self.modify_history = history
+    end)
+    utils.info(string.format("Session restored in %s ms", res.result.ms), "Aider")
+    enable_auto()
+  end)
+end
+
+---@param params {path: string|nil, auto: boolean|nil}
+---@param callback? fun(result: {path: string, bytes: integer, ms: number})
+function Session:checkpoint(params, callback)
+  self:get_client():request("checkpoint", params, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "checkpoint error (Aider)")
+    else
+      if callback ~= nil then
+        callback(res.result)
+      end
+    end
+  end)
+end
+
+---@param callback fun(history: table[])
+function Session:get_modify_history(callback)
+  self:get_client():request("get_modify_history", {}, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "get_modify_history error (Aider)")
+    else
+      callback(res.result)
+    end
+  end)
+end
+
+--- Output history range of every command, oldest first
+---@param callback? fun(commands: {id: integer, command: string, start: integer, ["end"]: integer|nil}[])
+function Session:list_commands(callback)
+  self:get_client():request("list_commands", {}, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "list_commands error (Aider)")
+    else
+      if callback ~= nil then
+        callback(res.result)
+      end
+    end
+  end)
+end
+
+--- Chat history lines containing every word of query, newest first
+---@param query string
+---@param opts? {limit: integer|nil, before: integer|nil}
+---@param callback? fun(result: {matches: {line: integer, snippet: string}[], next_before: integer|nil})
+function Session:search_chat_history(query, opts, callback)
+  local params = vim.tbl_extend("force", opts or {}, { query = query })
+  self:get_client():request("search_chat_history", params, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "search_chat_history error (Aider)")
+    else
+      if callback ~= nil then
+        callback(res.result)
+      end
+    end
+  end)
+end
+
+---@param callback? handle_res
+function Session:get_startup_timing(callback)
+  self:get_client():request("startup_timing", {}, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "startup_timing error (Aider)")
+    else
+      self.startup_timing = res.result
+      if callback ~= nil then
+        callback(res.result)
+      end
+    end
+  end)
 end
 
 ---@param callback? handle_res
 ---@param params table {start_index: number, end_index: number?}
 function Session:get_output_history(params, callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  params = params or {}
+  local start_index = params.start_index or 0
+  local end_index = params.end_index or (self.output_seq + 1)
+  if
+    self.output_subscribed
+    and start_index >= self.output_first_seq
+    and start_index <= end_index
+    and end_index <= self.output_seq + 1
+  then
+    -- served from the pushed output, no round trip
+    local lines = {}
+    for seq = start_index, end_index - 1 do
+      table.insert(lines, self.output_lines[seq])
+    end
+    if callback ~= nil then
+      vim.schedule(function()
+        callback(lines)
+      end)
+    end
+    return
+  end
+  self:get_client():request("get_output_history", params or {}, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), "get_output_history error (Aider)")
     else
@@ -423,7 +714,6 @@ function Session:get_output_history(params, callback)
       end
     end
   end)
-  client:send("get_output_history", params or {})
 end
 
 ---@param message string
@@ -439,27 +729,23 @@ end
 ---@param path string
 ---@param on_response? handle_res
 function Session:save(path, on_response)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("save", path, function(res, method, params)
     common_on_response(res, method, params)
     if on_response ~= nil then
       on_response(res.result)
     end
   end)
-  client:send("save", path)
 end
 
 ---@param path string
 ---@param on_response? handle_res
 function Session:load(path, on_response)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("load", path, function(res, method, params)
     common_on_response(res, method, params)
     if on_response ~= nil then
       on_response(res.result)
     end
   end)
-  client:send("load", path)
 end
 
 --------------------------------------------------------
@@ -468,8 +754,7 @@ end
 
 ---@param on_response? handle_res
 function Session:list_models(on_response)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:get_client():request("list_models", {}, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), "list_models error (Aider)")
     else
@@ -478,7 +763,6 @@ function Session:list_models(on_response)
       end
     end
   end)
-  client:send("list_models", {})
 end
 
 ---@param model_name string
@@ -492,30 +776,51 @@ function Session:fix_diagnostic(diagnostics)
     utils.warn("Aider is currently processing another command")
     return
   end
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  local params = {
+    diagnostics = diagnostics,
+    concurrency = configs.diagnostic_fix_concurrency or 1,
+    token_budget = configs.diagnostic_fix_token_budget,
+  }
+  self:get_client():request("fix_diagnostic", params, function(res, method, params)
     if res.error and res.error ~= nil then
       utils.err(vim.inspect(res.error), "fix_diagnostic error (Aider)")
     else
       self:send_cmd("fix-diagnostics")
     end
   end)
-  client:send("fix_diagnostic", diagnostics)
 end
 
 ---@param callback? handle_res
 function Session:get_coder_info(callback)
-  local client = self:get_client()
-  client:connect(function(res, method, params)
+  self:versioned_request("get_coder_info", callback)
+end
+
+---@param callback? handle_res
+---@param reset? boolean reset the metrics after reading
+function Session:stats(callback, reset)
+  self:get_client():request("stats", { reset = reset or false }, function(res, method, params)
+    if res.error and res.error ~= nil then
+      utils.err(vim.inspect(res.error), "stats error (Aider)")
+    else
+      if callback ~= nil then
+        callback(res.result)
+      end
+    end
+  end)
+end
+
+---@param params {action: "start"|"stop"|"status", kind: "cpu"|"memory"?, path: string?}
+---@param callback? handle_res
+function Session:profile(params, callback)
+  self:get_client():request("profile", params, function(res, method, params)
     if res.error and res.error ~= nil then
-      utils.err(vim.inspect(res.error), "get_coder_info error (Aider)")
+      utils.err(vim.inspect(res.error), "profile error (Aider)")
     else
       if callback ~= nil then
         callback(res.result)
       end
     end
   end)
-  client:send("get_coder_info", {})
 end
 
 return {
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Terminal of a host mode session: relay this terminal to the session's
+pseudo terminal in the host process (see backend_server/terminal.py).
+
+usage: attach_client.py TERMINAL_PORT
+       attach_client.py --port-file PATH
+
+With --port-file the terminal starts before the session exists: neovim
+needs the terminal's job id right away, the port is written to PATH (by a
+rename, never partially) once the host opened the session, an empty file
+means it failed. Only the framing is imported, no aider, the client starts
+immediately.
+"""
+import os
+import select
+import signal
+import socket
+import sys
+import termios
+import time
+import tty
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from backend_server.framing import FRAMING_LENGTH, encode_frame
+from backend_server.terminal import (
+    RELAY_CHUNK,
+    TERMINAL_INPUT,
+    TERMINAL_RESIZE,
+    WINSIZE,
+    get_winsize,
+)
+
+# the host may still be importing aider
+PORT_FILE_TIMEOUT = 300
+PORT_FILE_POLL = 0.02
+
+
+def wait_port_file(path: str) -> int:
+    """
+    The port written to path, raises OSError on timeout or failure
+    """
+    deadline = time.monotonic() + PORT_FILE_TIMEOUT
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise OSError(f"no terminal port in {path}")
+        time.sleep(PORT_FILE_POLL)
+    with open(path) as file:
+        content = file.read().strip()
+    os.unlink(path)
+    if not content:
+        raise OSError("open session failed")
+    return int(content)
+
+
+def write_all(fd: int, data: bytes):
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def attach(port: int):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stdin_fd, stdout_fd = sys.stdin.fileno(), sys.stdout.fileno()
+
+    def send(flags: int, payload: bytes):
+        sock.sendall(b"".join(encode_frame(payload, FRAMING_LENGTH, flags)))
+
+    def send_size():
+        rows, cols = get_winsize(stdout_fd)
+        send(TERMINAL_RESIZE, WINSIZE.pack(rows, cols))
+
+    # SIGWINCH only wakes the select loop, the size is sent from there
+    wake_r, wake_w = os.pipe()
+    signal.signal(signal.SIGWINCH, lambda *_: os.write(wake_w, b"w"))
+    saved = termios.tcgetattr(stdin_fd)
+    tty.setraw(stdin_fd)
+    try:
+        send_size()
+        while True:
+            readable, _, _ = select.select([sock, stdin_fd, wake_r], [], [])
+            if sock in readable:
+                data = sock.recv(RELAY_CHUNK)
+                if not data:
+                    return
+                write_all(stdout_fd, data)
+            if stdin_fd in readable:
+                data = os.read(stdin_fd, RELAY_CHUNK)
+                if not data:
+                    return
+                send(TERMINAL_INPUT, data)
+            if wake_r in readable:
+                os.read(wake_r, RELAY_CHUNK)
+                send_size()
+    finally:
+        termios.tcsetattr(stdin_fd, termios.TCSADRAIN, saved)
+        sock.close()
+
+
+if __name__ == "__main__":
+    try:
+        if sys.argv[1] == "--port-file":
+            attach(wait_port_file(sys.argv[2]))
+        else:
+            attach(int(sys.argv[1]))
+    except (ConnectionError, OSError, ValueError) as e:
+        print(f"aider-ui attach failed: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+The aider side of aider_server.py: patches aider's Coder and runs the rpc
+server next to aider's main. Imported by aider_server.py after logging and
+the import timing are set up.
+"""
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import aider.main
+from aider.coders import Coder
+from aider.main import SwitchCoder
+from aider.main import main as aider_main
+from aider.models import Model
+from aider.repomap import RepoMap
+
+from backend_server.coder_server_handler import CoderServerHandler
+from backend_server.host import enable_host_mode
+from backend_server.listener import setup_listeners
+from backend_server.profiler import profiler
+from backend_server.server import SocketServer, exit_on_signals
+from backend_server.startup_timing import finish_startup, timer
+from backend_server.store import store
+from backend_server.utils import pop_flag
+
+log = logging.getLogger(__name__)
+# litellm start slow, https://github.com/BerriAI/litellm/issues/2677
+os.environ["LITELLM_LOCAL_MODEL_COST_MAP"] = "True"
+
+timer.add("imports", timer.origin, time.monotonic())
+with timer.phase("setup_listeners"):
+    setup_listeners()
+
+
+def coder_run_one_wrapper(run_one):
+
+    @functools.wraps(run_one)
+    def wrapper_run_one(self, user_message: str, *args, **kwargs):
+        # Get the current stack information
+        stack = traceback.extract_stack()
+        run_one_count = sum(1 for frame in stack if frame.name.endswith("run_one"))
+
+        # If run_one is called more than once, skip the following actions
+        if run_one_count > 1:
+            return run_one(self, user_message, *args, **kwargs)
+
+        try:
+            output_idx = CoderServerHandler.handle_cmd_start(user_message)
+            if user_message == "fix-diagnostics":
+                profiler.run(CoderServerHandler.handle_fix_diagnostic)
+            else:
+                profiler.run(run_one, self, user_message, *args, **kwargs)
+            CoderServerHandler.handle_cmd_complete(user_message, output_idx=output_idx)
+        except SwitchCoder as switch:
+            if switch.kwargs:
+                switch.kwargs["switch_coder"] = True
+            else:
+                switch.kwargs = {"switch_coder": True}
+            CoderServerHandler.handle_cmd_complete(user_message, output_idx=output_idx)
+            raise switch
+
+    return wrapper_run_one
+
+
+Coder.run_one = coder_run_one_wrapper(Coder.run_one)
+
+
+def coder_create_wrapper(create_method):
+
+    def wrapper_create(*args, **kwargs):
+        if "switch_coder" in kwargs:
+            switch_coder = True
+            kwargs.pop("switch_coder")
+        else:
+            switch_coder = False
+        # only timed until the first coder finished startup
+        with timer.phase("coder_create"):
+            new_coder = create_method(*args, **kwargs)
+        if switch_coder:
+            store.coder = new_coder
+        elif store.coder is None:
+            # first init coder
+            finish_startup()
+            CoderServerHandler.handle_process_start()
+            store.coder = new_coder
+            CoderServerHandler.handle_cache_files()
+        return new_coder
+
+    return wrapper_create
+
+
+Coder.create = coder_create_wrapper(Coder.create)
+Model.__init__ = timer.wrap("model_init", Model.__init__)
+RepoMap.__init__ = timer.wrap("repo_map_init", RepoMap.__init__)
+
+
+def warm_up():
+    from aider.llm import litellm
+    from aider.main import load_slow_imports
+
+    with timer.phase("slow_imports"):
+        load_slow_imports()
+        litellm._load_litellm()
+
+
+def wait_activation() -> list:
+    """
+    Standby: warm up the slow imports, then wait for the activate rpc with
+    the session cwd and aider args
+    """
+    warm_up()
+    log.info("standby server ready")
+    with timer.phase("standby_wait"):
+        activation = store.wait_activation()
+    os.chdir(activation["cwd"])
+    return activation["args"]
+
+
+def serialized(func):
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with lock:
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def run_host_session(args: list):
+    aider_main(args)
+
+
+def main():
+    standby = pop_flag(sys.argv, "--aider-ui-standby")
+    host_mode = pop_flag(sys.argv, "--aider-ui-host")
+    unix_socket = pop_flag(sys.argv, "--aider-ui-unix-socket")
+    store.standby = standby
+    exit_on_signals()
+    if host_mode:
+        # sessions are opened with the open_session rpc
+        enable_host_mode(run_host_session)
+        # sessions starting together would race on .git/config.lock
+        aider.main.setup_git = serialized(aider.main.setup_git)
+    with timer.phase("server_start"):
+        server = SocketServer("127.0.0.1", unix_socket=unix_socket)
+        server_thread = threading.Thread(target=server.start)
+        server_thread.daemon = True
+        server_thread.start()
+    log.info("server started on port %d", server.port)
+
+    if host_mode:
+        warm_up()
+        log.info("host ready")
+        server_thread.join()
+    else:
+        aider_main(wait_activation() if standby else None)
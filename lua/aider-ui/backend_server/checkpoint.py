@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Binary checkpoint of a session: the output and chat history, the chat
+search index, the command ranges, the modify history, the files in the chat
+and aider's chat messages.
+
+File layout, little-endian::
+
+    HEADER: magic (8 bytes), format version (uint16), flags (uint16),
+            metadata length (uint32)
+    metadata: JSON, small, "sections" has the (offset, length) of every
+              section relative to the end of the metadata
+    sections: the history logs in their on-disk format (see
+              history_log.py) and the dumped chat index
+
+Writing copies the append-only history files instead of encoding lines,
+loading maps the file and writes the sections back as history files, no
+line is decoded. Snapshot blobs referenced by the modify history stay in
+the SnapshotStore. Checkpoints are machine local: the chat index is stored
+in native byte order.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from threading import Lock, Thread
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from backend_server.history_log import INDEX_ENTRY, HistoryLog
+from backend_server.output_search import CommandRange, CommandRanges
+from backend_server.search_index import POSTINGS_TYPE, TokenIndex
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"AIDERUI\x01"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+COPY_CHUNK = 1024 * 1024
+
+SECTION_OUTPUT_DATA = "output_data"
+SECTION_OUTPUT_INDEX = "output_index"
+SECTION_CHAT_DATA = "chat_data"
+SECTION_CHAT_INDEX = "chat_index"
+SECTION_CHAT_SEARCH = "chat_search"
+SECTIONS = (
+    SECTION_OUTPUT_DATA,
+    SECTION_OUTPUT_INDEX,
+    SECTION_CHAT_DATA,
+    SECTION_CHAT_INDEX,
+    SECTION_CHAT_SEARCH,
+)
+# metadata keys a checkpoint must have and their JSON types
+METADATA_FIELDS = {
+    "sections": dict,
+    "added": list,
+    "readonly": list,
+    "done_messages": list,
+    "cur_messages": list,
+    "modify_history": list,
+    "command_ranges": list,
+}
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class LogView(NamedTuple):
+    """
+    The first lines of a HistoryLog, see HistoryLog.checkpoint_view
+    """
+
+    data_path: str
+    index_path: str
+    lines: int
+    data_size: int
+
+    @classmethod
+    def of(cls, history: HistoryLog) -> "LogView":
+        lines, data_size = history.checkpoint_view()
+        return cls(history.data_path, history.index_path, lines, data_size)
+
+
+class CheckpointState(NamedTuple):
+    """
+    Everything a checkpoint needs, captured on the thread that owns the
+    session, written later by any thread
+    """
+
+    metadata: Dict[str, Any]
+    output: LogView
+    chat: LogView
+    chat_index: TokenIndex
+
+
+def capture(store) -> CheckpointState:
+    """
+    Capture the session of store, cheap: the histories are referenced up to
+    their current length, not copied
+    """
+    coder = store.coder
+    snapshot = store.state.snapshot
+    metadata = {
+        "created": time.time(),
+        "cwd": snapshot.cwd,
+        "main_model": snapshot.main_model,
+        "edit_format": snapshot.edit_format,
+        "added": sorted(coder.abs_fnames) if coder else [],
+        "readonly": sorted(coder.abs_read_only_fnames) if coder else [],
+        "done_messages": list(coder.done_messages) if coder else [],
+        "cur_messages": list(coder.cur_messages) if coder else [],
+        "modify_history": list(store.modify_history),
+        "command_ranges": [item.as_dict() for item in store.command_ranges.list()],
+    }
+    return CheckpointState(
+        metadata,
+        LogView.of(store.output_history),
+        LogView.of(store.chat_history),
+        store.chat_index,
+    )
+
+
+def _copy_prefix(src_path: str, length: int, out):
+    with open(src_path, "rb") as src:
+        while length > 0:
+            data = src.read(min(COPY_CHUNK, length))
+            if not data:
+                raise CheckpointError(f"{src_path} is shorter than expected")
+            out.write(data)
+            length -= len(data)
+
+
+def write_checkpoint(path: str, state: CheckpointState) -> int:
+    """
+    Write state to path atomically, returns the file size
+    """
+    chat_search = state.chat_index.dump(state.chat.lines)
+    # (name, source file or bytes, length)
+    sections: List[Tuple[str, Any, int]] = [
+        (SECTION_OUTPUT_DATA, state.output.data_path, state.output.data_size),
+        (
+            SECTION_OUTPUT_INDEX,
+            state.output.index_path,
+            state.output.lines * INDEX_ENTRY.size,
+        ),
+        (SECTION_CHAT_DATA, state.chat.data_path, state.chat.data_size),
+        (
+            SECTION_CHAT_INDEX,
+            state.chat.index_path,
+            state.chat.lines * INDEX_ENTRY.size,
+        ),
+        (SECTION_CHAT_SEARCH, chat_search, len(chat_search)),
+    ]
+    offsets = {}
+    offset = 0
+    for name, _, length in sections:
+        offsets[name] = [offset, length]
+        offset += length
+    metadata = dict(
+        state.metadata,
+        sections=offsets,
+        byteorder=sys.byteorder,
+        postings_itemsize=array(POSTINGS_TYPE).itemsize,
+    )
+    metadata_bytes = json.dumps(metadata).encode()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(metadata_bytes)))
+            out.write(metadata_bytes)
+            for _, source, length in sections:
+                if isinstance(source, bytes):
+                    out.write(source)
+                else:
+                    _copy_prefix(source, length, out)
+            size = out.tell()
+        # a crash while writing leaves the previous checkpoint in place
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return size
+
+
+class Checkpoint(NamedTuple):
+    metadata: Dict[str, Any]
+    output_history: HistoryLog
+    chat_history: HistoryLog
+    chat_index: TokenIndex
+    command_ranges: CommandRanges
+
+
+def _write_file(path: str, data):
+    with open(path, "wb") as out:
+        out.write(data)
+
+
+def _check_metadata(metadata: Any):
+    if not isinstance(metadata, dict):
+        raise CheckpointError("Invalid checkpoint metadata")
+    for key, kind in METADATA_FIELDS.items():
+        if not isinstance(metadata.get(key), kind):
+            raise CheckpointError(f"Invalid checkpoint metadata: {key}")
+    sections = metadata["sections"]
+    for name in SECTIONS:
+        item = sections.get(name)
+        if not (
+            isinstance(item, list)
+            and len(item) == 2
+            and all(isinstance(value, int) and value >= 0 for value in item)
+        ):
+            raise CheckpointError(f"Invalid checkpoint section: {name}")
+
+
+def load_checkpoint(path: str, history_dir: str) -> Checkpoint:
+    """
+    Map the checkpoint at path, its histories become HistoryLogs in a new
+    directory under history_dir. Raises CheckpointError.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        # ValueError: an empty file can not be mapped
+        raise CheckpointError(f"Read checkpoint failed: {e}") from e
+    with data, memoryview(data) as view:
+        if len(view) < HEADER.size:
+            raise CheckpointError("Not a checkpoint")
+        magic, version, _, metadata_length = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise CheckpointError("Not a checkpoint")
+        if version != FORMAT_VERSION:
+            raise CheckpointError(f"Unsupported checkpoint version: {version}")
+        start = HEADER.size + metadata_length
+        try:
+            metadata = json.loads(bytes(view[HEADER.size : start]))
+        except ValueError as e:
+            raise CheckpointError(f"Invalid checkpoint metadata: {e}") from e
+        _check_metadata(metadata)
+        if (
+            metadata.get("byteorder") != sys.byteorder
+            or metadata.get("postings_itemsize") != array(POSTINGS_TYPE).itemsize
+        ):
+            raise CheckpointError("Checkpoint written on another platform")
+
+        def section(name: str) -> memoryview:
+            offset, length = metadata["sections"][name]
+            if start + offset + length > len(view):
+                raise CheckpointError("Truncated checkpoint")
+            return view[start + offset : start + offset + length]
+
+        restore_dir = tempfile.mkdtemp(prefix="restore-", dir=history_dir)
+        # the error is raised after the mmap is closed, a traceback still
+        # referencing a section would keep it from closing
+        error = None
+        try:
+            _write_file(f"{restore_dir}/output.log", section(SECTION_OUTPUT_DATA))
+            _write_file(f"{restore_dir}/output.idx", section(SECTION_OUTPUT_INDEX))
+            _write_file(f"{restore_dir}/chat.log", section(SECTION_CHAT_DATA))
+            _write_file(f"{restore_dir}/chat.idx", section(SECTION_CHAT_INDEX))
+            chat_index = TokenIndex.load(section(SECTION_CHAT_SEARCH))
+        except CheckpointError:
+            shutil.rmtree(restore_dir, ignore_errors=True)
+            raise
+        except OSError as e:
+            error = f"Restore checkpoint failed: {e}"
+        except (struct.error, ValueError) as e:
+            # truncated postings or token bytes that are not utf-8
+            error = f"Corrupt checkpoint: {e}"
+    if error is not None:
+        shutil.rmtree(restore_dir, ignore_errors=True)
+        raise CheckpointError(error)
+    try:
+        ranges = [CommandRange(**item) for item in metadata.pop("command_ranges")]
+        return Checkpoint(
+            metadata,
+            HistoryLog(f"{restore_dir}/output"),
+            HistoryLog(f"{restore_dir}/chat"),
+            chat_index,
+            CommandRanges(ranges),
+        )
+    except (OSError, TypeError) as e:
+        # TypeError: malformed command ranges
+        shutil.rmtree(restore_dir, ignore_errors=True)
+        raise CheckpointError(f"Corrupt checkpoint: {e}") from e
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints on a background thread. A checkpoint scheduled while
+    one is written replaces any older pending one, only the newest state is
+    written.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pending: Optional[Tuple[str, CheckpointState]] = None
+        self._thread: Optional[Thread] = None
+        # of the last write: { "path", "bytes", "ms" } or { "path", "error" }
+        self.last: Optional[dict] = None
+
+    def schedule(self, path: str, state: CheckpointState):
+        with self._lock:
+            self._pending = (path, state)
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._run, name="aider-checkpoint", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                item, self._pending = self._pending, None
+                if item is None:
+                    self._thread = None
+                    return
+            self.last = write(*item)
+
+
+def write(path: str, state: CheckpointState) -> dict:
+    """
+    write_checkpoint, returns { "path", "bytes", "ms" } or { "path", "error" }
+    """
+    start = time.perf_counter()
+    try:
+        size = write_checkpoint(path, state)
+    except (OSError, CheckpointError) as e:
+        log.warning("write checkpoint %s failed: %s", path, e)
+        return {"path": path, "error": str(e)}
+    ms = round((time.perf_counter() - start) * 1000, 3)
+    log.info("checkpoint %s written: %s bytes in %s ms", path, size, ms)
+    return {"path": path, "bytes": size, "ms": ms}
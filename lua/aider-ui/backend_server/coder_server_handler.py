@@ -1,29 +1,98 @@
 # -*- coding: utf-8 -*-
-import difflib
+import functools
 import logging
 import os
-import tempfile
+import re
+import shlex
 import time
-from pathlib import Path
-from typing import List, Optional, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
 
+from aider.coders import Coder
 from aider.commands import Commands
 from aider.linter import tree_context
 from aider.models import MODEL_ALIASES
+from backend_server import checkpoint
+from backend_server import host as session_host
 from backend_server.consts import NotifyType
-from backend_server.store import FileDiagnostics, store
-from backend_server.utils import copy_files_to_dir
+from backend_server.diagnostic_planner import (
+    DEFAULT_TOKEN_BUDGET,
+    dedupe_diagnostics,
+    plan_requests,
+)
+from backend_server.diff_engine import diff_file_pairs
+from backend_server.encoding import (
+    COMPRESS_THRESHOLD,
+    SUPPORTED_COMPRESSIONS,
+    supported_encodings,
+)
+from backend_server.file_ops import ADD, DROP, READ_ONLY, FileOpLog, apply_file_ops
+from backend_server.framing import MAX_FRAME_SIZE, SUPPORTED_FRAMINGS
+from backend_server.input_history import DEFAULT_PAGE_SIZE, InputHistoryIndex
+from backend_server.metrics import metrics
+from backend_server.output_search import (
+    SearchProgress,
+    compile_query,
+    search_lines,
+)
+from backend_server.profiler import PROFILE_KINDS, profiler
+from backend_server.search_index import snippet, tokenize
+from backend_server.startup_timing import timer as startup_timer
+from backend_server.store import FileDiagnostics, current_store, store
+from backend_server.worker_io import BufferedIO
 
 log = logging.getLogger(__name__)
 
+NOTIFY_BATCH_MAX_ITEMS = 64
+NOTIFY_BATCH_WINDOW_MS = 20
+MAX_FIX_CONCURRENCY = 8
+DEFAULT_SEARCH_LIMIT = 50
+DEFAULT_OUTPUT_SEARCH_LIMIT = 1000
+COMMIT_LINE = compile_query("^Commit ", regex=True)
+
+
+def _write_locked(func: Callable) -> Callable:
+    """
+    Run func under the session's write_lock, which also serializes file writes
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with store.write_lock:
+            return func(*args, **kwargs)
+
+    return wrapper
+
 
 class ErrorData(TypedDict):
     code: int
     message: str
 
 
+# (method, params), sends a JSON-RPC notification to the connected client
+PushNotification = Callable[[str, dict], None]
+
+
+def _not_modified(params, version: int) -> bool:
+    return isinstance(params, dict) and params.get("if_none_match") == version
+
+
 class CoderServerHandler:
 
+    def __init__(self, push: Optional[PushNotification] = None):
+        self.push = push
+        self._output_subscribed = False
+
+    def close(self):
+        """
+        connection closed
+        """
+        if self._output_subscribed:
+            store.unsubscribe_output(self._push_output)
+            self._output_subscribed = False
+
     def handle_message(self, message):
         """
         handle rpc server message
@@ -39,7 +108,16 @@ class CoderServerHandler:
                 "id": message.get("id"),
             }
 
-        res, err = handler_method(params)
+        start = time.perf_counter()
+        metrics.request_started()
+        try:
+            res, err = handler_method(params)
+        except BaseException:
+            metrics.request_finished(method, time.perf_counter() - start, error=True)
+            raise
+        metrics.request_finished(
+            method, time.perf_counter() - start, error=err is not None
+        )
         data = {
             "jsonrpc": "2.0",
             "result": res,
@@ -47,78 +125,54 @@ class CoderServerHandler:
         }
         if err:
             data["error"] = err
-        keep_alive = method in ("notify")
-        return data, keep_alive
+        return data
 
-    def method_list_files(self, *args, **kwargs):
+    def method_list_files(self, params):
         """
-        get add and read files
+        get add and read files, from the published snapshot
+        Params: { "if_none_match": version }? returns
+            { "not_modified": true, "version" } if the files are unchanged
         """
-        if not store.coder:
-            return {"added": [], "readonly": []}, None
-        inchat_files = store.coder.get_inchat_relative_files()
-        read_only_files = []
-        for abs_file_path in store.coder.abs_read_only_fnames or []:
-            rel_file_path = store.coder.get_rel_fname(abs_file_path)
-            read_only_files.append(rel_file_path)
-
-        return {
-            "added": inchat_files,
-            "readonly": read_only_files,
-        }, None
+        snapshot = store.state.snapshot
+        if _not_modified(params, snapshot.files_version):
+            return {"not_modified": True, "version": snapshot.files_version}, None
+        return snapshot.files() | {"version": snapshot.files_version}, None
 
     def method_add_files(self, params: List[str]):
         """
         /add params
         """
-        params = [params] if isinstance(params, str) else params
-        if store.coder is None or store.running:
-            for item in params:
-                if item in store.waiting_read_files:
-                    store.waiting_read_files.remove(item)
-                if item in store.waiting_drop_files:
-                    store.waiting_drop_files.remove(item)
-                store.waiting_add_files.append(item)
-            return "waiting", None
-
-        args = " ".join(params)
-        store.coder.commands.cmd_add(args)
-        return "add file success", None
+        return self._file_op(ADD, params, "add file success")
 
     def method_read_files(self, params: List[str]):
         """
         /read-only params
         """
-        params = [params] if isinstance(params, str) else params
-        if store.coder is None or store.running:
-            for item in params:
-                if item in store.waiting_add_files:
-                    store.waiting_add_files.remove(item)
-                if item in store.waiting_drop_files:
-                    store.waiting_drop_files.remove(item)
-                store.waiting_read_files.append(item)
-            return "waiting", None
-
-        store.coder.commands.cmd_read_only(" ".join(params))
-        return "read file success", None
+        return self._file_op(READ_ONLY, params, "read file success")
 
     def method_drop(self, params: List[str]):
         """
         aider /drop
         """
+        return self._file_op(DROP, params, "drop file success")
+
+    def _file_op(self, op: str, params, success: str):
+        """
+        Queue while a command runs, the queue is applied coalesced on cmd complete
+        """
         params = [params] if isinstance(params, str) else params
+        if not params:
+            # an empty /drop would drop every file
+            return success, None
         if store.coder is None or store.running:
-            for item in params:
-                if item in store.waiting_add_files:
-                    store.waiting_add_files.remove(item)
-                if item in store.waiting_read_files:
-                    store.waiting_read_files.remove(item)
-                store.waiting_drop_files.append(item)
+            store.file_ops.record(op, params)
             return "waiting", None
 
-        args = " ".join(params)
-        store.coder.commands.cmd_drop(args)
-        return "drop file success", None
+        ops = FileOpLog()
+        ops.record(op, params)
+        apply_file_ops(store.coder.commands, ops.drain())
+        store.refresh_state()
+        return success, None
 
     def method_clear(self, params):
         """
@@ -140,6 +194,7 @@ class CoderServerHandler:
         if store.running:
             return None, {"code": 32603, "message": "Server is running"}
         store.coder.commands.cmd_reset(params)
+        store.refresh_state()
         return "reset success", None
 
     def method_load(self, params: str):
@@ -152,6 +207,7 @@ class CoderServerHandler:
             return None, {"code": 32603, "message": "Server is running"}
         file_path = params
         store.coder.commands.cmd_load(file_path)
+        store.refresh_state()
         return "load session success", None
 
     def method_exchange_files(self, params):
@@ -162,48 +218,36 @@ class CoderServerHandler:
             return None, {"code": 32603, "message": "CoderNotInit"}
         if store.running:
             return None, {"code": 32603, "message": "Server is running"}
-        added_files = list(store.coder.get_inchat_relative_files())
-        cmd = Commands(store.coder.io, store.coder)
-        args = " ".join(params)
-        cmd.cmd_drop(args)
+        added_files = set(store.coder.get_inchat_relative_files())
+        # aider moves a file between editable and read-only on add/read-only,
+        # no drop needed
+        ops = FileOpLog()
         for file_path in params:
-            cmd.cmd_drop(file_path)
-            if file_path in added_files:
-                cmd.cmd_read_only(file_path)
-            else:
-                cmd.cmd_add(file_path)
+            ops.record(READ_ONLY if file_path in added_files else ADD, [file_path])
+        apply_file_ops(Commands(store.coder.io, store.coder), ops.drain())
+        store.refresh_state()
         return "exchange file success", None
 
     def method_get_history(self, params):
         """
         get history command
+        Params: { "cursor": int?, "limit": int? } returns { "entries", "cursor" },
+            pass cursor back for older entries. Without params: newest entries
         """
         if not store.coder:
             return [], {"code": 32603, "message": "CoderNotInit"}
+        history_file = store.coder.io.input_history_file
+        if not history_file:
+            return [], None
+        if store.input_history is None or store.input_history.file_path != history_file:
+            store.input_history = InputHistoryIndex(history_file)
 
-        history = store.coder.io.get_input_history()
-        chat_histories = []
-        multi_lines = []
-        for row in history:
-            if row.endswith("}"):
-                multi_lines = [row.rstrip("}")] if row.rstrip("}") else []
-                continue
-            row = row.lstrip("{")
-            if row.startswith(("/code ", "/ask ", "/architect ")):
-                prefix, content = row.split(" ", 1)
-                multi_lines.insert(0, content)
-                chat_histories.append(
-                    {
-                        "cmd": prefix,
-                        "content": "\n".join(multi_lines),
-                    }
-                )
-                multi_lines = []
-            else:
-                multi_lines.insert(0, row)
-            if len(chat_histories) > 50:
-                break
-        return chat_histories, None
+        if not isinstance(params, dict) or not params:
+            return store.input_history.get_page()["entries"], None
+        page = store.input_history.get_page(
+            params.get("cursor"), params.get("limit", DEFAULT_PAGE_SIZE)
+        )
+        return page, None
 
     def method_get_output_history(self, params):
         """
@@ -221,90 +265,349 @@ class CoderServerHandler:
             
         return store.output_history[start_index:end_index], None
 
+    def method_list_commands(self, params):
+        """
+        Output history range of every command, oldest first
+        returns [{ "id", "command", "start", "end" }], end is None while the
+        command runs
+        """
+        return [item.as_dict() for item in store.command_ranges.list()], None
+
+    def method_search_output(self, params):
+        """
+        Search the output history, matches are pushed as "output_search"
+        notifications { "search_id", "matches": [{ "line", "text", "col",
+        "end_col" }] } before the response
+        Params: { "query": str, "regex": bool?, "ignore_case": bool?,
+                  "command": int? (id from list_commands, search its output),
+                  "start_index": int?, "end_index": int?, "limit": int?,
+                  "search_id": any? (echoed in the notifications) }
+        returns { "search_id", "matched", "scanned", "next_index" },
+            next_index is where to resume when the limit was reached
+        """
+        if not self.push:
+            return None, {"code": 32603, "message": "Push not supported"}
+        params = params if isinstance(params, dict) else {}
+        query = params.get("query")
+        if not isinstance(query, str) or not query:
+            return None, {"code": 32602, "message": "Invalid query"}
+        try:
+            pattern = compile_query(
+                query, bool(params.get("regex")), bool(params.get("ignore_case"))
+            )
+        except re.error as e:
+            return None, {"code": 32602, "message": f"Invalid regex: {e}"}
+        total = len(store.output_history)
+        start = params.get("start_index", 0)
+        end = params.get("end_index", total)
+        if not isinstance(start, int) or not 0 <= start <= total:
+            return None, {"code": 32602, "message": "Invalid start_index"}
+        if not isinstance(end, int) or not start <= end <= total:
+            return None, {"code": 32602, "message": "Invalid end_index"}
+        if params.get("command") is not None:
+            command = store.command_ranges.get(params["command"])
+            if command is None:
+                return None, {"code": 32602, "message": "Unknown command"}
+            # the indexes narrow the command's range, never leave it
+            command_end = total if command.end is None else command.end
+            start = min(max(start, command.start), command_end)
+            end = max(min(end, command_end), start)
+        limit = params.get("limit", DEFAULT_OUTPUT_SEARCH_LIMIT)
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            return None, {"code": 32602, "message": "Invalid limit"}
+
+        search_id = params.get("search_id")
+        progress = SearchProgress()
+        for batch in search_lines(
+            store.output_history, pattern, start, end, limit, progress
+        ):
+            self.push("output_search", {"search_id": search_id, "matches": batch})
+        return {
+            "search_id": search_id,
+            "matched": progress.matched,
+            "scanned": progress.scanned,
+            "next_index": progress.next_index,
+        }, None
+
+    def _push_output(self, seq: int, line: str):
+        if self.push:
+            self.push("output", {"seq": seq, "line": line})
+
+    def method_subscribe_output(self, params):
+        """
+        Push output lines as "output" notifications, starting from
+        params.since (sequence number, same as the output_history index)
+        Params: { "since": int (optional) }
+        """
+        if not self.push:
+            return None, {"code": 32603, "message": "Push not supported"}
+        params = params or {}
+        if not isinstance(params, dict):
+            return None, {"code": 32602, "message": "Invalid params"}
+        since = params.get("since", 0)
+        if not isinstance(since, int):
+            return None, {"code": 32602, "message": "Invalid since"}
+        if self._output_subscribed:
+            store.unsubscribe_output(self._push_output)
+        next_seq = store.subscribe_output(self._push_output, since)
+        self._output_subscribed = True
+        return {"next_seq": next_seq}, None
+
+    def method_unsubscribe_output(self, params):
+        """
+        Stop pushing output lines
+        """
+        self.close()
+        return "unsubscribed", None
+
     def method_get_announcements(self, params):
         """
         Get announcements and settings content
         """
-        if not store.coder:
-            return [], None
-
-        lines = store.coder.get_announcements()
-        return lines, None
+        return list(store.state.snapshot.announcements), None
 
     def method_get_coder_info(self, params):
         """
         Get coder info
+        Params: { "if_none_match": version }? like list_files
         """
-        if not store.coder:
+        snapshot = store.state.snapshot
+        info = snapshot.coder_info()
+        if info is None:
             return None, None
-
-        info = {
-            "main_model": str(store.coder.main_model),
-            "edit_format": store.coder.edit_format,
-            "cwd": str(Path.cwd()),
-        }
-        return info, None
+        if _not_modified(params, snapshot.info_version):
+            return {"not_modified": True, "version": snapshot.info_version}, None
+        return info | {"version": snapshot.info_version}, None
 
     def method_notify(self, params):
         """
-        Get next notification from queue
+        Get next notification from queue, with params.batch a list of all
+        notifications queued within window_ms (coalesced)
+        Params: { "batch": bool, "max_items": int, "window_ms": int }
         """
-        return store.notification_queue.get(block=True), None  # 改为从store获取
+        params = params or {}
+        if not params.get("batch"):
+            return store.notification_queue.get(block=True), None
+        max_items = max(int(params.get("max_items", NOTIFY_BATCH_MAX_ITEMS)), 1)
+        window = max(params.get("window_ms", NOTIFY_BATCH_WINDOW_MS), 0) / 1000
+        return store.get_notifications(max_items, window), None
 
-    def method_fix_diagnostic(self, params: List[FileDiagnostics]):
+    def method_fix_diagnostic(self, params):
+        """
+        Params: [FileDiagnostics]
+            or {
+                "diagnostics": [FileDiagnostics],
+                "concurrency": int,
+                "token_budget": int,  # pack files into requests up to this size
+            }
+        """
         if not store.coder:
             raise
-        if not params:
+        if isinstance(params, dict):
+            diagnostics = params.get("diagnostics") or []
+            concurrency = params.get("concurrency") or 1
+            token_budget = params.get("token_budget", DEFAULT_TOKEN_BUDGET)
+        else:
+            # the old list form: one file per request, no packing
+            diagnostics, concurrency, token_budget = params, 1, 0
+        if not diagnostics:
             return "", None
-        store.diagnostics = params
+        store.diagnostics = diagnostics
+        store.fix_concurrency = max(1, min(int(concurrency), MAX_FIX_CONCURRENCY))
+        store.fix_token_budget = int(token_budget)
         return "", None
 
     @classmethod
-    def handle_fix_diagnostic(cls):
-        if not store.coder:
-            raise
-        if not store.diagnostics:
-            return
-        lint_coder = store.coder.clone(
+    def _get_fix_prompt(cls, item: FileDiagnostics, linter) -> str:
+        """
+        Diagnostics of one file and the code around them
+        """
+        fname = item["fname"]
+        rel_fname = linter.get_rel_fname(fname)
+        res = ""
+        for diagnostic in item["diagnostics"]:
+            code, message = diagnostic.get("code"), diagnostic.get("message")
+            lnum, col = diagnostic.get("lnum"), diagnostic.get("col")
+            res += f"{fname}:{lnum}:{col}: {code}: {message}\n"
+            res += "\n"
+        lines = set()
+        for diagnostic in item["diagnostics"]:
+            lnum = diagnostic["lnum"]
+            end = max(lnum, diagnostic.get("end_lnum") or lnum)
+            lines.update(range(lnum, end + 1))
+        try:
+            res += store.tree_contexts.render(fname, rel_fname, lines, linter.encoding)
+        except OSError as err:
+            print(f"Unable to read {fname}: {err}")
+            res += tree_context(rel_fname, "", lines)
+        return res
+
+    @classmethod
+    def _plan_fix_requests(cls) -> List[Tuple[List[str], str]]:
+        """
+        (fnames, prompt) of every LLM request of fix diagnostics
+        """
+        assert store.coder is not None
+        linter = store.coder.linter
+        by_fname: Dict[str, list] = {}
+        for item in store.diagnostics:
+            by_fname.setdefault(item["fname"], []).extend(item["diagnostics"])
+        items: List[FileDiagnostics] = [
+            {"fname": fname, "diagnostics": dedupe_diagnostics(diagnostics)}
+            for fname, diagnostics in by_fname.items()
+            if diagnostics
+        ]
+        prompts = {item["fname"]: cls._get_fix_prompt(item, linter) for item in items}
+
+        main_model = store.coder.main_model
+        token_count = getattr(main_model, "token_count", None)
+        planned = plan_requests(
+            items,
+            [prompts[item["fname"]] for item in items],
+            token_count,
+            store.fix_token_budget,
+        )
+        log.info(
+            "fix diagnostics: %d files in %d requests", len(items), len(planned)
+        )
+        return [
+            (
+                [item["fname"] for item in request["items"]],
+                "# Fix any errors below, if possible.\n\n"
+                + "\n".join(prompts[item["fname"]] for item in request["items"]),
+            )
+            for request in planned
+        ]
+
+    @classmethod
+    def _clone_lint_coder(cls, **kwargs):
+        assert store.coder is not None
+        return store.coder.clone(
             # Clear the chat history, fnames
             cur_messages=[],
             done_messages=[],
             fnames=None,
+            **kwargs,
         )
-        linter = store.coder.linter
+
+    @classmethod
+    def handle_fix_diagnostic(cls):
+        if not store.coder:
+            raise
+        if not store.diagnostics:
+            return
         store.running = True
         cls.handle_process_start()
-        for item in store.diagnostics:
-            fname = item["fname"]
-            rel_fname = linter.get_rel_fname(fname)
-            lines = set()
+        try:
+            requests = cls._plan_fix_requests()
+            if store.fix_concurrency > 1 and len(requests) > 1:
+                cls._fix_diagnostic_parallel(requests, store.fix_concurrency)
+            else:
+                lint_coder = cls._clone_lint_coder()
+                for fnames, res in requests:
+                    store.coder.io.tool_output(res)
+                    for fname in fnames:
+                        lint_coder.add_rel_fname(fname)
+                    lint_coder.run(res)
+                    lint_coder.abs_fnames = set()
+        finally:
+            # also on Ctrl-C: the client waits for CMD_COMPLETE and the file
+            # ops queued while running are applied there
+            store.running = False
+            cls.handle_cmd_complete("fix-diagnostic")
+
+    @classmethod
+    def _notify_fix_progress(
+        cls, fnames: List[str], status: str, done: int, total: int
+    ):
+        names = ", ".join(os.path.basename(fname) for fname in fnames)
+        store.add_notify_message(
+            {
+                "type": NotifyType.FIX_PROGRESS,
+                "fnames": fnames,
+                "status": status,
+                "done": done,
+                "total": total,
+                "message": f"{status} {names} ({done}/{total})",
+            }
+        )
+
+    @classmethod
+    def _fix_diagnostic_parallel(
+        cls, requests: List[Tuple[List[str], str]], concurrency: int
+    ):
+        """
+        One cloned coder per request, at most ``concurrency`` LLM requests
+        at a time. File writes are serialized by the write_text listener.
+        The clones never prompt, every confirm is answered yes, and their
+        terminal output is written when their request finished, see
+        worker_io.
+        """
+        assert store.coder is not None
+        # the run_one wrapper treats a run_one outside a command as a new
+        # command, workers call the original
+        run_one = getattr(Coder.run_one, "__wrapped__", Coder.run_one)
+        total = len(requests)
+        done = 0
+        done_lock = Lock()
+        interrupted = Event()
+
+        def fix_files(fnames: List[str], res: str):
+            nonlocal done
+            if interrupted.is_set():
+                return
+            cls._notify_fix_progress(fnames, "start", done, total)
+            io = BufferedIO(store.coder.io)
+            # not streamed: a non-pretty stream writes to stdout directly
+            lint_coder = cls._clone_lint_coder(io=io, stream=False)
+            # the clones share the repo, concurrent commits fail on
+            # .git/index.lock
+            lint_coder.dirty_commit = _write_locked(lint_coder.dirty_commit)
+            lint_coder.auto_commit = _write_locked(lint_coder.auto_commit)
+            for fname in fnames:
+                lint_coder.add_rel_fname(fname)
+            status = "done"
             try:
-                file_content = Path(fname).read_text(
-                    encoding=linter.encoding, errors="replace"
-                )
-            except OSError as err:
-                print(f"Unable to read {fname}: {err}")
-            res = "# Fix any errors below, if possible.\n\n"
-            for diagnostic in item["diagnostics"]:
-                code, message = diagnostic.get("code"), diagnostic.get("message")
-                lnum, col = diagnostic.get("lnum"), diagnostic.get("col")
-                end_lnum = diagnostic.get("end_lnum")
-                res += f"{fname}:{lnum}:{col}: {code}: {message}\n"
-                res += "\n"
-                lines.update(range(lnum, end_lnum + 1))
-            res += tree_context(rel_fname, file_content, lines)
-
-            store.coder.io.tool_output(res)
-            lint_coder.add_rel_fname(fname)
-            lint_coder.run(res)
-            lint_coder.abs_fnames = set()
-        store.running = False
-        cls.handle_cmd_complete("fix-diagnostic")
+                run_one(lint_coder, res, True)
+            except Exception as e:
+                log.error("fix diagnostic %s failed: %s", fnames, e)
+                status = "failed"
+            finally:
+                io.flush()
+            with done_lock:
+                done += 1
+                cls._notify_fix_progress(fnames, status, done, total)
+
+        store.coder.io.tool_output(
+            f"Fix diagnostics in {total} requests, {concurrency} at a time"
+        )
+        executor = ThreadPoolExecutor(
+            max_workers=min(concurrency, total), thread_name_prefix="aider-fix"
+        )
+        # workers run in the session's context, host mode has one store per session
+        futures = [
+            executor.submit(copy_context().run, fix_files, *request)
+            for request in requests
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            # running requests finish in the background, queued ones are
+            # dropped, also those a worker already picked up
+            interrupted.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
 
     @classmethod
     def handle_process_start(cls):
         store.add_notify_message(
-            {"type": NotifyType.AIDER_START, "message": "aider started"}
+            {
+                "type": NotifyType.AIDER_START,
+                "message": "aider started",
+                "startup": startup_timer.as_dict(),
+            }
         )
 
     @classmethod
@@ -321,30 +624,11 @@ class CoderServerHandler:
                     "message": f"{cls._get_cmd_from_message(message)} start",
                 }
             )
-        # Create a temporary directory and record it in change_files, and clear file_paths
-        temp_dir = tempfile.mkdtemp()
-        store.change_files["before_tmp_dir"] = temp_dir
+        # before snapshots are taken by the write_text listener
         store.change_files["files"].clear()
-        return len(store.output_history)
-
-    @staticmethod
-    def _get_diff_summary(before_path: str, after_path: str) -> dict:
-        """计算文件修改前后的diff摘要"""
-        added = removed = 0
-        if before_path and after_path:
-            try:
-                with open(before_path, encoding="utf-8", errors="replace") as f1, \
-                     open(after_path, encoding="utf-8", errors="replace") as f2:
-                    lines1, lines2 = f1.readlines(), f2.readlines()
-                diff = difflib.unified_diff(lines1, lines2, n=0)
-                for line in diff:
-                    if line.startswith("+") and not line.startswith("+++"):
-                        added += 1
-                    elif line.startswith("-") and not line.startswith("---"):
-                        removed += 1
-            except Exception as e:
-                log.error("diff计算失败 %s: %s", before_path, e)
-        return {"added": added, "removed": removed}
+        output_idx = len(store.output_history)
+        store.command_ranges.start(message or "", output_idx)
+        return output_idx
 
     @classmethod
     def handle_cmd_complete(
@@ -355,38 +639,55 @@ class CoderServerHandler:
         """
         log.info("handle_cmd_complete: %s, output_idx: %s", message, output_idx)
         assert store.coder is not None
-        after_tmp_dir = tempfile.mkdtemp()
-        after_tmp_map = copy_files_to_dir(
-            [file["path"] for file in store.change_files["files"]],
-            after_tmp_dir,
-        )
         modified_info = []
         for file in store.change_files["files"]:
-            file_info = {
-                "path": file["path"],
-                "abs_path": store.coder.abs_root_path(file["path"]),
-                "before_path": file.get("before_path"),
-                "after_path": after_tmp_map.get(file["path"]),
-            }
-
-            file_info["diff_summary"] = cls._get_diff_summary(
-                file_info["before_path"], file_info["after_path"]
+            before = file.get("before")
+            after = store.snapshots.put_file(file["path"])
+            modified_info.append(
+                {
+                    "path": file["path"],
+                    "abs_path": store.coder.abs_root_path(file["path"]),
+                    "before_blob": before and before["blob"],
+                    "before_path": before and before["path"],
+                    "after_blob": after and after["blob"],
+                    "after_path": after and after["path"],
+                }
             )
-            modified_info.append(file_info)
+        diffs = diff_file_pairs(
+            [(info["before_path"], info["after_path"]) for info in modified_info]
+        )
+        for file_info, diff in zip(modified_info, diffs, strict=True):
+            file_info["diff_summary"] = {
+                "added": diff["added"],
+                "removed": diff["removed"],
+            }
+            # precomputed unified diff hunks, the diff view does not re-diff
+            file_info["hunks"] = diff["hunks"]
+        # the command may have added or dropped files, publish before the
+        # client hears of cmd_complete and lists them
+        store.refresh_state()
         store.running = False
+        output_end = len(store.output_history)
+        store.command_ranges.complete(output_end)
         res_msg = ""
         if message and output_idx is not None:
             message = message.strip()
             command = cls._get_cmd_from_message(message)
             if command == "/commit":
-                for msg in store.output_history[output_idx:]:
-                    if msg.startswith("Commit "):
-                        res_msg = msg
-                        break
+                for batch in search_lines(
+                    store.output_history,
+                    COMMIT_LINE,
+                    output_idx,
+                    output_end,
+                    1,
+                    SearchProgress(),
+                ):
+                    res_msg = batch[0]["text"]
             elif command in ("/ask", "/architect", "/code", "/lint"):
                 res_msg = f"{command} complete"
             else:
                 res_msg = "complete"
+        store.modify_history.append(modified_info)
         store.add_notify_message(
             {
                 "type": NotifyType.CMD_COMPLETE,
@@ -395,18 +696,20 @@ class CoderServerHandler:
             }
         )
         cls.handle_cache_files()
+        if store.checkpoint_path:
+            store.checkpoints.schedule(store.checkpoint_path, checkpoint.capture(store))
 
     @classmethod
     def handle_cache_files(cls):
-        if store.waiting_add_files:
-            cls().method_add_files(store.waiting_add_files)
-            store.waiting_add_files.clear()
-        if store.waiting_read_files:
-            cls().method_read_files(store.waiting_read_files)
-            store.waiting_read_files.clear()
-        if store.waiting_drop_files:
-            cls().method_drop(store.waiting_drop_files)
-            store.waiting_drop_files.clear()
+        """
+        apply the file operations queued while the command ran
+        """
+        if store.coder is None:
+            return
+        ops = store.file_ops.drain()
+        if ops:
+            apply_file_ops(store.coder.commands, ops)
+            store.refresh_state()
 
     @classmethod
     def _get_cmd_from_message(cls, message: str) -> str:
@@ -419,17 +722,252 @@ class CoderServerHandler:
 
     @classmethod
     def method_chat_history(cls, params):
-        return store.chat_history, None
+        """
+        Chat history lines
+        Params: { "since": int, "limit": int? } returns { "lines", "next" },
+            the lines from index since, pass next back for the lines after
+            them. Without params: all lines
+        """
+        if not isinstance(params, dict) or "since" not in params:
+            return store.chat_history[:], None
+        since, limit = params["since"], params.get("limit")
+        if not isinstance(since, int):
+            return None, {"code": 32602, "message": "Invalid since"}
+        end = len(store.chat_history)
+        if isinstance(limit, int) and limit >= 0:
+            end = min(end, since + limit)
+        lines = store.chat_history[since:end]
+        return {"lines": lines, "next": since + len(lines)}, None
+
+    @classmethod
+    def method_search_chat_history(cls, params):
+        """
+        Lines of the chat history containing every word of query, newest first
+        Params: { "query": str, "limit": int?, "before": int? }
+            returns { "matches": [{ "line", "snippet" }], "next_before" },
+            pass next_before back as before for older matches
+        """
+        params = params if isinstance(params, dict) else {}
+        query = params.get("query")
+        tokens = tokenize(query) if isinstance(query, str) else []
+        if not tokens:
+            return None, {"code": 32602, "message": "Invalid query"}
+        limit, before = params.get("limit", DEFAULT_SEARCH_LIMIT), params.get("before")
+        if not isinstance(limit, int) or limit <= 0:
+            return None, {"code": 32602, "message": "Invalid limit"}
+        if before is not None and not isinstance(before, int):
+            return None, {"code": 32602, "message": "Invalid before"}
+        lines, next_before = store.chat_index.search(query, limit, before)
+        matches = [
+            {"line": line_no, "snippet": snippet(store.chat_history[line_no], tokens)}
+            for line_no in lines
+        ]
+        return {"matches": matches, "next_before": next_before}, None
+
+    @classmethod
+    def method_stats(cls, params):
+        """
+        Server metrics, notify is a long poll: its latency includes the wait
+        Params: { "reset": bool } reset after reading
+        """
+        stats = metrics.as_dict()
+        stats["notification_queue"] = store.notification_queue.qsize()
+        stats["output_subscribers"] = len(store.output_subscribers)
+        stats["output_history"] = len(store.output_history)
+        stats["profiling"] = profiler.status()
+        if isinstance(params, dict) and params.get("reset"):
+            metrics.reset()
+        return stats, None
+
+    @classmethod
+    def method_profile(cls, params):
+        """
+        Start or stop a profiler in the running server
+        Params: { "action": "start" | "stop" | "status",
+                  "kind": "cpu" | "memory", "path": str (optional) }
+        cpu profiles aider commands, memory uses tracemalloc. stop returns
+        { "path", "summary" }, the full result is written to path.
+        """
+        params = params or {}
+        action, kind = params.get("action", "status"), params.get("kind", "cpu")
+        if action == "status":
+            return profiler.status(), None
+        if kind not in PROFILE_KINDS:
+            return None, {"code": 32602, "message": f"Invalid profile kind: {kind}"}
+        if action == "start":
+            return {"path": profiler.start(kind, params.get("path"))}, None
+        if action == "stop":
+            try:
+                res = profiler.stop(kind)
+            except OSError as e:
+                return None, {"code": 32603, "message": f"Write profile failed: {e}"}
+            if res is None:
+                return None, {"code": 32603, "message": f"{kind} profiler not running"}
+            return res, None
+        return None, {"code": 32602, "message": f"Invalid profile action: {action}"}
+
+    @classmethod
+    def method_capabilities(cls, params):
+        """
+        What negotiate accepts: framings, encodings (msgpack only when it is
+        installed), compressions and the size from which responses are
+        compressed
+        """
+        return {
+            "framings": list(SUPPORTED_FRAMINGS),
+            "encodings": list(supported_encodings()),
+            "compressions": list(SUPPORTED_COMPRESSIONS),
+            "compress_threshold": COMPRESS_THRESHOLD,
+            "max_frame_size": MAX_FRAME_SIZE,
+        }, None
+
+    @classmethod
+    def method_startup_timing(cls, params):
+        """
+        Startup phase durations, total is None until aider started
+        """
+        return startup_timer.as_dict(), None
+
+    def method_activate(self, params):
+        """
+        Start aider in a standby server
+        Params: { "cwd": str, "args": [str] }
+        """
+        if not store.standby:
+            return None, {"code": 32603, "message": "Not a standby server"}
+        params = params or {}
+        cwd, args = params.get("cwd"), params.get("args") or []
+        if not cwd or not os.path.isdir(cwd):
+            return None, {"code": 32602, "message": "Invalid cwd"}
+        # split like the shell does for the cmd string of a normal start
+        if not store.activate(cwd, shlex.split(" ".join(args))):
+            return None, {"code": 32603, "message": "Already activated"}
+        return "activated", None
+
+    def method_open_session(self, params):
+        """
+        Host mode: start an aider session, attach an rpc connection and the
+        terminal (attach_client.py) to it
+        Params: { "cwd": str?, "args": [str] }
+        returns { "session", "terminal_port", ... }
+        """
+        host = session_host.host
+        if host is None:
+            return None, {"code": 32603, "message": "Not a host server"}
+        params = params or {}
+        cwd = params.get("cwd")
+        if cwd and os.path.realpath(cwd) != os.path.realpath(host.cwd):
+            # the cwd is process wide
+            return None, {"code": 32602, "message": f"Host runs in {host.cwd}"}
+        args = shlex.split(" ".join(params.get("args") or []))
+        return host.open(args).as_dict(), None
+
+    def method_list_sessions(self, params):
+        """
+        Host mode: the running sessions
+        """
+        host = session_host.host
+        if host is None:
+            return [], None
+        return host.list(), None
 
     def method_exit(self, params):
         """
-        exit aider
+        exit aider, in host mode only the session of the connection
         """
+        host = session_host.host
+        session = host and host.find(current_store.get())
+        if session is not None:
+            session.close()
+            return "session closed", None
         store.add_notify_message(
             {"type": NotifyType.AIDER_EXIT, "message": "aider exited"}
         )
         time.sleep(0.1)
-        os._exit(0)
+        # imported here, server imports this module
+        from backend_server.server import exit_process
+
+        exit_process(0)
+
+    def method_get_modify_history(self, params):
+        """
+        modified_info of every command, oldest first
+        Params: { "since": int? } only the commands from index since
+        """
+        since = (params or {}).get("since", 0) if isinstance(params, dict) else 0
+        return store.modify_history[since:], None
+
+    def method_checkpoint(self, params):
+        """
+        Write a checkpoint of the session now
+        Params: { "path": str?, "auto": bool? } path defaults to the auto
+            checkpoint path. auto true: also write to path in the background
+            after every command, false: stop that
+        returns { "path", "bytes", "ms" }
+        """
+        if not store.coder:
+            return None, {"code": 32603, "message": "CoderNotInit"}
+        if store.running:
+            return None, {"code": 32603, "message": "Server is running"}
+        params = params if isinstance(params, dict) else {}
+        path = params.get("path") or store.checkpoint_path
+        if not path:
+            return None, {"code": 32602, "message": "Invalid path"}
+        if params.get("auto") is not None:
+            store.checkpoint_path = path if params["auto"] else None
+        res = checkpoint.write(path, checkpoint.capture(store))
+        if "error" in res:
+            return None, {"code": 32603, "message": res["error"]}
+        return res, None
+
+    def method_restore_checkpoint(self, params):
+        """
+        Restore a checkpoint written by checkpoint: the histories, command
+        ranges and modify history, the files in the chat and the chat
+        messages. The output of this session so far follows the restored
+        output, clients subscribe again. The model is not switched.
+        Params: { "path": str }
+        returns { "output_lines", "chat_lines", "commands", "ms", "missing_files",
+                  "main_model" } main_model of the checkpoint
+        """
+        if not store.coder:
+            return None, {"code": 32603, "message": "CoderNotInit"}
+        if store.running:
+            return None, {"code": 32603, "message": "Server is running"}
+        path = (params or {}).get("path") if isinstance(params, dict) else None
+        if not path or not os.path.isfile(path):
+            return None, {"code": 32602, "message": "Invalid path"}
+        start = time.perf_counter()
+        try:
+            restored = checkpoint.load_checkpoint(path, store.history_dir)
+        except checkpoint.CheckpointError as e:
+            return None, {"code": 32603, "message": str(e)}
+        metadata = restored.metadata
+        with store.write_lock:
+            store.restore_histories(restored)
+            store.modify_history = metadata["modify_history"] + store.modify_history
+            coder = store.coder
+            # files that were accepted before, aider's /add checks are skipped
+            missing = [
+                fname
+                for fname in metadata["added"] + metadata["readonly"]
+                if not os.path.isfile(fname)
+            ]
+            coder.abs_fnames = {f for f in metadata["added"] if f not in missing}
+            coder.abs_read_only_fnames = {
+                f for f in metadata["readonly"] if f not in missing
+            }
+            coder.done_messages = metadata["done_messages"]
+            coder.cur_messages = metadata["cur_messages"]
+        store.refresh_state()
+        return {
+            "output_lines": len(store.output_history),
+            "chat_lines": len(store.chat_history),
+            "commands": len(store.modify_history),
+            "ms": round((time.perf_counter() - start) * 1000, 3),
+            "missing_files": missing,
+            "main_model": metadata.get("main_model"),
+        }, None
 
     def method_save(self, params: str):
         """
@@ -6,3 +6,4 @@ class NotifyType:
     CONFIRM_ASK = "confirm_ask"
     CONFIRM_COMPLETE = "confirm_complete"
     AIDER_EXIT = "aider_exit"
+    FIX_PROGRESS = "fix_progress"
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Plan the LLM requests of fix diagnostics: drop duplicate diagnostics and
+pack small files into one request up to a token budget.
+"""
+from typing import Callable, List, Optional, TypedDict
+
+from backend_server.store import Diagnostic, FileDiagnostics
+
+DEFAULT_TOKEN_BUDGET = 2000
+
+
+class FixRequest(TypedDict):
+    items: List[FileDiagnostics]
+    tokens: int
+
+
+def dedupe_diagnostics(diagnostics: List[Diagnostic]) -> List[Diagnostic]:
+    """
+    Drop repeated diagnostics, the same message at the same position is
+    often reported by several sources or namespaces
+    """
+    seen = set()
+    ret = []
+    for diagnostic in diagnostics:
+        key = (
+            diagnostic.get("lnum"),
+            diagnostic.get("col"),
+            diagnostic.get("end_lnum"),
+            diagnostic.get("code"),
+            diagnostic.get("message"),
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        ret.append(diagnostic)
+    return ret
+
+
+def plan_requests(
+    items: List[FileDiagnostics],
+    prompts: List[str],
+    token_count: Optional[Callable[[str], int]] = None,
+    budget: int = DEFAULT_TOKEN_BUDGET,
+) -> List[FixRequest]:
+    """
+    Pack files into requests of at most ``budget`` prompt tokens, first fit
+    in file order. A file over the budget gets a request of its own, a
+    budget <= 0 gives one request per file.
+    """
+    count = token_count or (lambda text: len(text) // 4)
+    requests: List[FixRequest] = []
+    for item, prompt in zip(items, prompts, strict=True):
+        tokens = count(prompt)
+        if budget > 0:
+            for request in requests:
+                if request["tokens"] + tokens <= budget:
+                    request["items"].append(item)
+                    request["tokens"] += tokens
+                    break
+            else:
+                requests.append({"items": [item], "tokens": tokens})
+        else:
+            requests.append({"items": [item], "tokens": tokens})
+    return requests
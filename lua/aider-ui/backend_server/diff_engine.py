@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Line diff engine for change summaries.
+
+Lines are interned to integers, the common prefix/suffix is trimmed and
+the rest is diffed with Myers' O(ND) algorithm. Diffs with a very large
+edit distance fall back to difflib over the interned lines. Several files
+are diffed in parallel on a process pool.
+"""
+import difflib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+
+log = logging.getLogger(__name__)
+
+# (tag, i1, i2, j1, j2), same meaning as difflib opcodes
+Opcode = Tuple[str, int, int, int, int]
+
+DEFAULT_CONTEXT = 3
+# above this edit distance Myers' trace gets too large, use difflib instead
+MAX_EDIT_DISTANCE = 4000
+# diff inline below this total size, a worker round trip costs more
+PARALLEL_MIN_BYTES = 256 * 1024
+MAX_WORKERS = 4
+
+
+class Hunk(TypedDict):
+    header: str  # "@@ -1,3 +1,4 @@"
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str]  # prefixed with " ", "-" or "+"
+
+
+class DiffResult(TypedDict):
+    added: int
+    removed: int
+    hunks: List[Hunk]
+
+
+def _intern(a: Sequence[str], b: Sequence[str]) -> Tuple[List[int], List[int]]:
+    ids: Dict[str, int] = {}
+    return (
+        [ids.setdefault(line, len(ids)) for line in a],
+        [ids.setdefault(line, len(ids)) for line in b],
+    )
+
+
+def _myers(a: List[int], b: List[int]) -> Optional[List[Opcode]]:
+    """
+    Opcodes turning a into b, None if the edit distance is over
+    MAX_EDIT_DISTANCE
+    """
+    n, m = len(a), len(b)
+    max_d = min(n + m, MAX_EDIT_DISTANCE)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    # trace[d]: v for k in [-d - 1, d + 1] at the start of step d
+    trace: List[List[int]] = []
+    found = False
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1 : offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                found = True
+                break
+        if found:
+            break
+    if not found:
+        return None
+
+    # backtrack, collecting single line moves from the end
+    moves: List[Tuple[str, int, int]] = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        tv = trace[d]
+        k = x - y
+        if k == -d or (k != d and tv[k - 1 + d + 1] < tv[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = tv[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            moves.append(("equal", x, y))
+        if d > 0:
+            if x == prev_x:
+                moves.append(("insert", prev_x, prev_y))
+            else:
+                moves.append(("delete", prev_x, prev_y))
+        x, y = prev_x, prev_y
+    moves.reverse()
+
+    opcodes: List[Opcode] = []
+    for tag, i, j in moves:
+        di, dj = (1, 1) if tag == "equal" else (1, 0) if tag == "delete" else (0, 1)
+        if opcodes and opcodes[-1][0] == tag:
+            _, i1, i2, j1, j2 = opcodes[-1]
+            opcodes[-1] = (tag, i1, i2 + di, j1, j2 + dj)
+        else:
+            opcodes.append((tag, i, i + di, j, j + dj))
+    return opcodes
+
+
+def _difflib_opcodes(a: List[int], b: List[int]) -> List[Opcode]:
+    """
+    Fallback for large edit distances, replace is split into delete + insert
+    """
+    opcodes: List[Opcode] = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "replace":
+            opcodes.append(("delete", i1, i2, j1, j1))
+            opcodes.append(("insert", i2, i2, j1, j2))
+        else:
+            opcodes.append((tag, i1, i2, j1, j2))
+    return opcodes
+
+
+def get_opcodes(a: Sequence[str], b: Sequence[str]) -> List[Opcode]:
+    ia, ib = _intern(a, b)
+    n, m = len(ia), len(ib)
+    prefix = 0
+    while prefix < n and prefix < m and ia[prefix] == ib[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < n - prefix
+        and suffix < m - prefix
+        and ia[n - suffix - 1] == ib[m - suffix - 1]
+    ):
+        suffix += 1
+
+    middle = _myers(ia[prefix : n - suffix], ib[prefix : m - suffix])
+    if middle is None:
+        middle = _difflib_opcodes(ia[prefix : n - suffix], ib[prefix : m - suffix])
+
+    opcodes: List[Opcode] = []
+    if prefix:
+        opcodes.append(("equal", 0, prefix, 0, prefix))
+    for tag, i1, i2, j1, j2 in middle:
+        if i1 == i2 and j1 == j2:
+            continue
+        opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+    if suffix:
+        opcodes.append(("equal", n - suffix, n, m - suffix, m))
+    return opcodes
+
+
+def _group_opcodes(opcodes: List[Opcode], context: int) -> List[List[Opcode]]:
+    """
+    Split opcodes into hunks with up to ``context`` lines around changes
+    """
+    groups: List[List[Opcode]] = []
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != "equal":
+            group.append((tag, i1, i2, j1, j2))
+            continue
+        if not group:
+            # leading context of the first change
+            start = max(i1, i2 - context)
+            group.append((tag, start, i2, j2 - (i2 - start), j2))
+            continue
+        if i2 - i1 > 2 * context:
+            group.append((tag, i1, i1 + context, j1, j1 + context))
+            groups.append(group)
+            group = [(tag, i2 - context, i2, j2 - context, j2)]
+        else:
+            group.append((tag, i1, i2, j1, j2))
+    if group:
+        tag, i1, i2, j1, j2 = group[-1]
+        if tag == "equal":
+            group[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+        groups.append(group)
+    return [g for g in groups if any(op[0] != "equal" for op in g)]
+
+
+def _format_range(start: int, stop: int) -> Tuple[int, int, str]:
+    """
+    unified diff range, same convention as difflib.unified_diff
+    """
+    beginning = start + 1
+    length = stop - start
+    if not length:
+        beginning -= 1
+    text = f"{beginning}" if length == 1 else f"{beginning},{length}"
+    return beginning, length, text
+
+
+def diff_lines(
+    a: Sequence[str], b: Sequence[str], context: int = DEFAULT_CONTEXT
+) -> DiffResult:
+    added = removed = 0
+    opcodes = get_opcodes(a, b)
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "delete":
+            removed += i2 - i1
+        elif tag == "insert":
+            added += j2 - j1
+
+    hunks: List[Hunk] = []
+    for group in _group_opcodes(opcodes, context):
+        old_start, old_count, old_range = _format_range(group[0][1], group[-1][2])
+        new_start, new_count, new_range = _format_range(group[0][3], group[-1][4])
+        lines: List[str] = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines.extend(" " + line for line in a[i1:i2])
+            elif tag == "delete":
+                lines.extend("-" + line for line in a[i1:i2])
+            else:
+                lines.extend("+" + line for line in b[j1:j2])
+        hunks.append(
+            {
+                "header": f"@@ -{old_range} +{new_range} @@",
+                "old_start": old_start,
+                "old_count": old_count,
+                "new_start": new_start,
+                "new_count": new_count,
+                "lines": lines,
+            }
+        )
+    return {"added": added, "removed": removed, "hunks": hunks}
+
+
+def _read_lines(path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read().splitlines()
+
+
+def diff_files(
+    before_path: Optional[str],
+    after_path: Optional[str],
+    context: int = DEFAULT_CONTEXT,
+) -> DiffResult:
+    """
+    Diff two files, a missing path counts as an empty file
+    """
+    try:
+        return diff_lines(_read_lines(before_path), _read_lines(after_path), context)
+    except Exception as e:
+        log.error("diff failed %s: %s", before_path, e)
+        return {"added": 0, "removed": 0, "hunks": []}
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: workers do not inherit aider's threads and memory.
+            # The server preloads only this module, the workers still import
+            # aider_server.py as __mp_main__, which is cheap outside __main__.
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, MAX_WORKERS),
+                mp_context=ctx,
+            )
+        return _pool
+
+
+def _file_size(path: Optional[str]) -> int:
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def diff_file_pairs(
+    pairs: Sequence[Tuple[Optional[str], Optional[str]]],
+    context: int = DEFAULT_CONTEXT,
+) -> List[DiffResult]:
+    """
+    Diff (before_path, after_path) pairs, in parallel when it pays off
+    """
+    total = sum(_file_size(before) + _file_size(after) for before, after in pairs)
+    if len(pairs) < 2 or total < PARALLEL_MIN_BYTES:
+        return [diff_files(before, after, context) for before, after in pairs]
+    try:
+        pool = _get_pool()
+        futures = [
+            pool.submit(diff_files, before, after, context) for before, after in pairs
+        ]
+        return [future.result() for future in futures]
+    except Exception as e:
+        log.error("parallel diff failed, diff inline: %s", e)
+        return [diff_files(before, after, context) for before, after in pairs]
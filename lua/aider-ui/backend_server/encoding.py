@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+RPC message encoding and compression, negotiated per connection.
+
+JSON stays the default. With the ``length`` framing a client can ask
+``negotiate`` for ``msgpack`` and for ``zlib`` compression, the flags byte
+of every frame tells how its payload is encoded, so both sides may mix:
+
+- ``FLAG_MSGPACK``: payload is msgpack, otherwise JSON
+- ``FLAG_ZLIB``: payload is zlib compressed, only set on payloads of at
+  least ``COMPRESS_THRESHOLD`` bytes
+
+Requests are decoded by their own flags, a client that reads msgpack
+responses may keep sending JSON requests. msgpack is optional, without it
+only JSON is offered.
+"""
+import json
+import zlib
+from typing import Any, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+
+# smaller payloads don't win enough to pay for the compression
+COMPRESS_THRESHOLD = 64 * 1024
+# fastest level, the large payloads are repetitive text
+COMPRESS_LEVEL = 1
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    if msgpack is None:
+        return (ENCODING_JSON,)
+    return (ENCODING_JSON, ENCODING_MSGPACK)
+
+
+SUPPORTED_COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_ZLIB)
+
+
+class EncodeError(Exception):
+    pass
+
+
+class Codec:
+    """
+    Encoding of one connection's outgoing messages
+    """
+
+    def __init__(
+        self,
+        encoding: str = ENCODING_JSON,
+        compression: str = COMPRESSION_NONE,
+        compress_threshold: int = COMPRESS_THRESHOLD,
+    ):
+        self.encoding = encoding
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+
+    def encode(self, data: Any) -> Tuple[int, bytes]:
+        """
+        Return (frame flags, payload)
+        """
+        if self.encoding == ENCODING_MSGPACK:
+            flags, payload = FLAG_MSGPACK, msgpack.packb(data, use_bin_type=True)
+        else:
+            flags, payload = 0, json.dumps(data).encode()
+        if (
+            self.compression == COMPRESSION_ZLIB
+            and len(payload) >= self.compress_threshold
+        ):
+            flags, payload = flags | FLAG_ZLIB, zlib.compress(payload, COMPRESS_LEVEL)
+        return flags, payload
+
+
+def decode(flags: int, payload: bytes) -> Any:
+    """
+    Decode a payload by its frame flags, raises EncodeError
+    """
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        if flags & FLAG_MSGPACK:
+            if msgpack is None:
+                raise EncodeError("msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        return json.loads(payload)
+    except EncodeError:
+        raise
+    except Exception as e:
+        # zlib.error, msgpack's and json's decode errors share no base class
+        raise EncodeError(str(e)) from e
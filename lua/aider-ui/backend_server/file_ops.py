@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+File context operations (/add, /read-only, /drop) as one ordered log.
+
+A later operation on a file replaces the earlier one, so draining the log
+gives the final state of every file, applied with one aider command per
+kind instead of one per file and request.
+"""
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+ADD = "add"
+READ_ONLY = "read_only"
+DROP = "drop"
+
+# drops go first: aider's /drop matches by substring and would also remove
+# a file added in the same batch
+APPLY_ORDER = (DROP, ADD, READ_ONLY)
+
+COMMANDS = {
+    ADD: "cmd_add",
+    READ_ONLY: "cmd_read_only",
+    DROP: "cmd_drop",
+}
+
+# (op, paths) in apply order
+FileOps = List[Tuple[str, List[str]]]
+
+
+def quote_filename(path: str) -> str:
+    """
+    aider splits command args on whitespace unless the name is double quoted
+    """
+    if any(c.isspace() for c in path):
+        return f'"{path}"'
+    return path
+
+
+def join_filenames(paths: Iterable[str]) -> str:
+    return " ".join(quote_filename(path) for path in paths)
+
+
+class FileOpLog:
+    def __init__(self):
+        self._lock = Lock()
+        # path -> op, dict order is the order files were last touched
+        self._ops: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def record(self, op: str, paths: Iterable[str]):
+        assert op in COMMANDS, op
+        with self._lock:
+            for path in paths:
+                # move to the end, the log stays in order of the last operation
+                self._ops.pop(path, None)
+                self._ops[path] = op
+
+    def drain(self) -> FileOps:
+        """
+        Take the coalesced operations, the log is empty afterwards
+        """
+        with self._lock:
+            ops, self._ops = self._ops, {}
+        grouped: Dict[str, List[str]] = {op: [] for op in APPLY_ORDER}
+        for path, op in ops.items():
+            grouped[op].append(path)
+        return [(op, grouped[op]) for op in APPLY_ORDER if grouped[op]]
+
+
+def apply_file_ops(commands, ops: FileOps):
+    """
+    Run one aider command per operation kind, commands is a Commands
+    """
+    for op, paths in ops:
+        getattr(commands, COMMANDS[op])(join_filenames(paths))
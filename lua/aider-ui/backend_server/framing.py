@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+RPC wire framing.
+
+Two framings are understood on the same connection:
+
+- ``delimiter``: legacy, every message ends with ``END_OF_MESSAGE``
+- ``length``: every message starts with a 5 byte header, one flags byte
+  followed by the payload length as big-endian uint32
+
+Connections always start in ``delimiter`` mode, a client switches to
+``length`` by calling the ``negotiate`` method, so old clients keep working.
+The rpc flags byte tells the payload encoding, see encoding.py.
+"""
+import struct
+from typing import List, Optional, Tuple
+
+END_OF_MESSAGE = b"\r\n\r\n"
+
+FRAMING_DELIMITER = "delimiter"
+FRAMING_LENGTH = "length"
+SUPPORTED_FRAMINGS = (FRAMING_DELIMITER, FRAMING_LENGTH)
+
+# flags (uint8), payload length (uint32)
+FRAME_HEADER = struct.Struct(">BI")
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+RECV_BUFFER_SIZE = 256 * 1024
+
+
+class FrameError(Exception):
+    pass
+
+
+class FrameReader:
+    """
+    Incremental frame decoder backed by one reusable bytearray.
+
+    Socket data is received straight into the free tail of the buffer
+    (see ``get_buffer``/``buffer_updated``), consumed bytes are only moved
+    when the buffer is compacted, so decoding stays linear in payload size.
+    """
+
+    def __init__(
+        self, framing: str = FRAMING_DELIMITER, buffer_size: int = RECV_BUFFER_SIZE
+    ):
+        self.framing = framing
+        self.min_free = buffer_size
+        self._buf = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        # delimiter mode: bytes before this offset are known to be delimiter free
+        self._scan = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def set_framing(self, framing: str):
+        if framing not in SUPPORTED_FRAMINGS:
+            raise FrameError(f"Unsupported framing: {framing}")
+        self.framing = framing
+        self._scan = self._start
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """
+        Return a writable view of the free tail, at least ``sizehint`` bytes
+        (or ``min_free`` when there is no hint).
+        """
+        needed = max(sizehint, self.min_free)
+        if self.framing == FRAMING_LENGTH and len(self) >= FRAME_HEADER.size:
+            # reserve room for the whole pending frame to receive it in place
+            _, length = FRAME_HEADER.unpack_from(self._buf, self._start)
+            needed = max(needed, FRAME_HEADER.size + length - len(self))
+        self._reserve(needed)
+        return memoryview(self._buf)[self._end :]
+
+    def buffer_updated(self, nbytes: int):
+        self._end += nbytes
+
+    def feed(self, data: bytes):
+        """
+        Copy ``data`` into the buffer, for callers without a recv_into path.
+        """
+        self._reserve(len(data))
+        self._buf[self._end : self._end + len(data)] = data
+        self._end += len(data)
+
+    def next_frame(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Pop the next complete message as ``(flags, payload)``, None if more
+        data is needed.
+        """
+        if self.framing == FRAMING_LENGTH:
+            return self._next_length_frame()
+        return self._next_delimited_frame()
+
+    def frames(self) -> List[Tuple[int, bytes]]:
+        frames = []
+        while (frame := self.next_frame()) is not None:
+            frames.append(frame)
+        return frames
+
+    def _next_length_frame(self) -> Optional[Tuple[int, bytes]]:
+        if len(self) < FRAME_HEADER.size:
+            return None
+        flags, length = FRAME_HEADER.unpack_from(self._buf, self._start)
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(f"Frame too large: {length}")
+        frame_end = self._start + FRAME_HEADER.size + length
+        if frame_end > self._end:
+            return None
+        with memoryview(self._buf) as view:
+            payload = bytes(view[self._start + FRAME_HEADER.size : frame_end])
+        self._consume(frame_end)
+        return flags, payload
+
+    def _next_delimited_frame(self) -> Optional[Tuple[int, bytes]]:
+        idx = self._buf.find(END_OF_MESSAGE, self._scan, self._end)
+        if idx < 0:
+            self._scan = max(self._end - len(END_OF_MESSAGE) + 1, self._start)
+            if len(self) > MAX_FRAME_SIZE:
+                raise FrameError("Message too large")
+            return None
+        with memoryview(self._buf) as view:
+            payload = bytes(view[self._start : idx])
+        self._consume(idx + len(END_OF_MESSAGE))
+        return 0, payload
+
+    def _consume(self, offset: int):
+        self._start = offset
+        self._scan = offset
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+
+    def _reserve(self, size: int):
+        if len(self._buf) - self._end >= size:
+            return
+        pending = len(self)
+        if self._start and pending + size <= len(self._buf):
+            # compact: move the unread bytes to the front
+            self._buf[:pending] = self._buf[self._start : self._end]
+        else:
+            new_buf = bytearray(max(len(self._buf) * 2, pending + size))
+            new_buf[:pending] = self._buf[self._start : self._end]
+            self._buf = new_buf
+        self._scan -= self._start
+        self._start, self._end = 0, pending
+
+
+def encode_frame(payload: bytes, framing: str, flags: int = 0) -> List[bytes]:
+    """
+    Return the buffers to write for one message, the payload is not copied.
+    """
+    if framing == FRAMING_LENGTH:
+        return [FRAME_HEADER.pack(flags, len(payload)), payload]
+    return [payload, END_OF_MESSAGE]
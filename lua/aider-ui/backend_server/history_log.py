@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import struct
+from collections import deque
+from threading import RLock
+from typing import Iterable, Iterator, List, Optional, Tuple, Union, overload
+
+# end offset of each line in the data file
+INDEX_ENTRY = struct.Struct("<Q")
+DEFAULT_MEMORY_LINES = 4096
+
+
+class _MappedFile:
+    """
+    Read-only mmap of an append-only file, remapped when it has grown.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+
+    def view(self, size: int) -> mmap.mmap:
+        if self._map is None or len(self._map) < size:
+            self.close()
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class HistoryLog:
+    """
+    Append-only list of lines stored on disk.
+
+    Lines are written to ``<path>.log`` and their end offsets to
+    ``<path>.idx`` (fixed width, so line ``i`` is found in O(1)). The most
+    recent ``memory_lines`` lines stay in an in-memory ring, older ranges
+    are read back through mmap. Supports ``len``, indexing, slicing and
+    iteration like the list it replaces.
+    """
+
+    def __init__(self, path: str, memory_lines: int = DEFAULT_MEMORY_LINES):
+        self.path = path
+        self.data_path = f"{path}.log"
+        self.index_path = f"{path}.idx"
+        self._lock = RLock()
+        self._data_file = open(self.data_path, "ab")
+        self._index_file = open(self.index_path, "ab")
+        self._data_map = _MappedFile(self.data_path)
+        self._index_map = _MappedFile(self.index_path)
+        self._count = os.path.getsize(self.index_path) // INDEX_ENTRY.size
+        self._data_size = os.path.getsize(self.data_path)
+        # lines [_count - len(_ring), _count) are kept in memory
+        self._ring: deque = deque(maxlen=max(memory_lines, 1))
+        self._flushed_count = self._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, line: str):
+        data = line.encode("utf-8", errors="surrogateescape")
+        with self._lock:
+            self._data_size += len(data)
+            self._data_file.write(data)
+            self._index_file.write(INDEX_ENTRY.pack(self._data_size))
+            self._ring.append(line)
+            self._count += 1
+
+    def extend(self, lines: Iterable[str]):
+        with self._lock:
+            for line in lines:
+                self.append(line)
+
+    @overload
+    def __getitem__(self, key: int) -> str: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> List[str]: ...
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[str, List[str]]:
+        with self._lock:
+            if isinstance(key, slice):
+                start, stop, step = key.indices(self._count)
+                if step != 1:
+                    return [self._get_line(i) for i in range(start, stop, step)]
+                return self._get_range(start, stop)
+            if key < 0:
+                key += self._count
+            if not 0 <= key < self._count:
+                raise IndexError("history index out of range")
+            return self._get_line(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start: int, stop: int, chunk: int = 1024) -> Iterator[str]:
+        """
+        Iterate lines [start, stop) reading ``chunk`` lines at a time
+        """
+        for pos in range(start, stop, chunk):
+            yield from self[pos : min(pos + chunk, stop)]
+
+    def _ring_start(self) -> int:
+        return self._count - len(self._ring)
+
+    def _get_line(self, idx: int) -> str:
+        ring_start = self._ring_start()
+        if idx >= ring_start:
+            return self._ring[idx - ring_start]
+        return self._read_disk(idx, idx + 1)[0]
+
+    def _get_range(self, start: int, stop: int) -> List[str]:
+        if start >= stop:
+            return []
+        ring_start = self._ring_start()
+        if start >= ring_start:
+            ring = self._ring
+            return [ring[i - ring_start] for i in range(start, stop)]
+        lines = self._read_disk(start, min(stop, ring_start))
+        if stop > ring_start:
+            lines.extend(self._get_range(ring_start, stop))
+        return lines
+
+    def _offset(self, index_map: mmap.mmap, idx: int) -> int:
+        """
+        start offset of line idx
+        """
+        if idx == 0:
+            return 0
+        return INDEX_ENTRY.unpack_from(index_map, (idx - 1) * INDEX_ENTRY.size)[0]
+
+    def _read_disk(self, start: int, stop: int) -> List[str]:
+        self._flush()
+        index_map = self._index_map.view(stop * INDEX_ENTRY.size)
+        begin = self._offset(index_map, start)
+        end = self._offset(index_map, stop)
+        # an empty file can not be mapped
+        data = self._data_map.view(end)[begin:end] if end > begin else b""
+        lines = []
+        prev = 0
+        for (offset,) in INDEX_ENTRY.iter_unpack(
+            index_map[start * INDEX_ENTRY.size : stop * INDEX_ENTRY.size]
+        ):
+            lines.append(
+                data[prev : offset - begin].decode("utf-8", errors="surrogateescape")
+            )
+            prev = offset - begin
+        return lines
+
+    def checkpoint_view(self) -> Tuple[int, int]:
+        """
+        (lines, data bytes) flushed to disk, the files are append-only, so
+        their first bytes stay valid while more lines are appended
+        """
+        with self._lock:
+            self._flush()
+            return self._count, self._data_size
+
+    def _flush(self):
+        if self._flushed_count == self._count:
+            return
+        self._data_file.flush()
+        self._index_file.flush()
+        self._flushed_count = self._count
+
+    def remove_files(self):
+        """
+        Delete the files of a log nothing is appended to anymore. It stays
+        readable: the files are mapped first, the maps keep the data until
+        the log is closed or garbage collected.
+        """
+        with self._lock:
+            self._flush()
+            if self._count:
+                self._index_map.view(self._count * INDEX_ENTRY.size)
+            if self._data_size:
+                self._data_map.view(self._data_size)
+            for path in (self.data_path, self.index_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_map.close()
+            self._index_map.close()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Host mode: several aider sessions in one process, started with
+``--aider-ui-host``.
+
+Each session runs aider's main in its own thread with its own Store (see
+``current_store``) and its own pseudo terminal. sys.stdin/stdout/stderr are
+replaced by proxies that resolve to the terminal of the current session,
+and threads started from a session inherit its context, so aider's spinner
+and file watcher threads write to the right terminal too. An rpc
+connection is bound to a session with ``attach``.
+
+The working directory is process wide, all sessions of a host share the
+cwd the host was started in.
+"""
+import contextvars
+import ctypes
+import itertools
+import logging
+import os
+import sys
+import threading
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from backend_server.consts import NotifyType
+from backend_server.store import Store, current_store
+from backend_server.terminal import SessionTerminal
+
+log = logging.getLogger(__name__)
+
+current_terminal: ContextVar[Optional[SessionTerminal]] = ContextVar(
+    "current_terminal", default=None
+)
+
+
+class ContextStream:
+    """
+    sys.stdin/stdout/stderr in host mode: the stream of the current
+    session's terminal, the process stream outside of sessions
+    """
+
+    def __init__(self, name: str, default):
+        self._name = name
+        self._default = default
+
+    def _target(self):
+        terminal = current_terminal.get()
+        if terminal is None or terminal.closed:
+            return self._default
+        return getattr(terminal, self._name)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __iter__(self):
+        return iter(self._target())
+
+
+def inherit_context_in_threads():
+    """
+    Run new threads in a copy of the starting thread's context
+    """
+    start = threading.Thread.start
+
+    def start_in_context(self):
+        context = contextvars.copy_context()
+        run = self.run
+        self.run = lambda: context.run(run)
+        return start(self)
+
+    threading.Thread.start = start_in_context
+
+
+def raise_in_thread(thread: threading.Thread, exc_type: type) -> bool:
+    """
+    Raise exc_type in thread the next time it runs python code
+    """
+    if thread.ident is None:
+        return False
+    return (
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(thread.ident), ctypes.py_object(exc_type)
+        )
+        == 1
+    )
+
+
+class HostSession:
+    def __init__(self, host: "SessionHost", session_id: int, args: List[str]):
+        self.host = host
+        self.id = session_id
+        self.args = args
+        self.store = Store()
+        self.terminal = SessionTerminal(on_interrupt=self.interrupt)
+        self.thread = threading.Thread(
+            target=self._run, name=f"aider-session-{session_id}", daemon=True
+        )
+
+    def as_dict(self) -> dict:
+        coder_info = self.store.state.snapshot.coder_info()
+        return {
+            "session": self.id,
+            "terminal_port": self.terminal.port,
+            "args": self.args,
+            "running": self.store.running,
+            "main_model": coder_info and coder_info["main_model"],
+        }
+
+    def interrupt(self) -> bool:
+        """
+        ctrl-c while a command runs, there is no SIGINT for a thread
+        """
+        if not self.store.running:
+            return False
+        return raise_in_thread(self.thread, KeyboardInterrupt)
+
+    def close(self):
+        """
+        End the session, aider sees the terminal closed
+        """
+        self.terminal.close()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            raise_in_thread(self.thread, SystemExit)
+
+    def _run(self):
+        current_store.set(self.store)
+        current_terminal.set(self.terminal)
+        try:
+            self.host.run_session(self.args)
+        except SystemExit:
+            pass
+        except BaseException:
+            log.exception("session %s failed", self.id)
+        finally:
+            log.info("session %s exited", self.id)
+            # wakes the client's notify long-poll
+            self.store.add_notify_message(
+                {"type": NotifyType.AIDER_EXIT, "message": "aider exited"}
+            )
+            self.terminal.close()
+            self.host.remove(self)
+
+
+class SessionHost:
+    def __init__(self, run_session: Callable[[List[str]], None]):
+        # run_session(args): aider's main, called in the session thread
+        self.run_session = run_session
+        self.cwd = os.getcwd()
+        self.sessions: Dict[int, HostSession] = {}
+        self._ids = itertools.count(1)
+        self._lock = Lock()
+
+    def open(self, args: List[str]) -> HostSession:
+        with self._lock:
+            session = HostSession(self, next(self._ids), args)
+            self.sessions[session.id] = session
+        session.thread.start()
+        log.info("session %s opened: %s", session.id, args)
+        return session
+
+    def get(self, session_id) -> Optional[HostSession]:
+        return self.sessions.get(session_id)
+
+    def find(self, store: Store) -> Optional[HostSession]:
+        for session in list(self.sessions.values()):
+            if session.store is store:
+                return session
+        return None
+
+    def remove(self, session: HostSession):
+        with self._lock:
+            self.sessions.pop(session.id, None)
+        # after the client got the exit notification
+        threading.Timer(1, session.store.close).start()
+
+    def list(self) -> List[dict]:
+        return [session.as_dict() for session in list(self.sessions.values())]
+
+
+# set by enable_host_mode, None in a single session server
+host: Optional[SessionHost] = None
+
+
+def enable_host_mode(run_session: Callable[[List[str]], None]) -> SessionHost:
+    global host
+    host = SessionHost(run_session)
+    inherit_context_in_threads()
+    sys.stdin = ContextStream("stdin", sys.stdin)
+    sys.stdout = ContextStream("stdout", sys.stdout)
+    sys.stderr = ContextStream("stderr", sys.stderr)
+    # the sessions' terminals are neovim terminals
+    os.environ.setdefault("TERM", "xterm-256color")
+    return host
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental index of the /code, /ask and /architect entries of aider's
+input history file (prompt_toolkit FileHistory format).
+
+The file is only read from the last parsed offset, and only when its size
+or mtime changed. Entries are kept in file order, pages are served newest
+first.
+"""
+import logging
+import os
+from threading import Lock
+from typing import List, Optional, Tuple, TypedDict
+
+log = logging.getLogger(__name__)
+
+CHAT_COMMANDS = ("/code ", "/ask ", "/architect ")
+DEFAULT_PAGE_SIZE = 50
+
+
+class ChatEntry(TypedDict):
+    cmd: str  # "/code", "/ask" or "/architect"
+    content: str
+
+
+class HistoryPage(TypedDict):
+    entries: List[ChatEntry]  # newest first
+    cursor: Optional[int]  # pass back for the next (older) page, None at the end
+
+
+def _split_strings(data: bytes) -> List[Tuple[int, str]]:
+    """
+    (start offset, history string) of every string in data, which starts
+    at a string boundary. Lines of a string are prefixed with "+", any
+    other line ("# <time>", blank) separates strings.
+    """
+    strings: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    start = 0
+    pos = 0
+    for line_bytes in data.splitlines(keepends=True):
+        if line_bytes.startswith(b"+"):
+            if not lines:
+                start = pos
+            lines.append(line_bytes[1:].decode("utf-8", errors="replace"))
+        elif lines:
+            strings.append((start, "".join(lines)[:-1]))
+            lines = []
+        pos += len(line_bytes)
+    if lines:
+        strings.append((start, "".join(lines)[:-1]))
+    return strings
+
+
+class _ParseState:
+    """
+    Chat entries parsed so far, and the multi-line block in progress.
+    aider stores every line of a "{ ... }" input as its own string.
+    """
+
+    def __init__(self):
+        self.entries: List[ChatEntry] = []
+        self.block: Optional[List[str]] = None
+
+    def copy(self) -> "_ParseState":
+        state = _ParseState()
+        state.entries = []
+        state.block = None if self.block is None else list(self.block)
+        return state
+
+    def feed(self, row: str):
+        if self.block is not None and row.endswith("}"):
+            tail = row.rstrip("}")
+            if tail:
+                self.block.append(tail)
+            self._add("\n".join(self.block))
+            self.block = None
+        elif row.startswith("{"):
+            self.block = []
+            head = row.lstrip("{")
+            if head.endswith("}"):
+                # "{...}" in a single string
+                self.block = None
+                self._add(head.rstrip("}"))
+            elif head:
+                self.block.append(head)
+        elif self.block is not None:
+            self.block.append(row)
+        else:
+            self._add(row)
+
+    def _add(self, text: str):
+        if text.startswith(CHAT_COMMANDS):
+            cmd, content = text.split(" ", 1)
+            self.entries.append({"cmd": cmd, "content": content})
+
+
+class InputHistoryIndex:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self._state = _ParseState()
+        # start of the last string, it may still be written to: parsed again
+        # on every refresh into _tail
+        self._offset = 0
+        self._tail: List[ChatEntry] = []
+        self._stat: Optional[Tuple[int, int, int]] = None  # (ino, size, mtime_ns)
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key == self._stat:
+            return
+        if self._stat and (stat.st_ino != self._stat[0] or stat.st_size < self._offset):
+            # replaced or truncated
+            log.info("input history changed, reindex %s", self.file_path)
+            self._reset()
+        with open(self.file_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        strings = _split_strings(data)
+        for _, row in strings[:-1]:
+            self._state.feed(row)
+        self._tail = []
+        if strings:
+            last_start, last_row = strings[-1]
+            self._offset += last_start
+            tail_state = self._state.copy()
+            tail_state.feed(last_row)
+            self._tail = tail_state.entries
+        self._stat = key
+
+    def __len__(self):
+        with self._lock:
+            self.refresh()
+            return len(self._state.entries) + len(self._tail)
+
+    def get_page(
+        self, cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> HistoryPage:
+        """
+        Up to limit entries older than cursor (newest first), the newest
+        entries without cursor
+        """
+        with self._lock:
+            self.refresh()
+            entries, tail = self._state.entries, self._tail
+            count = len(entries)
+            total = count + len(tail)
+            end = total if cursor is None else max(0, min(cursor, total))
+            start = max(0, end - max(limit, 0))
+            # only the two page slices are concatenated, never entries + tail,
+            # so a page costs O(limit)
+            page = entries[start:end]
+            page += tail[max(start - count, 0) : max(end - count, 0)]
+        page.reverse()
+        return {"entries": page, "cursor": start if start > 0 else None}
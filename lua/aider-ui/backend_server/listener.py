@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import logging
+from threading import RLock
+from typing import Callable
 
 from aider.io import InputOutput
 
-from backend_server.utils import copy_files_to_dir
 from backend_server.store import store
 from backend_server.consts import NotifyType
 
@@ -22,10 +23,23 @@ def listener(func, before_call, after_call=None):
     return wrapper_func
 
 
+def locked(func, get_lock: Callable[[], RLock]):
+    """
+    Serialize calls of func, for coders running in worker threads. The lock
+    is looked up per call, it belongs to the store of the current session.
+    """
+
+    def wrapper_func(self, *args, **kwargs):
+        with get_lock():
+            return func(self, *args, **kwargs)
+
+    return wrapper_func
+
+
 def _on_tool_output(*messages, **kwargs):
     for item in messages:
         if isinstance(item, str):
-            store.output_history.append(item)
+            store.add_output(item)
 
 
 def on_append_chat_history(text, linebreak=False, blockquote=False, strip=True):
@@ -38,7 +52,7 @@ def on_append_chat_history(text, linebreak=False, blockquote=False, strip=True):
             text = text.rstrip()
         text = text + "  "
     for line in text.split("\n"):
-        store.chat_history.append(line)
+        store.add_chat_line(line)
 
 
 def before_confirm(
@@ -98,26 +112,32 @@ def after_confirm(ret, *args, **kwargs):
 
 
 def before_write_text(filename: str, *args, **kwargs):
+    store.tree_contexts.invalidate(filename)
     if filename not in [file["path"] for file in store.change_files["files"]]:
-        # 使用copy_files_to_dir将文件复制到临时目录
-        temp_dir = store.change_files["before_tmp_dir"]
-        file_map = copy_files_to_dir([filename], temp_dir)
-        # 将文件信息添加到change_files
+        # snapshot the content before the first write of this command
         store.change_files["files"].append(
-            {"path": filename, "before_path": file_map.get(filename)}
+            {"path": filename, "before": store.snapshots.put_file(filename)}
         )
 
-def setup_listeners():
-    InputOutput.tool_output = listener(InputOutput.tool_output, _on_tool_output)
-    InputOutput.confirm_ask = listener(
-        InputOutput.confirm_ask,
-        before_confirm,
-        after_confirm,
+
+def setup_listeners(io_cls=InputOutput):
+    """
+    Patch the InputOutput methods aider-ui listens to, io_cls is a stand-in
+    InputOutput for benchmarks
+    """
+    io_cls.tool_output = listener(io_cls.tool_output, _on_tool_output)
+    io_cls.confirm_ask = locked(
+        listener(
+            io_cls.confirm_ask,
+            before_confirm,
+            after_confirm,
+        ),
+        lambda: store.confirm_lock,
     )
-    InputOutput.write_text = listener(
-        InputOutput.write_text, 
-        before_write_text
+    io_cls.write_text = locked(
+        listener(io_cls.write_text, before_write_text),
+        lambda: store.write_lock,
     )
-    InputOutput.append_chat_history = listener(
-        InputOutput.append_chat_history, on_append_chat_history
+    io_cls.append_chat_history = listener(
+        io_cls.append_chat_history, on_append_chat_history
     )
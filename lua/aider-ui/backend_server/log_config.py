@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Logging of aider_server.py.
+
+Records are put on a bounded queue by the calling thread and written to a
+size capped, rotated file by a listener thread, a full queue drops records
+instead of blocking. Messages are truncated to AIDER_UI_LOG_MAX_LEN chars.
+Every process writes its own file: standby, host and session servers run
+side by side, and RotatingFileHandler is not safe across processes. At
+startup the files of exited processes are pruned, only the newest
+AIDER_UI_LOG_KEEP_EXITED are kept, so the directory stays capped.
+
+Environment:
+    AIDER_UI_LOG_FILE       log file, default
+                            /tmp/nvim_aider_logs/nvim_aider-{pid}.log,
+                            "{pid}" is replaced by the process id
+    AIDER_UI_LOG_LEVEL      root level, default INFO
+    AIDER_UI_LOG_LEVELS     per logger levels, "server=DEBUG,store=WARNING",
+                            short names are modules of backend_server
+    AIDER_UI_LOG_MAX_LEN    max message length, default 2000, 0 disables
+    AIDER_UI_LOG_MAX_BYTES  rotate the file at this size, default 10MiB
+    AIDER_UI_LOG_BACKUPS    rotated files kept, default 2
+    AIDER_UI_LOG_KEEP_EXITED  logs of exited processes kept, default 4
+"""
+import atexit
+import glob
+import logging
+import os
+import queue
+import re
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
+DEFAULT_LOG_FILE = "/tmp/nvim_aider_logs/nvim_aider-{pid}.log"
+DEFAULT_MAX_LEN = 2000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 2
+DEFAULT_KEEP_EXITED = 4
+QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def truncate(message: str, max_len: int) -> str:
+    if max_len <= 0 or len(message) <= max_len:
+        return message
+    return f"{message[:max_len]}... [{len(message) - max_len} chars truncated]"
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Put records on the queue without blocking, with the message rendered
+    and truncated. Formatting with the file format happens in the listener.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_len: int):
+        super().__init__(log_queue)
+        self.max_len = max_len
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = truncate(record.getMessage(), self.max_len)
+        record.args = None
+        if record.exc_info:
+            # tracebacks are not truncated
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    "server=DEBUG,store=warning" -> {"backend_server.server": 10, ...}
+    """
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if not name or not level:
+            continue
+        level_no = logging.getLevelName(level.strip().upper())
+        if not isinstance(level_no, int):
+            continue
+        name = name.strip()
+        if "." not in name and name not in ("root", "__main__", "aider", "litellm"):
+            name = f"backend_server.{name}"
+        levels[name] = level_no
+    return levels
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def prune_logs(log_file: str, keep: int):
+    """
+    Delete the files, rotated ones included, of all but the newest keep
+    exited processes. log_file is the pattern with "{pid}".
+    """
+    if "{pid}" not in log_file:
+        return
+    prefix, suffix = log_file.split("{pid}", 1)
+    name_re = re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix))
+    exited: Dict[int, List[str]] = {}
+    for path in glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix) + "*"):
+        match = name_re.match(path)
+        if match is None:
+            continue
+        pid = int(match.group(1))
+        if pid != os.getpid() and not _pid_alive(pid):
+            exited.setdefault(pid, []).append(path)
+
+    def newest(paths: List[str]) -> float:
+        try:
+            return max(os.path.getmtime(path) for path in paths)
+        except OSError:
+            return 0
+
+    by_age = sorted(exited.values(), key=newest, reverse=True)
+    for paths in by_age[max(keep, 0) :]:
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def setup_logging():
+    """
+    Replace logging.basicConfig, safe to call more than once
+    """
+    global _listener
+    if _listener is not None:
+        return
+    env = os.environ
+    log_file = env.get("AIDER_UI_LOG_FILE") or DEFAULT_LOG_FILE
+    prune_logs(
+        log_file, int(env.get("AIDER_UI_LOG_KEEP_EXITED") or DEFAULT_KEEP_EXITED)
+    )
+    log_path = log_file.replace("{pid}", str(os.getpid()))
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_path,
+        maxBytes=int(env.get("AIDER_UI_LOG_MAX_BYTES") or DEFAULT_MAX_BYTES),
+        backupCount=int(env.get("AIDER_UI_LOG_BACKUPS") or DEFAULT_BACKUPS),
+        encoding="utf-8",
+        delay=True,
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+    max_len = int(env.get("AIDER_UI_LOG_MAX_LEN") or DEFAULT_MAX_LEN)
+    root = logging.getLogger()
+    root.addHandler(TruncatingQueueHandler(log_queue, max_len))
+    root_level = logging.getLevelName(env.get("AIDER_UI_LOG_LEVEL", "INFO").upper())
+    root.setLevel(root_level if isinstance(root_level, int) else logging.INFO)
+    for name, level in parse_levels(env.get("AIDER_UI_LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Flush the queued records
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
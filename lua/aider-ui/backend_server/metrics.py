@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+In-process server metrics: per rpc method latency histograms with fixed
+buckets, requests in flight and bytes in/out. Read with the stats rpc.
+"""
+import time
+from threading import Lock
+from typing import Dict, List, Optional, TypedDict
+
+# upper bounds in ms, the last bucket catches everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class HistogramData(TypedDict):
+    count: int
+    errors: int
+    total_ms: float
+    max_ms: float
+    p50_ms: Optional[float]  # bucket upper bound, None if over the last one
+    p90_ms: Optional[float]
+    p99_ms: Optional[float]
+    buckets: Dict[str, int]  # "<=5": count, ">30000": count
+
+
+class Histogram:
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float, error: bool = False):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else None
+        return None
+
+    def as_dict(self) -> HistogramData:
+        # the last count is the overflow bucket
+        buckets = {
+            f"<={bound}": n
+            for bound, n in zip(BUCKETS_MS, self.counts[:-1], strict=True)
+            if n
+        }
+        if self.counts[-1]:
+            buckets[f">{BUCKETS_MS[-1]}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.monotonic()
+            self.methods: Dict[str, Histogram] = {}
+            # requests in flight are still running, keep counting them
+            self.max_in_flight = self.in_flight
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.messages_out = 0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, method: str, seconds: float, error: bool = False):
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            histogram = self.methods.get(method)
+            if histogram is None:
+                histogram = self.methods[method] = Histogram()
+            histogram.observe(seconds * 1000, error)
+
+    def add_in(self, nbytes: int):
+        with self._lock:
+            self.bytes_in += nbytes
+
+    def add_out(self, nbytes: int):
+        """
+        a written response or notification
+        """
+        with self._lock:
+            self.bytes_out += nbytes
+            self.messages_out += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "uptime": round(time.monotonic() - self.started_at, 3),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "messages_out": self.messages_out,
+                "methods": {
+                    name: histogram.as_dict()
+                    for name, histogram in sorted(self.methods.items())
+                },
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Search over the output history.
+
+``CommandRanges`` records the output index range of every command, so a
+search can be limited to one command's output. ``search_lines`` scans a
+range of a HistoryLog in chunks and yields the matches in batches, the rpc
+pushes every batch to the client as soon as it is found.
+"""
+import re
+from threading import Lock
+from typing import Iterator, List, NamedTuple, Optional, Pattern, TypedDict
+
+from backend_server.history_log import HistoryLog
+
+# lines read from the history per step
+SCAN_CHUNK = 4096
+# matches per pushed batch
+MATCH_BATCH = 100
+
+
+class CommandRange(NamedTuple):
+    id: int
+    command: str
+    start: int  # first output index of the command
+    end: Optional[int]  # end (exclusive), None while the command runs
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+class CommandRanges:
+    def __init__(self, ranges: Optional[List[CommandRange]] = None):
+        # ids are positions, ranges[i].id == i + 1
+        self._lock = Lock()
+        self._ranges: List[CommandRange] = list(ranges or [])
+
+    def start(self, command: str, start: int) -> int:
+        """
+        A command starts at output index start, returns its id
+        """
+        with self._lock:
+            command_id = len(self._ranges) + 1
+            self._ranges.append(CommandRange(command_id, command, start, None))
+            return command_id
+
+    def complete(self, end: int) -> Optional[CommandRange]:
+        """
+        The running command ends before output index end, nothing if no
+        command is running
+        """
+        with self._lock:
+            if not self._ranges or self._ranges[-1].end is not None:
+                return None
+            self._ranges[-1] = self._ranges[-1]._replace(end=end)
+            return self._ranges[-1]
+
+    def get(self, command_id: int) -> Optional[CommandRange]:
+        with self._lock:
+            if 0 < command_id <= len(self._ranges):
+                return self._ranges[command_id - 1]
+            return None
+
+    def list(self) -> List[CommandRange]:
+        with self._lock:
+            return list(self._ranges)
+
+
+class OutputMatch(TypedDict):
+    line: int  # output index
+    text: str
+    col: int  # span of the first match in text
+    end_col: int
+
+
+def compile_query(
+    query: str, regex: bool = False, ignore_case: bool = False
+) -> Pattern:
+    """
+    Raises re.error for an invalid regex
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    return re.compile(query if regex else re.escape(query), flags)
+
+
+class SearchProgress:
+    """
+    Where a search stopped, filled while search_lines runs
+    """
+
+    def __init__(self):
+        self.matched = 0
+        self.scanned = 0
+        # output index to resume from, None when the range was scanned
+        self.next_index: Optional[int] = None
+
+
+def search_lines(
+    lines: HistoryLog,
+    pattern: Pattern,
+    start: int,
+    end: int,
+    limit: Optional[int],
+    progress: SearchProgress,
+) -> Iterator[List[OutputMatch]]:
+    """
+    Yield batches of matches in [start, end), at most limit matches
+    """
+    batch: List[OutputMatch] = []
+    for chunk_start in range(start, end, SCAN_CHUNK):
+        chunk_end = min(chunk_start + SCAN_CHUNK, end)
+        for idx, text in enumerate(lines[chunk_start:chunk_end], chunk_start):
+            progress.scanned += 1
+            found = pattern.search(text)
+            if found is None:
+                continue
+            batch.append(
+                {
+                    "line": idx,
+                    "text": text,
+                    "col": found.start(),
+                    "end_col": found.end(),
+                }
+            )
+            progress.matched += 1
+            if limit is not None and progress.matched >= limit:
+                if idx + 1 < end:
+                    progress.next_index = idx + 1
+                yield batch
+                return
+            if len(batch) >= MATCH_BATCH:
+                yield batch
+                batch = []
+        if batch:
+            # a chunk's matches are not held back while the next chunk is read
+            yield batch
+            batch = []
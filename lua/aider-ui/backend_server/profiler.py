@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Profilers toggled by the profile rpc in a running server.
+
+cpu: cProfile of the aider commands, enabled around run_one. Up to Python
+3.11 a cProfile.Profile only sees the thread that enabled it, aider's main
+thread. From 3.12 it is built on sys.monitoring and records every thread of
+the process while enabled, rpc threads included.
+memory: tracemalloc of the whole process.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+from threading import Condition, Lock
+from typing import Callable, Optional
+
+log = logging.getLogger(__name__)
+
+PROFILE_KINDS = ("cpu", "memory")
+TRACEMALLOC_FRAMES = 25
+SUMMARY_LINES = 30
+
+
+def default_output_path(kind: str) -> str:
+    suffix = ".prof" if kind == "cpu" else ".tracemalloc"
+    name = f"aider-ui-{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}{suffix}"
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = Lock()
+        self._cpu: Optional[cProfile.Profile] = None
+        self._cpu_path: Optional[str] = None
+        self._memory_path: Optional[str] = None
+        # run calls with the cpu profile enabled, stop waits for them
+        self._cpu_runs = 0
+        self._cpu_idle = Condition(self._lock)
+
+    def status(self) -> dict:
+        return {
+            "cpu": self._cpu is not None,
+            "memory": tracemalloc.is_tracing() and self._memory_path is not None,
+        }
+
+    def start(self, kind: str, path: Optional[str] = None) -> str:
+        """
+        Start profiling, return the file the result is written to on stop
+        """
+        path = path or default_output_path(kind)
+        with self._lock:
+            if kind == "cpu":
+                if self._cpu is None:
+                    self._cpu = cProfile.Profile()
+                self._cpu_path = path
+            else:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._memory_path = path
+        log.info("%s profiling started, output %s", kind, path)
+        return path
+
+    def stop(self, kind: str) -> Optional[dict]:
+        """
+        Stop profiling and write the result, None if it was not running.
+        Return {"path", "summary"}, summary is the top of the result as text.
+        The cpu result is written once the running command left run, a
+        profile still enabled can not be dumped.
+        """
+        with self._lock:
+            if kind == "cpu":
+                profile, path = self._cpu, self._cpu_path
+                self._cpu, self._cpu_path = None, None
+                if profile is None or path is None:
+                    return None
+                self._cpu_idle.wait_for(lambda: self._cpu_runs == 0)
+                return {"path": path, "summary": self._dump_cpu(profile, path)}
+            path = self._memory_path
+            self._memory_path = None
+            if path is None or not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            return {"path": path, "summary": self._dump_memory(snapshot, path)}
+
+    def _dump_cpu(self, profile: cProfile.Profile, path: str) -> str:
+        profile.dump_stats(path)
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_LINES)
+        return out.getvalue()
+
+    def _dump_memory(self, snapshot: tracemalloc.Snapshot, path: str) -> str:
+        snapshot.dump(path)
+        lines = [str(stat) for stat in snapshot.statistics("lineno")[:SUMMARY_LINES]]
+        return "\n".join(lines)
+
+    def run(self, func: Callable, *args, **kwargs):
+        """
+        Call func, with the cpu profiler enabled if it is running
+        """
+        with self._lock:
+            profile = self._cpu
+            if profile is not None:
+                self._cpu_runs += 1
+        if profile is None:
+            return func(*args, **kwargs)
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._cpu_runs -= 1
+                self._cpu_idle.notify_all()
+
+
+profiler = Profiler()
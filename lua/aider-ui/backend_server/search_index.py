@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Inverted token index over an append-only list of lines (the chat history).
+
+Lines are tokenized when they are appended, every token keeps the sorted
+line numbers it occurs in. A query walks the postings of its rarest token
+newest first and checks the other tokens with a binary search, so the cost
+depends on how often the query's tokens occur, not on the history length.
+"""
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+# longer "words" are base64 blobs and the like, nobody searches for them
+MAX_TOKEN_LENGTH = 64
+SNIPPET_WIDTH = 160
+# dump record: token length, postings count, then the token and the postings
+DUMP_RECORD = struct.Struct("<HI")
+POSTINGS_TYPE = "L"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Unique lowercase word tokens of text, in order of appearance
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    return list(dict.fromkeys(t for t in tokens if len(t) <= MAX_TOKEN_LENGTH))
+
+
+def snippet(line: str, tokens: List[str], width: int = SNIPPET_WIDTH) -> str:
+    """
+    At most width characters of line around the first token found
+    """
+    if len(line) <= width:
+        return line
+    lower = line.lower()
+    positions = [pos for pos in (lower.find(t) for t in tokens) if pos >= 0]
+    first = min(positions) if positions else 0
+    start = max(min(first - width // 4, len(line) - width), 0)
+    text = line[start : start + width]
+    if start > 0:
+        text = "..." + text
+    if start + width < len(line):
+        text = text + "..."
+    return text
+
+
+class TokenIndex:
+    def __init__(self):
+        self._lock = Lock()
+        # token -> ascending line numbers
+        self._postings: Dict[str, array] = {}
+
+    def add(self, line_no: int, text: str):
+        """
+        Index a line, line numbers must be added in increasing order
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        with self._lock:
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = array(POSTINGS_TYPE)
+                postings.append(line_no)
+
+    def __len__(self) -> int:
+        """
+        number of distinct tokens
+        """
+        return len(self._postings)
+
+    def dump(self, end: int) -> bytes:
+        """
+        The postings of lines < end, in native byte order
+        """
+        parts = []
+        with self._lock:
+            for token, postings in self._postings.items():
+                count = bisect_left(postings, end)
+                if count == 0:
+                    continue
+                data = token.encode("utf-8")
+                parts.append(DUMP_RECORD.pack(len(data), count))
+                parts.append(data)
+                parts.append(postings[:count].tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def load(cls, buffer) -> "TokenIndex":
+        """
+        An index from dump's bytes, the buffer may be a memoryview of a mmap
+        """
+        index = cls()
+        itemsize = array(POSTINGS_TYPE).itemsize
+        pos = 0
+        while pos < len(buffer):
+            token_length, count = DUMP_RECORD.unpack_from(buffer, pos)
+            pos += DUMP_RECORD.size
+            token = bytes(buffer[pos : pos + token_length]).decode("utf-8")
+            pos += token_length
+            postings = array(POSTINGS_TYPE)
+            postings.frombytes(buffer[pos : pos + count * itemsize])
+            pos += count * itemsize
+            index._postings[token] = postings
+        return index
+
+    def search(
+        self, query: str, limit: int, before: Optional[int] = None
+    ) -> Tuple[List[int], Optional[int]]:
+        """
+        Line numbers containing every token of query, newest first, only
+        lines < before when given. Returns (lines, next_before), pass
+        next_before back for older matches, None when no older line can match.
+        """
+        tokens = tokenize(query)
+        if not tokens or limit <= 0:
+            return [], None
+        with self._lock:
+            postings = [self._postings.get(token) for token in tokens]
+            if any(item is None for item in postings):
+                return [], None
+            postings.sort(key=len)
+            rarest, others = postings[0], postings[1:]
+            end = len(rarest) if before is None else bisect_left(rarest, before)
+            lines: List[int] = []
+            for i in range(end - 1, -1, -1):
+                line_no = rarest[i]
+                if all(_contains(other, line_no) for other in others):
+                    lines.append(line_no)
+                    if len(lines) == limit:
+                        return lines, (line_no if i > 0 else None)
+            return lines, None
+
+
+def _contains(postings: array, line_no: int) -> bool:
+    i = bisect_left(postings, line_no)
+    return i < len(postings) and postings[i] == line_no
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import atexit
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from backend_server import host as session_host
+from backend_server.coder_server_handler import CoderServerHandler
+from backend_server.encoding import (
+    COMPRESSION_NONE,
+    ENCODING_JSON,
+    SUPPORTED_COMPRESSIONS,
+    Codec,
+    EncodeError,
+    decode,
+    supported_encodings,
+)
+from backend_server.framing import (
+    FRAMING_DELIMITER,
+    FRAMING_LENGTH,
+    MAX_FRAME_SIZE,
+    RECV_BUFFER_SIZE,
+    SUPPORTED_FRAMINGS,
+    FrameError,
+    FrameReader,
+    encode_frame,
+)
+from backend_server.log_config import stop_logging
+from backend_server.metrics import metrics
+from backend_server.store import Store, close_stores, current_store, use_store
+
+log = logging.getLogger(__name__)
+
+# notify long-polls park one worker per client, keep enough headroom for them
+RPC_WORKERS = 32
+UNIX_SOCKET_NAME = "rpc.sock"
+
+# private directories of the unix sockets, removed on exit
+_unix_socket_dirs: List[str] = []
+
+
+def remove_unix_sockets():
+    """
+    Also called before os._exit, which skips atexit
+    """
+    while _unix_socket_dirs:
+        shutil.rmtree(_unix_socket_dirs.pop(), ignore_errors=True)
+
+
+atexit.register(remove_unix_sockets)
+
+
+def exit_process(code: int = 0):
+    """
+    Exit right away without waiting for aider's threads. os._exit skips
+    atexit, clean up the unix sockets and the history directories and flush
+    the log queue first.
+    """
+    remove_unix_sockets()
+    close_stores()
+    stop_logging()
+    os._exit(code)
+
+
+def exit_on_signals():
+    """
+    SIGTERM and SIGHUP (neovim exits, the terminal closes) skip atexit too,
+    call from the main thread
+    """
+    for name in ("SIGTERM", "SIGHUP"):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, lambda signum, frame: exit_process(128 + signum))
+
+
+class RpcConnection(asyncio.BufferedProtocol):
+    """
+    One long-lived client connection, requests are matched to responses by
+    the JSON-RPC id, so many requests can be in flight at the same time.
+    """
+
+    def __init__(self, server: "SocketServer"):
+        self.server = server
+        self.handler = CoderServerHandler(push=self.push)
+        self.transport: Optional[asyncio.Transport] = None
+        self.reader = FrameReader()
+        self.framing = FRAMING_DELIMITER
+        self.codec = Codec()
+        self.closed = False
+        # host mode: the store of the session this connection is attached to
+        self.store: Store = current_store.get()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # small responses back to back would wait for the client's delayed ack
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        log.debug("client connected: %s", transport.get_extra_info("peername"))
+
+    def connection_lost(self, exc):
+        self.closed = True
+        with use_store(self.store):
+            self.handler.close()
+        log.debug("client disconnected: %s", exc)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.reader.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self.reader.buffer_updated(nbytes)
+        metrics.add_in(nbytes)
+        try:
+            # frames are popped one by one, negotiate may switch the framing
+            while (frame := self.reader.next_frame()) is not None:
+                self.handle_frame(*frame)
+        except FrameError as e:
+            log.warning("Frame Error: %s", e)
+            if self.transport is not None:
+                self.transport.close()
+
+    def handle_frame(self, flags: int, message: bytes):
+        try:
+            json_data = decode(flags, message)
+        except EncodeError as e:
+            log.warning("Decode Error: %s", e)
+            self.write(b"Invalid JSON")
+            return
+        log.debug("Received JSON: %s", json_data)
+        if not isinstance(json_data, dict):
+            self.write_json(
+                {
+                    "jsonrpc": "2.0",
+                    "error": {"code": 32600, "message": "Invalid Request"},
+                    "result": None,
+                    "id": None,
+                }
+            )
+            return
+        if json_data.get("method") == "negotiate":
+            self.negotiate(json_data)
+            return
+        if json_data.get("method") == "attach":
+            # before the next frame is read, requests after it go to the session
+            self.attach(json_data)
+            return
+        self.server.loop.create_task(self.dispatch(json_data))
+
+    def negotiate(self, json_data: dict):
+        """
+        Switch the connection framing, encoding and compression, the reply
+        still uses the old ones and everything after it the negotiated ones.
+        Params: { "framing": str, "encoding": str?, "compression": str? }
+        Unsupported values fall back to the defaults, the reply has the
+        values in effect. Encoding and compression need the length framing,
+        its flags byte marks them.
+        """
+        params = json_data.get("params")
+        if not isinstance(params, dict):
+            params = {}
+        framing = params.get("framing", FRAMING_DELIMITER)
+        if framing not in SUPPORTED_FRAMINGS:
+            framing = FRAMING_DELIMITER
+        encoding = params.get("encoding", ENCODING_JSON)
+        if framing != FRAMING_LENGTH or encoding not in supported_encodings():
+            encoding = ENCODING_JSON
+        compression = params.get("compression", COMPRESSION_NONE)
+        if framing != FRAMING_LENGTH or compression not in SUPPORTED_COMPRESSIONS:
+            compression = COMPRESSION_NONE
+        codec = Codec(encoding, compression)
+        self.write_json(
+            {
+                "jsonrpc": "2.0",
+                "result": {
+                    "framing": framing,
+                    "max_frame_size": MAX_FRAME_SIZE,
+                    "encoding": encoding,
+                    "compression": compression,
+                    "compress_threshold": codec.compress_threshold,
+                },
+                "id": json_data.get("id"),
+            }
+        )
+        self.reader.set_framing(framing)
+        self.framing = framing
+        self.codec = codec
+
+    def attach(self, json_data: dict):
+        """
+        Host mode: bind the connection to a session
+        Params: { "session": id }
+        """
+        params = json_data.get("params")
+        if not isinstance(params, dict):
+            params = {}
+        host = session_host.host
+        session = host and host.get(params.get("session"))
+        if session is None:
+            self.write_json(
+                {
+                    "jsonrpc": "2.0",
+                    "error": {"code": 32602, "message": "Unknown session"},
+                    "result": None,
+                    "id": json_data.get("id"),
+                }
+            )
+            return
+        self.store = session.store
+        self.write_json(
+            {"jsonrpc": "2.0", "result": session.as_dict(), "id": json_data.get("id")}
+        )
+
+    def handle_message(self, json_data: dict) -> Tuple[int, bytes]:
+        """
+        Handle a request on an executor thread, returns the encoded response:
+        encoding a large result would stall the event loop and every other
+        connection
+        """
+        with use_store(self.store):
+            res = self.handler.handle_message(json_data)
+        log.debug("response: %s", res)
+        return self.codec.encode(res)
+
+    async def dispatch(self, json_data: dict):
+        try:
+            flags, payload = await self.server.loop.run_in_executor(
+                self.server.executor, self.handle_message, json_data
+            )
+        except Exception as e:
+            log.exception("handle message error: %s", json_data)
+            self.write_json(
+                {
+                    "jsonrpc": "2.0",
+                    "error": {"code": 32603, "message": str(e)},
+                    "result": None,
+                    "id": json_data.get("id"),
+                }
+            )
+            return
+        self.write(payload, flags)
+
+    def push(self, method: str, params: dict):
+        """
+        Send a JSON-RPC notification, callable from any thread, encoded on
+        the calling thread
+        """
+        if self.closed:
+            return
+        flags, payload = self.codec.encode(
+            {"jsonrpc": "2.0", "method": method, "params": params}
+        )
+        self.server.loop.call_soon_threadsafe(self.write, payload, flags)
+
+    def write_json(self, data: dict):
+        """
+        Write a message in the negotiated encoding, for the small replies
+        written on the event loop
+        """
+        flags, response = self.codec.encode(data)
+        log.debug("response: %s", data)
+        self.write(response, flags)
+
+    def write(self, payload: bytes, flags: int = 0):
+        if self.closed or self.transport is None or self.transport.is_closing():
+            return
+        frames = encode_frame(payload, self.framing, flags)
+        metrics.add_out(sum(len(frame) for frame in frames))
+        self.transport.writelines(frames)
+
+
+class SocketServer:
+
+    def __init__(self, host, unix_socket: bool = False):
+        """
+        Listen on an ephemeral TCP port of host, with unix_socket also on a
+        unix domain socket in a private temp directory. The socket path is
+        announced before the port, clients that wait for the port know both.
+        """
+        self.host = host
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE
+        )
+        self.server_socket.bind((self.host, 0))
+        self.port = self.server_socket.getsockname()[1]
+        self.unix_socket: Optional[socket.socket] = None
+        self.unix_path: Optional[str] = None
+        if unix_socket and hasattr(socket, "AF_UNIX"):
+            self._bind_unix()
+            print(f"Aider server socket: {self.unix_path}")
+        print(f"Aider server port: {self.port}")
+        self.server_socket.listen(5)
+        self.loop = asyncio.new_event_loop()
+        # blocking aider calls run here, never on the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=RPC_WORKERS, thread_name_prefix="aider-rpc"
+        )
+
+    def _bind_unix(self):
+        # mkdtemp is only accessible by this user, so is the socket in it
+        directory = tempfile.mkdtemp(prefix="aider-ui-")
+        _unix_socket_dirs.append(directory)
+        self.unix_path = os.path.join(directory, UNIX_SOCKET_NAME)
+        self.unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.unix_socket.bind(self.unix_path)
+        self.unix_socket.listen(5)
+
+    def start(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(
+                self.loop.create_server(
+                    lambda: RpcConnection(self), sock=self.server_socket
+                )
+            )
+            if self.unix_socket is not None:
+                self.loop.run_until_complete(
+                    self.loop.create_unix_server(
+                        lambda: RpcConnection(self), sock=self.unix_socket
+                    )
+                )
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            log.info("Server shutting down.")
+        finally:
+            self.server_socket.close()
+            if self.unix_socket is not None:
+                self.unix_socket.close()
+            remove_unix_sockets()
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Immutable snapshots of the session state for the rpc threads.
+
+The threads that change the session (aider's main thread, a file operation
+applied by an rpc) publish a new snapshot through SessionState, one writer
+at a time. Readers take ``SessionState.snapshot`` without a lock and never
+touch the live coder, so a read is as fast while a command runs as when
+idle and can't see a half-updated coder.
+"""
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple, Optional, Tuple
+
+
+class SessionSnapshot(NamedTuple):
+    version: int = 0
+    coder_ready: bool = False
+    running: bool = False
+    added: Tuple[str, ...] = ()  # relative paths
+    readonly: Tuple[str, ...] = ()
+    main_model: Optional[str] = None
+    edit_format: Optional[str] = None
+    cwd: Optional[str] = None
+    announcements: Tuple[str, ...] = ()
+    # version of the last publish that changed the files / the coder info,
+    # clients send it back as if_none_match
+    files_version: int = 0
+    info_version: int = 0
+
+    def files(self) -> dict:
+        return {"added": list(self.added), "readonly": list(self.readonly)}
+
+    def coder_info(self) -> Optional[dict]:
+        if not self.coder_ready:
+            return None
+        return {
+            "main_model": self.main_model,
+            "edit_format": self.edit_format,
+            "cwd": self.cwd,
+        }
+
+
+def read_coder(coder) -> dict:
+    """
+    Snapshot fields of a coder, call on the thread that changed it
+    """
+    if coder is None:
+        return {
+            "coder_ready": False,
+            "added": (),
+            "readonly": (),
+            "main_model": None,
+            "edit_format": None,
+            "cwd": None,
+            "announcements": (),
+        }
+    readonly = sorted(
+        coder.get_rel_fname(fname) for fname in coder.abs_read_only_fnames
+    )
+    return {
+        "coder_ready": True,
+        "added": tuple(coder.get_inchat_relative_files()),
+        "readonly": tuple(readonly),
+        "main_model": str(coder.main_model),
+        "edit_format": coder.edit_format,
+        "cwd": str(Path.cwd()),
+        "announcements": tuple(coder.get_announcements()),
+    }
+
+
+class SessionState:
+    def __init__(self):
+        self._write_lock = Lock()
+        self._snapshot = SessionSnapshot()
+
+    @property
+    def snapshot(self) -> SessionSnapshot:
+        # replacing the reference is atomic, readers need no lock
+        return self._snapshot
+
+    def publish(self, **fields) -> SessionSnapshot:
+        """
+        Publish a snapshot with fields replaced, the version always increases
+        """
+        with self._write_lock:
+            return self._publish(fields)
+
+    def refresh(self, coder) -> SessionSnapshot:
+        """
+        Publish the current files and info of coder
+        """
+        # read under the lock too, an older read can't be published last
+        with self._write_lock:
+            return self._publish(read_coder(coder))
+
+    def _publish(self, fields: dict) -> SessionSnapshot:
+        current = self._snapshot
+        version = current.version + 1
+        snapshot = current._replace(version=version, **fields)
+        if snapshot.files() != current.files():
+            snapshot = snapshot._replace(files_version=version)
+        if snapshot.coder_info() != current.coder_info():
+            snapshot = snapshot._replace(info_version=version)
+        self._snapshot = snapshot
+        return snapshot
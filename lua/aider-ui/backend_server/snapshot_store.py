@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Optional, TypedDict
+
+from backend_server.utils import copy_and_hash, try_link
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# blobs used this recently are never evicted, they belong to a running command
+EVICT_GRACE_SECONDS = 60
+
+
+class Snapshot(TypedDict):
+    blob: str  # sha256 of the content
+    path: str  # readable path of the blob, keeps the source file extension
+
+
+def default_snapshot_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "aider-ui", "snapshots")
+
+
+class SnapshotStore:
+    """
+    Content-addressed store for before/after copies of changed files.
+
+    A blob is stored once per content under ``objects/<sha[:2]>/<sha>``,
+    copied with a reflink when the filesystem supports it. The path handed
+    out keeps the source extension (for diff syntax highlighting) and is a
+    hardlink to the blob. Blobs are evicted least recently used first once
+    the store grows over ``max_bytes``, a blob's mtime is its last use.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = Path(
+            root or os.environ.get("AIDER_UI_SNAPSHOT_DIR") or default_snapshot_dir()
+        )
+        if max_bytes is None:
+            max_bytes = int(
+                os.environ.get("AIDER_UI_SNAPSHOT_MAX_BYTES", DEFAULT_MAX_BYTES)
+            )
+        self.max_bytes = max_bytes
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        self._lock = Lock()
+        # only a trigger for eviction, recomputed by every eviction scan
+        self._approx_size: Optional[int] = None
+
+    def put_file(self, file_path: str) -> Optional[Snapshot]:
+        """
+        Snapshot the current content of file_path, None if it does not exist
+        """
+        if not os.path.isfile(file_path):
+            return None
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        os.close(fd)
+        try:
+            digest = copy_and_hash(file_path, tmp_path)
+            blob_path = self.blob_path(digest)
+            with self._lock:
+                if blob_path.exists():
+                    os.utime(blob_path)
+                else:
+                    blob_path.parent.mkdir(parents=True, exist_ok=True)
+                    size = os.path.getsize(tmp_path)
+                    os.replace(tmp_path, blob_path)
+                    self._add_size(size)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return {"blob": digest, "path": self._view_path(blob_path, file_path)}
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _view_path(self, blob_path: Path, file_path: str) -> str:
+        suffix = Path(file_path).suffix
+        if not suffix:
+            return str(blob_path)
+        view_path = blob_path.with_name(blob_path.name + suffix)
+        if try_link(str(blob_path), str(view_path)):
+            return str(view_path)
+        return str(blob_path)
+
+    def _add_size(self, size: int):
+        if self._approx_size is None:
+            self._approx_size = sum(size for _, size, _ in self._iter_blobs())
+        else:
+            self._approx_size += size
+        if self._approx_size > self.max_bytes:
+            self.evict()
+
+    def _iter_blobs(self):
+        """
+        yield (mtime, size, blob path), one entry per content
+        """
+        if not self.objects_dir.exists():
+            return
+        for entry in self.objects_dir.glob("*/*"):
+            if "." in entry.name:
+                # extension hardlink of a blob
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, entry
+
+    def evict(self):
+        """
+        Delete least recently used blobs until the store fits in max_bytes
+        """
+        blobs = sorted(self._iter_blobs())
+        total = sum(size for _, size, _ in blobs)
+        keep_after = time.time() - EVICT_GRACE_SECONDS
+        for mtime, size, blob_path in blobs:
+            if total <= self.max_bytes or mtime > keep_after:
+                break
+            for path in blob_path.parent.glob(blob_path.name + "*"):
+                path.unlink(missing_ok=True)
+            total -= size
+            log.debug("evict snapshot %s", blob_path.name)
+        self._approx_size = total
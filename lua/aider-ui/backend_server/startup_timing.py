@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Startup phase timing of aider_server.py.
+
+Phases are measured with time.monotonic() relative to the start of
+aider_server.py and reported by the startup_timing rpc and the
+aider_start notification. Set AIDER_UI_IMPORT_TIMES to a file path to also
+dump per-module import times, in the format of ``python -X importtime``.
+"""
+import functools
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock, local
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+
+log = logging.getLogger(__name__)
+
+IMPORT_TIMES_ENV = "AIDER_UI_IMPORT_TIMES"
+
+
+class Phase(TypedDict):
+    start: float  # seconds since the timer origin
+    duration: float  # seconds, summed over all calls
+    count: int
+
+
+class StartupTiming(TypedDict):
+    total: Optional[float]  # seconds until aider started, None while starting
+    phases: Dict[str, Phase]
+
+
+class StartupTimer:
+    def __init__(self, origin: Optional[float] = None):
+        self.origin = time.monotonic() if origin is None else origin
+        self.finished_at: Optional[float] = None
+        self._phases: Dict[str, Phase] = {}
+        self._lock = Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def add(self, name: str, start: float, end: float):
+        """
+        Record a phase from monotonic start/end, repeated phases accumulate
+        """
+        if self.finished:
+            return
+        with self._lock:
+            phase = self._phases.get(name)
+            if phase is None:
+                self._phases[name] = {
+                    "start": round(start - self.origin, 6),
+                    "duration": round(end - start, 6),
+                    "count": 1,
+                }
+            else:
+                phase["duration"] = round(phase["duration"] + end - start, 6)
+                phase["count"] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.monotonic())
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """
+        Time every call of func as phase name, until startup finishes
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.finished:
+                return func(*args, **kwargs)
+            with self.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished_at = time.monotonic()
+        log.info("startup timing: %s", self.as_dict())
+
+    def as_dict(self) -> StartupTiming:
+        with self._lock:
+            phases = {name: dict(phase) for name, phase in self._phases.items()}
+        total = None
+        if self.finished_at is not None:
+            total = round(self.finished_at - self.origin, 6)
+        return {"total": total, "phases": phases}  # type: ignore[typeddict-item]
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder timing the execution of every module imported while
+    it is installed. Only the per-module loader instances are wrapped,
+    builtin and frozen modules are not timed.
+    """
+
+    def __init__(self):
+        # (module name, self us, cumulative us, depth) in completion order
+        self.records: List[Tuple[str, int, int, int]] = []
+        # per thread: child time of the running imports, and find_spec reentry
+        self._local = local()
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        loader = spec.loader
+        if loader is None or isinstance(loader, type):
+            return spec
+        exec_module = getattr(loader, "exec_module", None)
+        if exec_module is not None:
+            loader.exec_module = self._timed(fullname, exec_module)
+        return spec
+
+    def _timed(self, fullname: str, exec_module: Callable) -> Callable:
+        def timed_exec_module(module):
+            if not hasattr(self._local, "stack"):
+                self._local.stack = []
+            stack: List[List[float]] = self._local.stack
+            stack.append([0.0])
+            start = time.perf_counter()
+            try:
+                return exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()[0]
+                if stack:
+                    stack[-1][0] += elapsed
+                self.records.append(
+                    (
+                        fullname,
+                        int((elapsed - children) * 1e6),
+                        int(elapsed * 1e6),
+                        len(stack),
+                    )
+                )
+
+        return timed_exec_module
+
+    def dump(self, file_path: str):
+        with open(file_path, "w") as f:
+            f.write("import time: self [us] | cumulative | imported package\n")
+            for name, self_us, cumulative_us, depth in self.records:
+                f.write(
+                    f"import time: {self_us:>9} | {cumulative_us:>10} | "
+                    f"{'  ' * depth}{name}\n"
+                )
+
+
+timer = StartupTimer()
+_import_timer: Optional[ImportTimer] = None
+
+
+def start_import_timing(origin: float):
+    """
+    Reset the timer origin to the start of aider_server.py and install the
+    import timer when AIDER_UI_IMPORT_TIMES is set
+    """
+    global _import_timer
+    timer.origin = origin
+    if os.environ.get(IMPORT_TIMES_ENV) and _import_timer is None:
+        _import_timer = ImportTimer()
+        _import_timer.install()
+
+
+def finish_startup():
+    """
+    aider started: stop timing and write the import times if enabled
+    """
+    global _import_timer
+    timer.finish()
+    if _import_timer is None:
+        return
+    _import_timer.uninstall()
+    file_path = os.environ.get(IMPORT_TIMES_ENV)
+    try:
+        if file_path:
+            _import_timer.dump(file_path)
+            log.info("import times written to %s", file_path)
+    except OSError as e:
+        log.error("write import times failed: %s", e)
+    _import_timer = None
@@ -1,8 +1,26 @@
 # -*- coding: utf-8 -*-
-from typing import List, TypedDict, Optional
-from queue import Queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Set, TypedDict, Optional
+from queue import Empty, Queue
+from threading import Event, Lock, RLock
 from aider.coders import Coder
+from backend_server.checkpoint import Checkpoint, CheckpointWriter
+from backend_server.consts import NotifyType
+from backend_server.file_ops import FileOpLog
+from backend_server.history_log import HistoryLog
+from backend_server.input_history import InputHistoryIndex
+from backend_server.output_search import CommandRange, CommandRanges
+from backend_server.search_index import TokenIndex
+from backend_server.session_state import SessionState
+from backend_server.snapshot_store import SnapshotStore
+from backend_server.tree_context_cache import TreeContextCache
+import atexit
 import logging
+import os
+import shutil
+import tempfile
+import time
 
 
 log = logging.getLogger(__name__)
@@ -37,26 +55,263 @@ class FileDiagnostics(TypedDict):
     diagnostics: List[Diagnostic]
 
 
+def coalesce_notifications(items: List[dict]) -> List[dict]:
+    """
+    Drop notifications superseded later in the same batch, a CONFIRM_ASK
+    directly followed by its CONFIRM_COMPLETE collapses into the complete.
+    """
+    ret: List[dict] = []
+    for item in items:
+        if (
+            item.get("type") == NotifyType.CONFIRM_COMPLETE
+            and ret
+            and ret[-1].get("type") == NotifyType.CONFIRM_ASK
+        ):
+            ret[-1] = item
+            continue
+        ret.append(item)
+    return ret
+
+
+# (seq, line), seq is the line index in output_history
+OutputSubscriber = Callable[[int, str], None]
+
+# stores not closed yet, their history directories are removed on exit
+_open_stores: Set["Store"] = set()
+_open_stores_lock = Lock()
+
+
+def close_stores():
+    """
+    Close every open store, host mode has one per session. Also called
+    before os._exit, which skips atexit
+    """
+    with _open_stores_lock:
+        stores = list(_open_stores)
+    for item in stores:
+        item.close()
+
+
+atexit.register(close_stores)
+
+
 class Store:
     def __init__(self):
-        self.chat_history: List[str] = []
-        self.output_history: List[str] = []
+        # histories live on disk, only the recent lines stay in memory
+        self.history_dir = tempfile.mkdtemp(prefix="aider-ui-history-")
+        self.chat_history = HistoryLog(f"{self.history_dir}/chat")
+        self.output_history = HistoryLog(f"{self.history_dir}/output")
+        # search index of chat_history, see add_chat_line
+        self.chat_index = TokenIndex()
+        self._chat_lock = Lock()
+        # output_history range of every command
+        self.command_ranges = CommandRanges()
+        # modified_info of every command, oldest first
+        self.modify_history: List[List[dict]] = []
+        # written in the background after every command when set
+        self.checkpoint_path: Optional[str] = None
+        self.checkpoints = CheckpointWriter()
+        with _open_stores_lock:
+            _open_stores.add(self)
         self.diagnostics: List[FileDiagnostics] = []
-        self.coder: Optional[Coder] = None
-        self.running = False
+        self.fix_concurrency = 1
+        self.fix_token_budget = 0  # set by fix_diagnostic, <= 0 disables packing
+        # serialize file writes and confirm prompts of coders running in parallel
+        self.write_lock = RLock()
+        self.confirm_lock = RLock()
+        # the session state rpc threads read, published by coder/running
+        self.state = SessionState()
+        self._coder: Optional[Coder] = None
+        self._running = False
         self.notification_queue = Queue(9999)
-        self.waiting_add_files: List[str] = []
-        self.waiting_read_files: List[str] = []
-        self.waiting_drop_files: List[str] = []
+        # file operations requested while a command runs
+        self.file_ops = FileOpLog()
+        self.snapshots = SnapshotStore()
+        self.tree_contexts = TreeContextCache()
+        self.input_history: Optional[InputHistoryIndex] = None
         self.change_files = {
-            "before_tmp_dir": "",
             "files": [],
         }
         self.last_confirm_output_idx = 0
+        # standby: started before a session needs it, waits for activate
+        self.standby = False
+        self.activation: Optional[dict] = None
+        self._activated = Event()
+        self.output_subscribers: List[OutputSubscriber] = []
+        self._output_lock = Lock()
+
+    @property
+    def coder(self) -> Optional[Coder]:
+        return self._coder
+
+    @coder.setter
+    def coder(self, coder: Optional[Coder]):
+        self._coder = coder
+        self.state.refresh(coder)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @running.setter
+    def running(self, running: bool):
+        self._running = running
+        self.state.publish(running=running)
+
+    def refresh_state(self):
+        """
+        Publish the coder's files and info after they changed
+        """
+        self.state.refresh(self._coder)
+
+    def activate(self, cwd: str, args: List[str]) -> bool:
+        """
+        Hand a standby server its session, False if already activated
+        """
+        if self.activation is not None:
+            return False
+        self.activation = {"cwd": cwd, "args": args}
+        self._activated.set()
+        return True
+
+    def wait_activation(self) -> dict:
+        self._activated.wait()
+        assert self.activation is not None
+        return self.activation
+
+    def close(self):
+        with _open_stores_lock:
+            _open_stores.discard(self)
+        self.chat_history.close()
+        self.output_history.close()
+        shutil.rmtree(self.history_dir, ignore_errors=True)
 
     def add_notify_message(self, data):
-        log.info("add_notify_message: %s", data)
+        log.debug("add_notify_message: %s", data)
         self.notification_queue.put(data)
 
+    def get_notifications(self, max_items: int, window: float) -> List[dict]:
+        """
+        Block for the next notification, then drain whatever arrives within
+        ``window`` seconds, up to ``max_items``.
+        """
+        items = [self.notification_queue.get(block=True)]
+        deadline = time.monotonic() + window
+        while len(items) < max_items:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self.notification_queue.get(timeout=remaining)
+                else:
+                    item = self.notification_queue.get_nowait()
+            except Empty:
+                break
+            items.append(item)
+        return coalesce_notifications(items)
+
+    def restore_histories(self, checkpoint: Checkpoint):
+        """
+        Replace the histories with the checkpoint's, the lines of this
+        session so far are appended after them
+        """
+        with self._output_lock, self._chat_lock:
+            output_history = checkpoint.output_history
+            chat_history = checkpoint.chat_history
+            offset = len(output_history)
+            output_history.extend(
+                self.output_history.iter_range(0, len(self.output_history))
+            )
+            chat_index = checkpoint.chat_index
+            for line in self.chat_history.iter_range(0, len(self.chat_history)):
+                chat_index.add(len(chat_history), line)
+                chat_history.append(line)
+            ranges = checkpoint.command_ranges.list()
+            for item in self.command_ranges.list():
+                ranges.append(
+                    CommandRange(
+                        len(ranges) + 1,
+                        item.command,
+                        item.start + offset,
+                        None if item.end is None else item.end + offset,
+                    )
+                )
+            old = (self.output_history, self.chat_history)
+            self.output_history, self.chat_history = output_history, chat_history
+            self.chat_index = chat_index
+            self.command_ranges = CommandRanges(ranges)
+        # rpc threads read the histories without the locks and may still use
+        # the old ones: their files are deleted now, they are closed when the
+        # last reader drops them
+        for history in old:
+            history.remove_files()
+            directory = os.path.dirname(history.data_path)
+            if directory != self.history_dir:
+                # restore-* directory of an earlier restore
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def add_chat_line(self, line: str):
+        """
+        Append a chat history line and index it
+        """
+        with self._chat_lock:
+            line_no = len(self.chat_history)
+            self.chat_history.append(line)
+            self.chat_index.add(line_no, line)
+
+    def add_output(self, line: str):
+        """
+        Append an output line and push it to the subscribers
+        """
+        with self._output_lock:
+            seq = len(self.output_history)
+            self.output_history.append(line)
+            for subscriber in self.output_subscribers:
+                subscriber(seq, line)
+
+    def subscribe_output(self, subscriber: OutputSubscriber, since: int = 0) -> int:
+        """
+        Replay the output from ``since`` and subscribe to new lines,
+        return the next sequence number.
+        """
+        with self._output_lock:
+            next_seq = len(self.output_history)
+            since = min(max(since, 0), next_seq)
+            for seq, line in enumerate(
+                self.output_history.iter_range(since, next_seq), since
+            ):
+                subscriber(seq, line)
+            self.output_subscribers.append(subscriber)
+        return next_seq
+
+    def unsubscribe_output(self, subscriber: OutputSubscriber):
+        with self._output_lock:
+            if subscriber in self.output_subscribers:
+                self.output_subscribers.remove(subscriber)
+
+
+class StoreProxy:
+    """
+    The store of the current session. A single-session server only has
+    the default store. In host mode each session thread (and an rpc bound
+    to the session) sets its own Store in ``current_store``.
+    """
+
+    def __getattr__(self, name):
+        return getattr(current_store.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_store.get(), name, value)
+
+
+@contextmanager
+def use_store(session_store: Store):
+    token = current_store.set(session_store)
+    try:
+        yield session_store
+    finally:
+        current_store.reset(token)
+
 
-store = Store()
+default_store = Store()
+current_store: ContextVar[Store] = ContextVar("current_store", default=default_store)
+store = StoreProxy()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Pseudo terminal of a host mode session, relayed over a local TCP port.
+
+aider reads and writes the slave side like a normal terminal. The master
+side is relayed to attach_client.py, which runs in the session's neovim
+terminal buffer. The host sends raw terminal output. The client sends
+length framed messages (see framing.py), the flags byte tells input from a
+window resize.
+
+No aider imports here, attach_client.py starts fast.
+"""
+import fcntl
+import logging
+import os
+import pty
+import select
+import socket
+import struct
+import termios
+import threading
+from typing import Callable, Optional
+
+from backend_server.framing import FRAMING_LENGTH, FrameError, FrameReader
+
+log = logging.getLogger(__name__)
+
+# flags of the client frames
+TERMINAL_INPUT = 0
+TERMINAL_RESIZE = 1  # payload: rows, cols
+WINSIZE = struct.Struct(">HH")
+
+CTRL_C = b"\x03"
+RELAY_CHUNK = 64 * 1024
+
+
+def set_winsize(fd: int, rows: int, cols: int):
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+def get_winsize(fd: int):
+    rows, cols, _, _ = struct.unpack(
+        "HHHH", fcntl.ioctl(fd, termios.TIOCGWINSZ, b"\0" * 8)
+    )
+    return rows, cols
+
+
+class SessionTerminal:
+    """
+    ``stdin``/``stdout``/``stderr`` are text files on the slave side, the
+    session thread uses them as its sys streams
+    """
+
+    def __init__(self, on_interrupt: Optional[Callable[[], bool]] = None):
+        # on_interrupt: ctrl-c typed, True if it interrupted a running command
+        self.on_interrupt = on_interrupt
+        self.master_fd, slave_fd = pty.openpty()
+        set_winsize(slave_fd, 24, 80)
+        self.stdin = open(os.dup(slave_fd), "r", encoding="utf-8", errors="replace")
+        self.stdout = open(
+            slave_fd, "w", encoding="utf-8", errors="replace", buffering=1
+        )
+        self.stderr = self.stdout
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.closed = False
+        self._conn: Optional[socket.socket] = None
+        self._thread = threading.Thread(
+            target=self._serve, name=f"aider-terminal-{self.port}", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for item in (self.listener, self._conn):
+            if item is not None:
+                try:
+                    item.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                item.close()
+        for stream in (self.stdin, self.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        os.close(self.master_fd)
+
+    def _serve(self):
+        """
+        Relay one attached client at a time, a client may attach again
+        """
+        while not self.closed:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._conn = conn
+            try:
+                self._relay(conn)
+            except (OSError, FrameError) as e:
+                log.debug("terminal client gone: %s", e)
+            finally:
+                self._conn = None
+                conn.close()
+
+    def _relay(self, conn: socket.socket):
+        reader = FrameReader(FRAMING_LENGTH)
+        while not self.closed:
+            readable, _, _ = select.select([self.master_fd, conn], [], [])
+            if self.master_fd in readable:
+                try:
+                    data = os.read(self.master_fd, RELAY_CHUNK)
+                except OSError:
+                    # EIO, the slave side is closed
+                    data = b""
+                if not data:
+                    return
+                conn.sendall(data)
+            if conn in readable:
+                data = conn.recv(RELAY_CHUNK)
+                if not data:
+                    return
+                reader.feed(data)
+                for flags, payload in reader.frames():
+                    self._handle_frame(flags, payload)
+
+    def _handle_frame(self, flags: int, payload: bytes):
+        if flags == TERMINAL_RESIZE:
+            rows, cols = WINSIZE.unpack(payload)
+            set_winsize(self.master_fd, rows, cols)
+            return
+        if CTRL_C in payload and self.on_interrupt and self.on_interrupt():
+            # aider is not reading the terminal while a command runs
+            return
+        os.write(self.master_fd, payload)
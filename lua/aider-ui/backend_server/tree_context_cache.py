@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of aider.linter.tree_context renderings for fix diagnostics.
+
+Parsed TreeContexts are kept per (file name, content hash) and renderings
+per (file name, content hash, line numbers), both with LRU eviction. A
+path -> (mtime, size, hash) index lets unchanged files skip even the read,
+the write_text listener drops a path from it before aider writes the file.
+"""
+import copy
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Optional, Tuple
+
+from grep_ast import TreeContext
+
+log = logging.getLogger(__name__)
+
+MAX_TREES = 32
+MAX_RENDERS = 256
+
+
+class TreeContextCache:
+    def __init__(self, max_trees: int = MAX_TREES, max_renders: int = MAX_RENDERS):
+        self.max_trees = max_trees
+        self.max_renders = max_renders
+        # (rel_fname, digest) -> parsed TreeContext, never rendered itself
+        self._trees: "OrderedDict[Tuple[str, str], TreeContext]" = OrderedDict()
+        # (rel_fname, digest, lines) -> rendered context
+        self._renders: "OrderedDict[Tuple[str, str, frozenset], str]" = OrderedDict()
+        # abs path -> (mtime_ns, size, digest)
+        self._stats: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, fname: str):
+        with self._lock:
+            self._stats.pop(os.path.abspath(fname), None)
+
+    def render(
+        self, fname: str, rel_fname: str, line_nums: Iterable[int], encoding="utf-8"
+    ) -> str:
+        """
+        Same output as aider.linter.tree_context(rel_fname, <content>, line_nums),
+        raise OSError if fname can not be read
+        """
+        lines = frozenset(line_nums)
+        digest, code = self._get_digest(fname, encoding)
+        key = (rel_fname, digest, lines)
+        with self._lock:
+            output = self._renders.get(key)
+            if output is not None:
+                self._renders.move_to_end(key)
+                self.hits += 1
+                return output
+            self.misses += 1
+
+        context = self._get_tree(rel_fname, digest, fname, code, encoding)
+        context.add_lines_of_interest(lines)
+        context.add_context()
+        s = "s" if len(lines) > 1 else ""
+        output = f"## See relevant line{s} below marked with █.\n\n"
+        output += rel_fname + ":\n"
+        output += context.format()
+
+        with self._lock:
+            self._renders[key] = output
+            while len(self._renders) > self.max_renders:
+                self._renders.popitem(last=False)
+        return output
+
+    def _get_digest(self, fname: str, encoding: str) -> Tuple[str, Optional[str]]:
+        """
+        (content hash, content if it had to be read)
+        """
+        abs_fname = os.path.abspath(fname)
+        stat = os.stat(abs_fname)
+        with self._lock:
+            cached = self._stats.get(abs_fname)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._stats.move_to_end(abs_fname)
+                return cached[2], None
+
+        with open(abs_fname, encoding=encoding, errors="replace") as f:
+            code = f.read()
+        digest = hashlib.sha1(code.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._stats[abs_fname] = (stat.st_mtime_ns, stat.st_size, digest)
+            while len(self._stats) > self.max_renders:
+                self._stats.popitem(last=False)
+        return digest, code
+
+    def _get_tree(
+        self,
+        rel_fname: str,
+        digest: str,
+        fname: str,
+        code: Optional[str],
+        encoding: str,
+    ) -> TreeContext:
+        """
+        A fresh copy of the parsed TreeContext, parse only on a miss
+        """
+        key = (rel_fname, digest)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None:
+                self._trees.move_to_end(key)
+        if tree is None:
+            if code is None:
+                with open(fname, encoding=encoding, errors="replace") as f:
+                    code = f.read()
+            # same options as aider.linter.tree_context
+            tree = TreeContext(
+                rel_fname,
+                code,
+                color=False,
+                line_number=True,
+                child_context=False,
+                last_line=False,
+                margin=0,
+                mark_lois=True,
+                loi_pad=3,
+                show_top_of_file_parent_scope=False,
+            )
+            with self._lock:
+                self._trees[key] = tree
+                while len(self._trees) > self.max_trees:
+                    self._trees.popitem(last=False)
+
+        # the parse results (lines, scopes, header, nodes) are only read by
+        # rendering, the per rendering state is reset on a shallow copy
+        context = copy.copy(tree)
+        context.lines_of_interest = set()
+        context.show_lines = set()
+        context.done_parent_scopes = set()
+        context.output_lines = {}
+        return context
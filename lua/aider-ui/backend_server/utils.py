@@ -1,21 +1,63 @@
-from typing import Dict
+import fcntl
+import hashlib
 import os
-import shutil
+from typing import BinaryIO, List
 
+# linux/fs.h FICLONE, share the extents of another file (copy on write)
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 1024 * 1024
 
-def copy_files_to_dir(file_paths, dir_path) -> Dict[str, str]:
+
+def reflink(src: BinaryIO, dst: BinaryIO) -> bool:
+    """
+    Clone src into dst without copying data, only on filesystems with
+    reflink support (btrfs, xfs, ...). Return False when not supported.
+    """
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        return False
+    return True
+
+
+def copy_and_hash(src_path: str, dst_path: str) -> str:
     """
-    Return:
-        {source_path: copy_tmp_path}
+    Copy src_path to dst_path (reflink when possible), return the sha256
+    hex digest of the copied content. The content is read only once.
     """
-    file_map = {}
+    digest = hashlib.sha256()
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        if reflink(src, dst):
+            # hash the clone, it can not change under us like the source can
+            dst.flush()
+            with open(dst_path, "rb") as clone:
+                while chunk := clone.read(COPY_CHUNK_SIZE):
+                    digest.update(chunk)
+        else:
+            while chunk := src.read(COPY_CHUNK_SIZE):
+                digest.update(chunk)
+                dst.write(chunk)
+    return digest.hexdigest()
 
-    for file_path in file_paths:
-        if not os.path.exists(file_path):
-            continue
 
-        file_name = str(file_path).replace(str(os.path.sep), "@@").replace(" ", "_")
-        dest_path = os.path.join(dir_path, file_name)
-        shutil.copy2(file_path, dest_path)
-        file_map[file_path] = dest_path
-    return file_map
+def try_link(src: str, dst: str) -> bool:
+    """
+    Hardlink src to dst, False if the filesystem does not support it
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def pop_flag(argv: List[str], flag: str) -> bool:
+    """
+    Remove an aider-ui flag from argv before aider parses it
+    """
+    if flag not in argv:
+        return False
+    argv.remove(flag)
+    return True
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+InputOutput of a coder running next to others, see fix diagnostics.
+
+Coders sharing the session's InputOutput interleave their output and their
+confirm prompts on one terminal. A ``BufferedIO`` never prompts: every
+confirm is answered like ``--yes-always``. Its terminal output is kept in a
+buffer and written to the session terminal in one piece by ``flush``.
+Output lines still reach the output history as they are printed, through
+the InputOutput listeners.
+"""
+from io import StringIO
+from threading import Lock
+
+from aider.io import InputOutput
+from rich.console import Console
+
+# one flushed buffer at a time on the session terminal
+_flush_lock = Lock()
+
+
+class BufferedIO(InputOutput):
+    def __init__(self, io: InputOutput):
+        # without the chat history file: the "chat started" header is skipped
+        super().__init__(
+            pretty=False,
+            yes=True,
+            fancy_input=False,
+            encoding=io.encoding,
+            dry_run=io.dry_run,
+            llm_history_file=io.llm_history_file,
+            root=io.root,
+        )
+        self.chat_history_file = io.chat_history_file
+        self.newline = io.newline
+        self.target = io
+        self.buffer = StringIO()
+        self.console = Console(file=self.buffer, force_terminal=False, no_color=True)
+
+    def confirm_ask(
+        self,
+        question,
+        default="y",
+        subject=None,
+        explicit_yes_required=False,
+        group=None,
+        allow_never=False,
+    ):
+        # not through the listeners of InputOutput.confirm_ask, the client
+        # must not show a confirm nobody waits for
+        answer = not explicit_yes_required
+        self.tool_output(f"{question} {'y' if answer else 'n'}")
+        return answer
+
+    def flush(self):
+        """
+        Write the buffered output to the terminal of the session
+        """
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if not text:
+            return
+        with _flush_lock:
+            self.target.console.file.write(text)
+            self.target.console.file.flush()
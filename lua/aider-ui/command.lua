@@ -40,6 +40,81 @@ M.setup = function()
     git.commit()
   end, { desc = "Commit changes using Aider" })
 
+  vim.api.nvim_create_user_command("AiderStats", function()
+    local current_session = sessions_manager.current_session()
+    if current_session then
+      current_session:stats(function(stats)
+        print(vim.inspect(stats))
+      end)
+    else
+      utils.err("No active Aider session found.")
+    end
+  end, { desc = "Show rpc metrics of the current Aider session" })
+
+  vim.api.nvim_create_user_command("AiderSearchChatHistory", function(args)
+    local current_session = sessions_manager.current_session()
+    if not current_session then
+      utils.err("No active Aider session found.")
+      return
+    end
+    current_session:search_chat_history(args.args, nil, function(result)
+      if #result.matches == 0 then
+        utils.info("No chat history line matches: " .. args.args)
+        return
+      end
+      local lines = {}
+      for _, match in ipairs(result.matches) do
+        table.insert(lines, string.format("%d: %s", match.line + 1, match.snippet))
+      end
+      utils.info(table.concat(lines, "\n"))
+    end)
+  end, { nargs = "+", desc = "Search the chat history of the current Aider session" })
+
+  vim.api.nvim_create_user_command("AiderSearchOutput", function(args)
+    local current_session = sessions_manager.current_session()
+    if not current_session then
+      utils.err("No active Aider session found.")
+      return
+    end
+    local lines = {}
+    current_session:search_output({ query = args.args, regex = true }, function(matches)
+      for _, match in ipairs(matches) do
+        table.insert(lines, string.format("%d: %s", match.line + 1, match.text))
+      end
+    end, function(result)
+      if result.matched == 0 then
+        utils.info("No output line matches: " .. args.args)
+        return
+      end
+      utils.info(table.concat(lines, "\n"))
+    end)
+  end, { nargs = "+", desc = "Search the output of the current Aider session with a regex" })
+
+  vim.api.nvim_create_user_command("AiderProfile", function(args)
+    local current_session = sessions_manager.current_session()
+    if not current_session then
+      utils.err("No active Aider session found.")
+      return
+    end
+    local action, kind = args.fargs[1] or "status", args.fargs[2] or "cpu"
+    current_session:profile({ action = action, kind = kind }, function(result)
+      if action == "stop" then
+        utils.info("profile written to " .. result.path)
+      else
+        utils.info(vim.inspect(result))
+      end
+    end)
+  end, {
+    nargs = "*",
+    complete = function(_, cmd_line)
+      if #vim.split(cmd_line, "%s+") > 2 then
+        return { "cpu", "memory" }
+      end
+      return { "start", "stop", "status" }
+    end,
+    desc = "Start or stop profiling the current Aider session: start|stop|status [cpu|memory]",
+  })
+
   vim.api.nvim_create_user_command("AiderShowSessionInfo", function()
     require("aider-ui.ui.sessions_ui").show_session_info()
   end, { desc = "Show Aider session info" })
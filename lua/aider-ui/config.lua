@@ -15,6 +15,37 @@ M.defaults = {
   aider_cmd_args_watch_files = nil,
   auto_pop_confirm = true,  -- Automatically pop confirm dialog when AskConfirm event is triggered
   sider_width = 85,
+  -- notify long-poll returns everything queued within window_ms as one batch
+  notify_batch = {
+    max_items = 64,
+    window_ms = 20,
+  },
+  -- pushed aider output lines kept per session
+  output_cache_lines = 10000,
+  -- aider servers started ahead of time, new sessions skip aider's import time
+  standby_servers = 0,
+  -- sessions of the same cwd share one aider process, standby_servers is ignored
+  host_mode = false,
+  -- files fixed in parallel by fix diagnostics, each with its own coder
+  diagnostic_fix_concurrency = 1,
+  -- small files are fixed together in one request up to this many prompt tokens, 0 disables
+  diagnostic_fix_token_budget = 2000,
+  -- restore a session's output, chat history, files and chat messages when
+  -- a session of the same name and cwd starts again, saved after every command
+  checkpoint = {
+    enabled = false,
+    -- nil: stdpath("state") .. "/aider-ui/checkpoints"
+    dir = nil,
+  },
+  rpc = {
+    -- "length" (length-prefixed frames) or "delimiter" (legacy)
+    framing = "length",
+    -- "tcp" or "unix" (unix domain socket, falls back to tcp on windows)
+    transport = "tcp",
+    -- response encoding: "json" or "msgpack" (needs msgpack in the python env
+    -- and the length framing, else the server answers in json)
+    encoding = "json",
+  },
   chat_size = {
     width = 85,
     height = 35,
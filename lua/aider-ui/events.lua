@@ -43,6 +43,7 @@ return {
   ChatStart = Event:new(),
   ChatCompleted = Event:new(),
   GetOutput = Event:new({ throttle_time = 100 }),
+  Output = Event:new(),
   AskConfirm = Event:new(),
   SessionExit = Event:new(),
 }
@@ -0,0 +1,111 @@
+local config = require("aider-ui.config")
+local rpc = require("aider-ui.rpc")
+local utils = require("aider-ui.utils")
+
+--- Host mode: the sessions of one cwd share an aider_server.py process
+--- started with --aider-ui-host, each session's terminal runs attach_client.py
+---@class AiderHost
+---@field cwd string
+---@field job_id integer
+---@field port integer|nil
+---@field socket_path string|nil
+---@field client Client|nil
+---@field waiting fun(host: AiderHost|nil)[] called once the port is known, nil if the host failed
+
+local M = {
+  ---@type table<string, AiderHost>
+  hosts = {},
+}
+
+---@param host AiderHost
+---@param ok boolean
+local function resolve_waiting(host, ok)
+  local waiting = host.waiting
+  host.waiting = {}
+  for _, callback in ipairs(waiting) do
+    callback(ok and host or nil)
+  end
+end
+
+---@param cwd string
+---@return AiderHost
+local function spawn(cwd)
+  ---@type AiderHost
+  local host = { cwd = cwd, job_id = 0, port = nil, client = nil, waiting = {} }
+  local cmd = vim.list_extend({
+    config.options.python_path,
+    utils.dir_path .. "aider_server.py",
+    "--aider-ui-host",
+  }, rpc.server_args())
+  host.job_id = vim.fn.jobstart(cmd, {
+    cwd = cwd,
+    on_stdout = function(_, data)
+      if host.port ~= nil then
+        return
+      end
+      for _, line in ipairs(data or {}) do
+        host.socket_path = rpc.match_socket_path(line) or host.socket_path
+        local port_match = line:match("Aider server port: (%d+)")
+        if port_match then
+          host.port = tonumber(port_match)
+          host.client = rpc.create_client("127.0.0.1", host.port, { path = host.socket_path })
+          resolve_waiting(host, true)
+          return
+        end
+      end
+    end,
+    on_exit = function()
+      if M.hosts[cwd] == host then
+        M.hosts[cwd] = nil
+      end
+      if host.client ~= nil then
+        host.client:close()
+      end
+      resolve_waiting(host, false)
+    end,
+  })
+  if host.job_id <= 0 then
+    utils.err("Start aider host failed: " .. table.concat(cmd, " "))
+  end
+  return host
+end
+
+--- The host of cwd, started on first use
+---@param cwd string
+---@param callback fun(host: AiderHost|nil)
+function M.get(cwd, callback)
+  local host = M.hosts[cwd]
+  if host == nil then
+    host = spawn(cwd)
+    M.hosts[cwd] = host
+  end
+  if host.port ~= nil then
+    callback(host)
+  else
+    table.insert(host.waiting, callback)
+  end
+end
+
+--- Start a session in the host of cwd
+---@param cwd string
+---@param args string[] aider args
+---@param callback fun(host: AiderHost|nil, info: {session: integer, terminal_port: integer}|nil) both nil on failure
+function M.open_session(cwd, args, callback)
+  M.get(cwd, function(host)
+    if host == nil then
+      utils.err("Aider host exited")
+      callback(nil, nil)
+      return
+    end
+    host.client:request("open_session", { cwd = cwd, args = args }, function(res)
+      if res.error and res.error ~= vim.NIL then
+        utils.err("Aider open session failed: " .. vim.inspect(res.error))
+        callback(nil, nil)
+        return
+      end
+      callback(host, res.result)
+    end)
+  end)
+end
+
+return M
@@ -8,6 +8,7 @@ M.setup = function(opts)
   require("aider-ui.command").setup()
   require("aider-ui.ui.hl").setup()
   require("aider-ui.ui.confirm").setup()
+  require("aider-ui.standby").setup()
   _setup = true
 end
 
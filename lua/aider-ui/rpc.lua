@@ -1,88 +1,423 @@
 local uv = vim.loop
+local config = require("aider-ui.config")
 
 ---@alias res_callback fun(json_obj: table, method: string, params: table|string)
 
+---@class PendingRequest
+---@field method string
+---@field params table|string
+---@field callback res_callback
+
+local END_OF_MESSAGE = "\r\n\r\n"
+local HEADER_SIZE = 5
+local CONNECTION_ERROR = -32000
+local FRAMING_DELIMITER = "delimiter"
+local FRAMING_LENGTH = "length"
+local ENCODING_JSON = "json"
+-- frame flags, see backend_server/encoding.py
+local FLAG_MSGPACK = 1
+
+--------------------------------------------------------
+--- frame buffer
+--------------------------------------------------------
+
+--- Received chunks are only concatenated once a whole frame is available
+---@class FrameBuffer
+---@field data string
+---@field pos integer read position in data
+---@field scan integer delimiter search start in data
+---@field pending string[]
+---@field pending_size integer
+local FrameBuffer = {}
+
+---@return FrameBuffer
+function FrameBuffer.new()
+  local o = { data = "", pos = 1, scan = 1, pending = {}, pending_size = 0 }
+  setmetatable(o, { __index = FrameBuffer })
+  return o
+end
+
+---@param chunk string
+function FrameBuffer:push(chunk)
+  table.insert(self.pending, chunk)
+  self.pending_size = self.pending_size + #chunk
+end
+
+---@return integer
+function FrameBuffer:available()
+  return #self.data - self.pos + 1 + self.pending_size
+end
+
+function FrameBuffer:_merge()
+  if self.pending_size == 0 then
+    return
+  end
+  table.insert(self.pending, 1, self.data:sub(self.pos))
+  self.scan = self.scan - self.pos + 1
+  self.data = table.concat(self.pending)
+  self.pos = 1
+  self.pending = {}
+  self.pending_size = 0
+end
+
+---@param n integer
+---@return string
+function FrameBuffer:read(n)
+  if #self.data - self.pos + 1 < n then
+    self:_merge()
+  end
+  local s = self.data:sub(self.pos, self.pos + n - 1)
+  self.pos = self.pos + n
+  self.scan = math.max(self.scan, self.pos)
+  return s
+end
+
+---@param framing string
+---@return string|nil message
+---@return integer flags
+function FrameBuffer:next_frame(framing)
+  if framing == FRAMING_LENGTH then
+    if self:available() < HEADER_SIZE then
+      return nil
+    end
+    if #self.data - self.pos + 1 < HEADER_SIZE then
+      self:_merge()
+    end
+    local flags, b1, b2, b3, b4 = self.data:byte(self.pos, self.pos + 4)
+    local length = ((b1 * 256 + b2) * 256 + b3) * 256 + b4
+    if self:available() < HEADER_SIZE + length then
+      return nil
+    end
+    self.pos = self.pos + HEADER_SIZE
+    return self:read(length), flags
+  end
+
+  self:_merge()
+  local end_idx = self.data:find(END_OF_MESSAGE, self.scan, true)
+  if end_idx == nil then
+    self.scan = math.max(#self.data - #END_OF_MESSAGE + 2, self.pos)
+    return nil
+  end
+  local message = self.data:sub(self.pos, end_idx - 1)
+  self.pos = end_idx + #END_OF_MESSAGE
+  self.scan = self.pos
+  return message, 0
+end
+
+--- msgpack responses decode nil to vim.NIL like vim.json
+---@param message string
+---@param flags integer
+---@return boolean ok
+---@return any
+local function decode_message(message, flags)
+  if flags % 2 == FLAG_MSGPACK then
+    return pcall(vim.mpack.decode, message)
+  end
+  return pcall(vim.json.decode, message)
+end
+
+---@param payload string
+---@param framing string
+---@return string
+local function encode_frame(payload, framing)
+  if framing ~= FRAMING_LENGTH then
+    return payload .. END_OF_MESSAGE
+  end
+  local n = #payload
+  return string.char(
+    0,
+    math.floor(n / 16777216) % 256,
+    math.floor(n / 65536) % 256,
+    math.floor(n / 256) % 256,
+    n % 256
+  ) .. payload
+end
+
+--------------------------------------------------------
+--- client
+--------------------------------------------------------
+
 ---@class Client
 ---@field host string
 ---@field port integer
----@field params table|string
+---@field path string|nil unix domain socket of the server, used instead of the port
+---@field socket uv_tcp_t|uv_pipe_t|nil
+---@field ready boolean connected and framing negotiated
+---@field framing string
+---@field last_id integer
+---@field pending table<integer, PendingRequest>
+---@field write_queue table[]
+---@field notification_handlers table<string, fun(params: table)>
+---@field ready_handlers fun()[]
+---@field session integer|nil host mode: session the connection is attached to
 local Client = {}
-local END_OF_MESSAGE = "\r\n\r\n"
 
----@param response_callback res_callback
-function Client:connect(response_callback)
-  self.last_id = 1
-  self.method = ""
-  self.params = {}
+---@param json_obj table
+function Client:_dispatch(json_obj)
+  if json_obj.id == nil or json_obj.id == vim.NIL then
+    local handler = self.notification_handlers[json_obj.method]
+    if handler ~= nil then
+      vim.schedule(function()
+        handler(json_obj.params)
+      end)
+    end
+    return
+  end
+  local request = self.pending[json_obj.id]
+  if request == nil then
+    return
+  end
+  self.pending[json_obj.id] = nil
+  vim.schedule(function()
+    request.callback(json_obj, request.method, request.params)
+  end)
+end
 
-  if response_callback == nil then
-    response_callback = function() end
+---@param err string
+function Client:_on_disconnect(err)
+  if self.socket ~= nil then
+    if not self.socket:is_closing() then
+      self.socket:close()
+    end
+    self.socket = nil
   end
+  self.ready = false
+  self.write_queue = {}
+  local pending = self.pending
+  self.pending = {}
+  for id, request in pairs(pending) do
+    self:_dispatch_error(id, request, err)
+  end
+end
 
+---@param id integer
+---@param request PendingRequest
+---@param err string
+function Client:_dispatch_error(id, request, err)
+  vim.schedule(function()
+    request.callback(
+      { jsonrpc = "2.0", id = id, error = { code = CONNECTION_ERROR, message = err } },
+      request.method,
+      request.params
+    )
+  end)
+end
+
+---@param message table
+function Client:_write(message)
+  self.socket:write(encode_frame(vim.json.encode(message), self.framing))
+end
+
+function Client:_flush()
+  self.ready = true
+  if self.session ~= nil then
+    -- the server binds the connection before reading the next request
+    self:_attach()
+  end
+  for _, handler in ipairs(self.ready_handlers) do
+    handler()
+  end
+  for _, message in ipairs(self.write_queue) do
+    self:_write(message)
+  end
+  self.write_queue = {}
+end
+
+function Client:_attach()
+  self.last_id = self.last_id + 1
+  local idx = self.last_id
+  local params = { session = self.session }
+  self.pending[idx] = {
+    method = "attach",
+    params = params,
+    callback = function(res)
+      if type(res.error) == "table" then
+        vim.notify("Aider attach session failed: " .. vim.inspect(res.error), vim.log.levels.ERROR)
+      end
+    end,
+  }
+  self:_write({ jsonrpc = "2.0", method = "attach", params = params, id = idx })
+end
+
+--- Ask the server for length-prefixed framing and the configured response
+--- encoding, old servers answer with an error and the connection keeps the
+--- delimiter framing and json. Requests are always sent as json, the server
+--- decodes each frame by its flags. Compression is never asked for, neovim
+--- has no inflate.
+function Client:_negotiate()
+  local rpc_opts = config.options.rpc or {}
+  local want = rpc_opts.framing or FRAMING_DELIMITER
+  if want == FRAMING_DELIMITER then
+    self:_flush()
+    return
+  end
+  local params = { framing = want, encoding = rpc_opts.encoding or ENCODING_JSON }
+  self.last_id = self.last_id + 1
+  local idx = self.last_id
+  self.pending[idx] = {
+    method = "negotiate",
+    params = params,
+    callback = function() end,
+  }
+  self:_write({ jsonrpc = "2.0", method = "negotiate", params = params, id = idx })
+end
 
-  self.socket = assert(uv.new_tcp())
-  self.socket:connect(self.host, self.port, function(err)
+--- Open the long-lived connection, requests sent before it is ready are queued
+function Client:connect()
+  if self.socket ~= nil then
+    return
+  end
+  self.ready = false
+  self.framing = FRAMING_DELIMITER
+  local on_connect = function(err)
     if err then
+      self:_on_disconnect(err)
       return
     end
-    local response = ""
-
+    local buffer = FrameBuffer.new()
     self.socket:read_start(function(error, chunk)
-      if error then
+      if error or not chunk then
+        self:_on_disconnect(error or "connection closed")
         return
       end
-      if chunk then
-        response = response .. chunk
-        if vim.endswith(response, END_OF_MESSAGE) then
-          response = vim.trim(response)
-          local json_obj = vim.json.decode(response)
-          vim.schedule(function()
-            response_callback(json_obj, self.method, self.params)
-          end)
-          response = ""
+      buffer:push(chunk)
+      while self.socket ~= nil do
+        local message, flags = buffer:next_frame(self.framing)
+        if message == nil then
+          break
+        end
+        local ok, json_obj = decode_message(message, flags)
+        if ok and type(json_obj) == "table" then
+          local request = self.pending[json_obj.id]
+          if request ~= nil and request.method == "negotiate" then
+            -- switch before reading the next frame, it already uses the new framing
+            self.pending[json_obj.id] = nil
+            if type(json_obj.result) == "table" and json_obj.result.framing then
+              self.framing = json_obj.result.framing
+            end
+            self:_flush()
+          else
+            self:_dispatch(json_obj)
+          end
         end
       end
     end)
-  end)
+    self:_negotiate()
+  end
+  if self.path ~= nil then
+    self.socket = assert(uv.new_pipe(false))
+    self.socket:connect(self.path, on_connect)
+  else
+    self.socket = assert(uv.new_tcp())
+    self.socket:connect(self.host, self.port, on_connect)
+  end
 end
 
 ---@param method string
 ---@param params table|string
-function Client:send(method, params)
+---@param callback? res_callback
+---@return integer request id
+function Client:request(method, params, callback)
   self.last_id = self.last_id + 1
   local idx = self.last_id
-  self.method = method
-  self.params = params
-  local data = vim.json.encode({
+  self.pending[idx] = {
+    method = method,
+    params = params,
+    callback = callback or function() end,
+  }
+  local message = {
     jsonrpc = "2.0",
     method = method,
     params = params,
     id = idx,
-  }) .. "\r\n\r\n"
-  self.socket:write(data)
+  }
+  self:connect()
+  if self.ready then
+    self:_write(message)
+  else
+    table.insert(self.write_queue, message)
+  end
+  return idx
 end
 
----@param params table
----@param on_response res_callback
-function Client:aider_code(params, on_response)
-  self:connect(on_response)
-  self:send("processing", params)
+--- Handle server pushed notifications (messages without id)
+---@param method string
+---@param handler fun(params: table)
+function Client:on_notification(method, handler)
+  self.notification_handlers[method] = handler
+end
+
+--- Called every time a connection becomes ready, before queued requests
+--- are written, e.g. to restore subscriptions after a reconnect
+---@param handler fun()
+function Client:on_ready(handler)
+  table.insert(self.ready_handlers, handler)
+end
+
+---@return boolean
+function Client:is_connection_error(json_obj)
+  return type(json_obj.error) == "table" and json_obj.error.code == CONNECTION_ERROR
 end
 
 function Client:close()
-  self.socket:shutdown()
-  self.socket:close()
+  if self.socket == nil then
+    return
+  end
+  local socket = self.socket
+  self.socket = nil
+  self.ready = false
+  self.pending = {}
+  self.write_queue = {}
+  if not socket:is_closing() then
+    socket:shutdown()
+    socket:close()
+  end
 end
 
 ---@param host string
 ---@param port integer
+---@param opts? {session: integer|nil, path: string|nil}
 ---@return Client
-local function create_client(host, port)
-  local client = { host = host, port = port }
+local function create_client(host, port, opts)
+  local client = {
+    host = host,
+    port = port,
+    path = (opts or {}).path,
+    session = (opts or {}).session,
+    socket = nil,
+    ready = false,
+    framing = FRAMING_DELIMITER,
+    last_id = 1,
+    pending = {},
+    write_queue = {},
+    notification_handlers = {},
+    ready_handlers = {},
+  }
   setmetatable(client, { __index = Client })
   return client
 end
 
+--- Extra aider_server.py args for the configured transport
+---@return string[]
+local function server_args()
+  local transport = (config.options.rpc or {}).transport
+  if transport == "unix" and vim.fn.has("win32") == 0 then
+    return { "--aider-ui-unix-socket" }
+  end
+  return {}
+end
+
+--- The socket path a server prints before its port, nil for other lines
+---@param line string
+---@return string|nil
+local function match_socket_path(line)
+  return line:match("Aider server socket: (%S+)")
+end
+
 return {
   create_client = create_client,
+  server_args = server_args,
+  match_socket_path = match_socket_path,
+  FrameBuffer = FrameBuffer,
+  encode_frame = encode_frame,
 }
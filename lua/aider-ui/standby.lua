@@ -0,0 +1,98 @@
+local config = require("aider-ui.config")
+local rpc = require("aider-ui.rpc")
+local utils = require("aider-ui.utils")
+
+--- Pool of pre-started aider servers, they have already imported aider and
+--- wait for the activate rpc with the session cwd and args
+---@class StandbyServer
+---@field bufnr integer
+---@field job_id integer
+---@field port integer|nil
+---@field socket_path string|nil
+---@field handlers {on_stdout: function|nil, on_exit: function|nil}
+
+local M = {
+  ---@type StandbyServer[]
+  servers = {},
+}
+
+---@param server StandbyServer
+local function remove(server)
+  for i, item in ipairs(M.servers) do
+    if item == server then
+      table.remove(M.servers, i)
+      return
+    end
+  end
+end
+
+local function spawn()
+  ---@type StandbyServer
+  local server = {
+    bufnr = vim.api.nvim_create_buf(false, false),
+    job_id = 0,
+    port = nil,
+    handlers = {},
+  }
+  local cmd = vim.list_extend({
+    config.options.python_path,
+    utils.dir_path .. "aider_server.py",
+    "--aider-ui-standby",
+  }, rpc.server_args())
+  server.job_id = vim.api.nvim_buf_call(server.bufnr, function()
+    return vim.fn.jobstart(cmd, {
+      term = true,
+      on_stdout = function(job_id, data, event)
+        if server.handlers.on_stdout ~= nil then
+          return server.handlers.on_stdout(job_id, data, event)
+        end
+        for _, line in ipairs(data or {}) do
+          server.socket_path = rpc.match_socket_path(line) or server.socket_path
+          local port_match = line:match("Aider server port: (%d+)")
+          if port_match then
+            server.port = tonumber(port_match)
+          end
+        end
+      end,
+      on_exit = function(job_id, code, event)
+        if server.handlers.on_exit ~= nil then
+          return server.handlers.on_exit(job_id, code, event)
+        end
+        remove(server)
+        if vim.api.nvim_buf_is_valid(server.bufnr) then
+          vim.api.nvim_buf_delete(server.bufnr, { force = true })
+        end
+      end,
+    })
+  end)
+  table.insert(M.servers, server)
+end
+
+--- Start standby servers until the pool has `standby_servers` entries
+function M.fill()
+  local size = config.options.standby_servers or 0
+  while #M.servers < size do
+    spawn()
+  end
+end
+
+--- Take a ready standby server out of the pool and start a replacement
+---@return StandbyServer|nil
+function M.take()
+  for i, server in ipairs(M.servers) do
+    if server.port ~= nil then
+      table.remove(M.servers, i)
+      vim.defer_fn(M.fill, 0)
+      return server
+    end
+  end
+  return nil
+end
+
+function M.setup()
+  if not config.options.host_mode and (config.options.standby_servers or 0) > 0 then
+    vim.defer_fn(M.fill, 0)
+  end
+end
+
+return M
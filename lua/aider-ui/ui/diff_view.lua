@@ -55,6 +55,26 @@ local function handle_render_file(bufnr, file, start_lnum, end_lnum)
 end
 
 
+--- Builds a git style unified diff from the precomputed hunks
+---@param file table File diff information
+---@return string[]|nil
+local function get_patch_lines(file)
+  if type(file.hunks) ~= "table" or #file.hunks == 0 then
+    return nil
+  end
+  local path = vim.fn.fnamemodify(file.path, ":.")
+  local lines = {
+    "diff --git a/" .. path .. " b/" .. path,
+    "--- a/" .. path,
+    "+++ b/" .. path,
+  }
+  for _, hunk in ipairs(file.hunks) do
+    table.insert(lines, hunk.header)
+    vim.list_extend(lines, hunk.lines)
+  end
+  return lines
+end
+
 --- Renders a single file's diff content in the popup
 --- If the file is opened and diff lines aren't cached, starts a delta job to generate them
 ---@param bufnr integer Buffer number of the popup
@@ -70,18 +90,24 @@ local function render_file(bufnr, file, start_lnum, end_lnum, winid)
 
       local width = vim.api.nvim_win_get_width(winid or 0)
 
+      local args = {
+        "--paging",
+        "never",
+        "--width",
+        tostring(width),
+        "--line-numbers",
+        "--side-by-side",
+      }
+      -- with server computed hunks delta only renders the patch from stdin
+      local patch = get_patch_lines(file)
+      if patch == nil then
+        args = vim.list_extend({ file.before_path, file.after_path }, args)
+      end
+
       local job = Job:new({
         command = "delta",
-        args = {
-          file.before_path,
-          file.after_path,
-          "--paging",
-          "never",
-          "--width",
-          tostring(width),
-          "--line-numbers",
-          "--side-by-side",
-        },
+        args = args,
+        writer = patch,
         on_stdout = function(_, data)
           table.insert(file.cached_diff_lines, data)
         end,
@@ -251,7 +277,7 @@ local function init_render_diff(popup, diff_files)
 end
 
 --- Displays a diff view for multiple files
----@param diff_files {path: string, before_path: string, after_path: string, opened: boolean}[] Table of file diff information
+---@param diff_files {path: string, before_path: string, after_path: string, hunks: table[]?, opened: boolean}[] Table of file diff information
 function M.diff(diff_files)
   local popup = Popup({
     enter = true,
@@ -5,6 +5,23 @@ local local_doc_dir = ".aider_doc"
 
 local telescope = require("telescope.builtin")
 
+--- paths of the multi-selection (<Tab>), or of the entry under the cursor
+---@return string[]
+local function selected_paths(prompt_bufnr)
+  local action_state = require("telescope.actions.state")
+  local paths = {}
+  for _, entry in ipairs(action_state.get_current_picker(prompt_bufnr):get_multi_selection()) do
+    table.insert(paths, entry.path)
+  end
+  if #paths == 0 then
+    local selection = action_state.get_selected_entry()
+    if selection then
+      table.insert(paths, selection.path)
+    end
+  end
+  return paths
+end
+
 function M.doc_files_finder()
   telescope.find_files({
     prompt_title = "Select a file in " .. local_doc_dir,
@@ -14,9 +31,9 @@ function M.doc_files_finder()
     hidden = true,
     attach_mappings = function(prompt_bufnr, map)
       map("i", "<CR>", function()
-        local selection = require("telescope.actions.state").get_selected_entry()
-        if selection then
-          sessions.current_session():read_files({ selection.path })
+        local paths = selected_paths(prompt_bufnr)
+        if #paths > 0 then
+          sessions.current_session():read_files(paths)
         end
         require("telescope.actions").close(prompt_bufnr)
       end)
@@ -31,9 +48,9 @@ function M.add_files_finder()
     cwd = vim.loop.cwd(),
     attach_mappings = function(prompt_bufnr, map)
       map("i", "<CR>", function()
-        local selection = require("telescope.actions.state").get_selected_entry()
-        if selection then
-          sessions.current_session():add_files({ selection.path })
+        local paths = selected_paths(prompt_bufnr)
+        if #paths > 0 then
+          sessions.current_session():add_files(paths)
         end
         require("telescope.actions").close(prompt_bufnr)
       end)
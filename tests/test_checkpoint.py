@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import pytest
+from backend_server.checkpoint import (
+    CheckpointError,
+    CheckpointState,
+    LogView,
+    load_checkpoint,
+    write_checkpoint,
+)
+from backend_server.history_log import HistoryLog
+from backend_server.output_search import CommandRange
+from backend_server.search_index import TokenIndex
+
+METADATA = {
+    "added": ["/repo/a.py"],
+    "readonly": [],
+    "done_messages": [{"role": "user", "content": "hi"}],
+    "cur_messages": [],
+    "modify_history": [],
+    "command_ranges": [CommandRange(1, "/lint", 0, 2).as_dict()],
+}
+
+
+@pytest.fixture
+def state(tmp_path):
+    output = HistoryLog(str(tmp_path / "output"), memory_lines=2)
+    output.extend([f"output {i}" for i in range(10)])
+    chat = HistoryLog(str(tmp_path / "chat"), memory_lines=2)
+    chat_index = TokenIndex()
+    for i, line in enumerate(["fix the parser", "add tests", "fix the lexer"]):
+        chat.append(line)
+        chat_index.add(i, line)
+    yield CheckpointState(METADATA, LogView.of(output), LogView.of(chat), chat_index)
+    output.close()
+    chat.close()
+
+
+def test_round_trip(tmp_path, state):
+    path = str(tmp_path / "session.ckpt")
+    size = write_checkpoint(path, state)
+    assert size == (tmp_path / "session.ckpt").stat().st_size
+
+    restored = load_checkpoint(path, str(tmp_path))
+    try:
+        assert restored.metadata["added"] == METADATA["added"]
+        assert restored.metadata["done_messages"] == METADATA["done_messages"]
+        assert restored.output_history[:] == [f"output {i}" for i in range(10)]
+        assert restored.chat_history[:] == [
+            "fix the parser",
+            "add tests",
+            "fix the lexer",
+        ]
+        assert restored.chat_index.search("fix", 10) == ([2, 0], None)
+        assert restored.command_ranges.get(1) == CommandRange(1, "/lint", 0, 2)
+    finally:
+        restored.output_history.close()
+        restored.chat_history.close()
+
+
+def test_lines_after_capture_are_not_written(tmp_path, state):
+    with open(state.output.data_path, "ab") as data:
+        data.write(b"late line")
+    path = str(tmp_path / "session.ckpt")
+    write_checkpoint(path, state)
+    restored = load_checkpoint(path, str(tmp_path))
+    try:
+        assert len(restored.output_history) == 10
+    finally:
+        restored.output_history.close()
+        restored.chat_history.close()
+
+
+def test_not_a_checkpoint(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"not a checkpoint at all")
+    with pytest.raises(CheckpointError):
+        load_checkpoint(str(path), str(tmp_path))
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    with pytest.raises(CheckpointError):
+        load_checkpoint(str(path), str(tmp_path))
+
+
+def test_truncated(tmp_path, state):
+    path = tmp_path / "session.ckpt"
+    write_checkpoint(str(path), state)
+    path.write_bytes(path.read_bytes()[:-10])
+    with pytest.raises(CheckpointError):
+        load_checkpoint(str(path), str(tmp_path))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from backend_server.file_ops import (
+    ADD,
+    DROP,
+    READ_ONLY,
+    FileOpLog,
+    apply_file_ops,
+    join_filenames,
+)
+
+
+def test_later_op_replaces_earlier():
+    log = FileOpLog()
+    log.record(ADD, ["a.py", "b.py"])
+    log.record(DROP, ["a.py"])
+    log.record(READ_ONLY, ["c.py"])
+    log.record(ADD, ["c.py"])
+    assert len(log) == 3
+    assert log.drain() == [(DROP, ["a.py"]), (ADD, ["b.py", "c.py"])]
+
+
+def test_drain_empties_log():
+    log = FileOpLog()
+    log.record(ADD, ["a.py"])
+    log.drain()
+    assert len(log) == 0
+    assert log.drain() == []
+
+
+def test_ops_grouped_in_apply_order():
+    log = FileOpLog()
+    log.record(READ_ONLY, ["r.py"])
+    log.record(ADD, ["a.py"])
+    log.record(DROP, ["d.py"])
+    log.record(ADD, ["b.py"])
+    assert log.drain() == [
+        (DROP, ["d.py"]),
+        (ADD, ["a.py", "b.py"]),
+        (READ_ONLY, ["r.py"]),
+    ]
+
+
+def test_filenames_with_spaces_are_quoted():
+    assert join_filenames(["a.py", "my file.py"]) == 'a.py "my file.py"'
+
+
+def test_apply_runs_one_command_per_kind():
+    calls = []
+
+    class Commands:
+        def cmd_add(self, args):
+            calls.append(("add", args))
+
+        def cmd_drop(self, args):
+            calls.append(("drop", args))
+
+        def cmd_read_only(self, args):
+            calls.append(("read_only", args))
+
+    apply_file_ops(Commands(), [(DROP, ["x.py"]), (ADD, ["a.py", "b c.py"])])
+    assert calls == [("drop", "x.py"), ("add", 'a.py "b c.py"')]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+from backend_server.framing import (
+    END_OF_MESSAGE,
+    FRAME_HEADER,
+    FRAMING_DELIMITER,
+    FRAMING_LENGTH,
+    MAX_FRAME_SIZE,
+    FrameError,
+    FrameReader,
+    encode_frame,
+)
+
+PAYLOADS = [b"", b"{}", b'{"id": 1}', b"x" * 100_000]
+
+
+def _wire(framing, payloads, flags=0):
+    return b"".join(
+        b"".join(encode_frame(payload, framing, flags)) for payload in payloads
+    )
+
+
+@pytest.mark.parametrize("framing", [FRAMING_DELIMITER, FRAMING_LENGTH])
+def test_round_trip(framing):
+    payloads = [p for p in PAYLOADS if p or framing == FRAMING_LENGTH]
+    reader = FrameReader(framing)
+    reader.feed(_wire(framing, payloads))
+    assert [payload for _, payload in reader.frames()] == payloads
+    assert len(reader) == 0
+
+
+def test_length_frame_keeps_flags():
+    reader = FrameReader(FRAMING_LENGTH)
+    reader.feed(_wire(FRAMING_LENGTH, [b"abc"], flags=3))
+    assert reader.frames() == [(3, b"abc")]
+
+
+@pytest.mark.parametrize("framing", [FRAMING_DELIMITER, FRAMING_LENGTH])
+@pytest.mark.parametrize("chunk", [1, 3, 7, 4096])
+def test_split_reads(framing, chunk):
+    payloads = [b'{"id": %d}' % i for i in range(50)] + [b"y" * 70_000]
+    wire = _wire(framing, payloads)
+    reader = FrameReader(framing, buffer_size=16)
+    received = []
+    for pos in range(0, len(wire), chunk):
+        data = wire[pos : pos + chunk]
+        # receive in place like the asyncio protocol does
+        buffer = reader.get_buffer(len(data))
+        buffer[: len(data)] = data
+        reader.buffer_updated(len(data))
+        received.extend(payload for _, payload in reader.frames())
+    assert received == payloads
+    assert len(reader) == 0
+
+
+def test_delimiter_split_inside_end_of_message():
+    reader = FrameReader(FRAMING_DELIMITER)
+    reader.feed(b"abc" + END_OF_MESSAGE[:2])
+    assert reader.next_frame() is None
+    reader.feed(END_OF_MESSAGE[2:] + b"def")
+    assert reader.next_frame() == (0, b"abc")
+    assert reader.next_frame() is None
+    assert len(reader) == 3
+
+
+def test_switch_framing_between_frames():
+    reader = FrameReader(FRAMING_DELIMITER)
+    reader.feed(
+        _wire(FRAMING_DELIMITER, [b"negotiate"]) + _wire(FRAMING_LENGTH, [b"next"])
+    )
+    assert reader.next_frame() == (0, b"negotiate")
+    reader.set_framing(FRAMING_LENGTH)
+    assert reader.next_frame() == (0, b"next")
+
+
+def test_oversized_length_frame():
+    reader = FrameReader(FRAMING_LENGTH)
+    reader.feed(FRAME_HEADER.pack(0, MAX_FRAME_SIZE + 1))
+    with pytest.raises(FrameError):
+        reader.next_frame()
+
+
+def test_unsupported_framing():
+    with pytest.raises(FrameError):
+        FrameReader().set_framing("line")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import pytest
+from backend_server.history_log import HistoryLog
+
+LINES = [f"line {i} " + "é" * (i % 5) for i in range(50)]
+
+
+@pytest.fixture
+def history(tmp_path):
+    log = HistoryLog(str(tmp_path / "output"), memory_lines=8)
+    log.extend(LINES)
+    yield log
+    log.close()
+
+
+def test_len_and_iter(history):
+    assert len(history) == len(LINES)
+    assert list(history) == LINES
+
+
+@pytest.mark.parametrize("idx", [0, 1, 20, 41, 42, 49, -1, -8, -9, -50])
+def test_index(history, idx):
+    # memory_lines=8: indexes below 42 are read back from disk
+    assert history[idx] == LINES[idx]
+
+
+@pytest.mark.parametrize("idx", [50, -51])
+def test_index_out_of_range(history, idx):
+    with pytest.raises(IndexError):
+        history[idx]
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        slice(None),
+        slice(0, 5),
+        slice(38, 46),
+        slice(45, None),
+        slice(-3, None),
+        slice(10, 5),
+        slice(0, 100),
+        slice(0, None, 7),
+    ],
+)
+def test_slice(history, key):
+    assert history[key] == LINES[key]
+
+
+def test_iter_range(history):
+    assert list(history.iter_range(5, 47, chunk=4)) == LINES[5:47]
+
+
+def test_append_after_extend(history):
+    history.append("last")
+    assert history[-1] == "last"
+    assert history[-2] == LINES[-1]
+
+
+def test_reopen(tmp_path):
+    log = HistoryLog(str(tmp_path / "chat"), memory_lines=2)
+    log.extend(LINES)
+    log.close()
+    log = HistoryLog(str(tmp_path / "chat"), memory_lines=2)
+    try:
+        assert log[:] == LINES
+    finally:
+        log.close()
+
+
+def test_readable_after_remove_files(history):
+    history.remove_files()
+    assert history[:] == LINES